@@ -0,0 +1,147 @@
+import json
+import logging
+import tempfile
+import datetime
+from django.conf import settings
+from django.utils import timezone
+from django.db import DEFAULT_DB_ALIAS, connection, connections, transaction
+from django.db.models import F, Q
+
+from .models import BacktestUploadJob, BacktestUploadChunk
+from .serializers import BacktestSerializer
+from .services import create_backtest
+
+logger = logging.getLogger()
+
+SPOOL_CHUNK_SIZE = 64 * 1024
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+PAYLOAD_MEMORY_BYTES = 8 * 1024 * 1024
+
+def spool_backtest_upload(stream):
+    """
+    Store a raw backtest upload as database chunks and queue a job for it, in one transaction so workers only see
+    complete payloads. The stream is read SPOOL_CHUNK_SIZE at a time and held at most UPLOAD_CHUNK_BYTES.
+    """
+    with transaction.atomic():
+        job = BacktestUploadJob.objects.create()
+        size, position, pending = 0, 0, bytearray()
+        while stream is not None:
+            chunk = stream.read(SPOOL_CHUNK_SIZE)
+            if chunk:
+                pending += chunk
+                size += len(chunk)
+            if pending and (len(pending) >= UPLOAD_CHUNK_BYTES or not chunk):
+                BacktestUploadChunk.objects.create(job=job, position=position, data=bytes(pending))
+                position += 1
+                pending.clear()
+            if not chunk:
+                break
+        job.payload_size = size
+        job.save(update_fields=['payload_size'])
+    logger.info(f"Spooled backtest upload of {size} bytes in {position} chunks as job {job.id}.")
+    return job
+
+def read_upload_payload(job):
+    """ The job's payload parsed, assembled chunk by chunk in a local temporary file (in memory while small). """
+    with tempfile.SpooledTemporaryFile(max_size=PAYLOAD_MEMORY_BYTES) as payload:
+        for data in job.chunks.order_by('position').values_list('data', flat=True).iterator(chunk_size=1):
+            payload.write(data)
+        payload.seek(0)
+        return json.load(payload)
+
+def claim_backtest_upload_job():
+    """
+    Oldest claimable job, marked running: pending, or running for longer than BACKTEST_UPLOAD_JOB_TIMEOUT, which
+    means its worker died (the timeout has to exceed the longest upload). The conditional update lets several
+    workers poll the same queue. A job claimed more than BACKTEST_UPLOAD_JOB_ATTEMPTS times is failed instead.
+    """
+    now = timezone.now()
+    claimable = Q(status=BacktestUploadJob.PENDING) | Q(
+        status=BacktestUploadJob.RUNNING, started_at__lt=now - datetime.timedelta(seconds=settings.BACKTEST_UPLOAD_JOB_TIMEOUT)
+    )
+    for job_id in BacktestUploadJob.objects.filter(claimable).order_by('id').values_list('id', flat=True)[:10]:
+        claimed = BacktestUploadJob.objects.filter(claimable, id=job_id).update(
+            status=BacktestUploadJob.RUNNING, started_at=now, attempts=F('attempts') + 1
+        )
+        if not claimed:
+            continue
+        job = BacktestUploadJob.objects.get(id=job_id)
+        if job.attempts <= settings.BACKTEST_UPLOAD_JOB_ATTEMPTS:
+            if job.attempts > 1:
+                logger.warning(f"Reclaimed backtest upload job {job.id}, attempt {job.attempts}.")
+            return job
+        logger.error(f"Backtest upload job {job.id} failed after {job.attempts - 1} attempts.")
+        job.status = BacktestUploadJob.FAILED
+        job.error = {'error': f"Gave up after {job.attempts - 1} attempts, the worker stopped each time."}
+        job.finished_at = now
+        job.save(update_fields=['status', 'error', 'finished_at'])
+        job.chunks.all().delete()
+    return None
+
+class ProgressReporter:
+    """
+    Collects rows written per table for a job.
+
+    Counts are written through a separate autocommit connection so the status endpoint can see them while
+    the backtest transaction is still open. SQLite allows a single writer, so there they are saved with the
+    final job status only.
+    """
+    def __init__(self, job):
+        self.job = job
+        self.progress = {}
+        self.connection = None
+        if connection.vendor != 'sqlite':
+            self.connection = connections.create_connection(DEFAULT_DB_ALIAS)
+
+    def __call__(self, table, rows):
+        self.progress[table] = rows
+        if self.connection is not None:
+            with self.connection.cursor() as cursor:
+                cursor.execute(
+                    f"UPDATE {BacktestUploadJob._meta.db_table} SET progress = %s WHERE id = %s",
+                    [json.dumps(self.progress), self.job.id],
+                )
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+
+def run_backtest_upload_job(job):
+    """ Validate and persist a claimed job's payload, then record the outcome and delete its BacktestUploadChunk rows. """
+    logger.info(f"Processing backtest upload job {job.id}.")
+    reporter = ProgressReporter(job)
+    try:
+        payload = read_upload_payload(job)
+        serializer = BacktestSerializer(data=payload)
+        if serializer.is_valid():
+            backtest = create_backtest(serializer.validated_data, progress=reporter)
+            job.backtest = backtest
+            job.status = BacktestUploadJob.SUCCEEDED
+            logger.info(f"Backtest upload job {job.id} created backtest {backtest.id}.")
+        else:
+            job.error = serializer.errors
+            job.status = BacktestUploadJob.FAILED
+            logger.error(f"Backtest upload job {job.id} failed validation: {serializer.errors}")
+    except Exception as e:
+        logger.exception(f"Backtest upload job {job.id} failed: {e}")
+        job.error = {'error': str(e)}
+        job.status = BacktestUploadJob.FAILED
+    finally:
+        reporter.close()
+
+    job.progress = reporter.progress
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'backtest', 'error', 'progress', 'finished_at'])
+    job.chunks.all().delete()
+    return job
+
+def process_backtest_upload_jobs(limit=None):
+    """ Run pending jobs until the queue is empty or limit jobs ran. Returns the number processed. """
+    processed = 0
+    while limit is None or processed < limit:
+        job = claim_backtest_upload_job()
+        if job is None:
+            break
+        run_backtest_upload_job(job)
+        processed += 1
+    return processed
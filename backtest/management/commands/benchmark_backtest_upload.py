@@ -0,0 +1,109 @@
+import time
+from django.db import transaction
+from django.core.management.base import BaseCommand
+
+from backtest.serializers import BacktestSerializer
+from backtest.services import create_backtest, BULK_CREATE_BATCH_SIZE
+
+MINUTE = 60
+
+class Rollback(Exception):
+    pass
+
+def synthetic_backtest(rows, start=1704067200):
+    """
+    Backtest payload in the API shape with about rows child rows: 55% period stats, 5% daily stats,
+    10% trades and 10% signals with two trade instructions each.
+    """
+    def stats(count, step):
+        return [
+            {
+                "timestamp": start + i * step,
+                "equity_value": 100000.0 + i % 1000,
+                "percent_drawdown": -0.0125,
+                "cumulative_return": 0.0231,
+                "period_return": 0.0001,
+            }
+            for i in range(count)
+        ]
+
+    trades = [
+        {
+            "trade_id": i // 2,
+            "leg_id": i % 2,
+            "timestamp": start + i * MINUTE,
+            "ticker": "AAPL" if i % 2 else "MSFT",
+            "quantity": 10,
+            "avg_price": 130.74,
+            "trade_value": -1307.4,
+            "action": "BUY" if i % 2 else "SELL",
+            "fees": 0.7,
+        }
+        for i in range(rows // 10)
+    ]
+    signals = [
+        {
+            "timestamp": start + i * MINUTE,
+            "trade_instructions": [
+                {"ticker": "AAPL", "action": "BUY", "trade_id": i, "leg_id": 1, "weight": 0.05},
+                {"ticker": "MSFT", "action": "SELL", "trade_id": i, "leg_id": 2, "weight": 0.05},
+            ],
+        }
+        for i in range(rows // 10)
+    ]
+    return {
+        "parameters": {
+            "strategy_name": "benchmark",
+            "capital": 100000,
+            "data_type": "BAR",
+            "train_start": start,
+            "train_end": start + rows * MINUTE,
+            "test_start": start,
+            "test_end": start + rows * MINUTE,
+            "tickers": ["AAPL", "MSFT"],
+            "benchmark": ["^GSPC"],
+        },
+        "static_stats": [{"net_profit": 330.0, "total_trades": len(trades)}],
+        "period_timeseries_stats": stats(rows * 55 // 100, MINUTE),
+        "daily_timeseries_stats": stats(rows * 5 // 100, 86400),
+        "trades": trades,
+        "signals": signals,
+    }
+
+class Command(BaseCommand):
+    help = "Benchmark persisting a synthetic backtest upload. All writes are rolled back."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000)
+        parser.add_argument('--serializer', action='store_true', help="Include BacktestSerializer validation, as the API does")
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+        payload = synthetic_backtest(rows)
+        try:
+            with transaction.atomic():
+                started = time.perf_counter()
+                if options['serializer']:
+                    serializer = BacktestSerializer(data=payload)
+                    serializer.is_valid(raise_exception=True)
+                    validated = time.perf_counter()
+                    self.stdout.write(f"validation  {validated - started:8.2f}s")
+                    backtest = serializer.save()
+                else:
+                    backtest = create_backtest(payload)
+                elapsed = time.perf_counter() - started
+
+                written = {
+                    'period_timeseries_stats': backtest.period_timeseries_stats.count(),
+                    'daily_timeseries_stats': backtest.daily_timeseries_stats.count(),
+                    'trades': backtest.trades.count(),
+                    'signals': backtest.signals.count(),
+                }
+                raise Rollback()
+        except Rollback:
+            pass
+
+        total = sum(written.values()) + 2 * written['signals']
+        for table, count in written.items():
+            self.stdout.write(f"{table:<25} {count:>10,}")
+        self.stdout.write(f"total       {total:>10,} rows  {elapsed:8.2f}s  {total / elapsed:>12,.0f} rows/s  batch={BULK_CREATE_BATCH_SIZE}")
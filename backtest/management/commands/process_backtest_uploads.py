@@ -0,0 +1,22 @@
+import time
+from django.db import close_old_connections
+from django.core.management.base import BaseCommand
+
+from backtest.jobs import process_backtest_upload_jobs
+
+class Command(BaseCommand):
+    help = "Worker for asynchronous backtest uploads: polls the job table and persists queued payloads."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Drain the pending jobs and exit")
+        parser.add_argument('--poll-interval', type=float, default=2.0, help="Seconds to wait when the queue is empty")
+
+    def handle(self, *args, **options):
+        while True:
+            close_old_connections()
+            processed = process_backtest_upload_jobs()
+            if processed:
+                self.stdout.write(f"Processed {processed} backtest upload jobs.")
+            if options['once']:
+                break
+            time.sleep(options['poll_interval'])
@@ -0,0 +1,29 @@
+# Generated by Django 5.0 on 2026-10-18 11:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backtest', '0003_alter_trade_trade_value'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BacktestUploadJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('succeeded', 'Succeeded'), ('failed', 'Failed')], db_index=True, default='pending', max_length=10)),
+                ('payload_path', models.CharField(max_length=500)),
+                ('payload_size', models.BigIntegerField(default=0)),
+                ('progress', models.JSONField(default=dict)),
+                ('error', models.JSONField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('backtest', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='upload_jobs', to='backtest.backtest')),
+            ],
+        ),
+    ]
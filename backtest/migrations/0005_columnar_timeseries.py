@@ -0,0 +1,40 @@
+# Generated by Django 5.0 on 2026-10-18 12:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backtest', '0004_backtestuploadjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='backtest',
+            name='timeseries_chunk_span',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='backtest',
+            name='timeseries_storage',
+            field=models.CharField(choices=[('rows', 'Rows'), ('columnar', 'Columnar')], default='rows', max_length=10),
+        ),
+        migrations.CreateModel(
+            name='TimeseriesBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=10)),
+                ('start_timestamp', models.BigIntegerField()),
+                ('end_timestamp', models.BigIntegerField()),
+                ('row_count', models.IntegerField()),
+                ('data', models.BinaryField()),
+                ('backtest', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeseries_blobs', to='backtest.backtest')),
+            ],
+            options={
+                'ordering': ['start_timestamp'],
+                'unique_together': {('backtest', 'kind', 'start_timestamp')},
+            },
+        ),
+    ]
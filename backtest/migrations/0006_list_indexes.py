@@ -0,0 +1,55 @@
+# Generated by Django 5.0 on 2026-10-18 12:17
+
+from django.db import migrations, models
+
+
+def create_tickers_index(apps, schema_editor):
+    """ GIN index serving the tickers @> containment filter; PostgreSQL only, elsewhere the filter scans. """
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute("CREATE INDEX IF NOT EXISTS backtest_tickers_gin ON backtest_backtest USING GIN (tickers jsonb_path_ops)")
+
+def drop_tickers_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute("DROP INDEX IF EXISTS backtest_tickers_gin")
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backtest', '0005_columnar_timeseries'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='backtest',
+            index=models.Index(fields=['strategy_name', 'id'], name='backtest_strategy_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='backtest',
+            index=models.Index(fields=['created_at', 'id'], name='backtest_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='backtest',
+            index=models.Index(fields=['test_start', 'test_end'], name='backtest_test_window_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='staticstats',
+            index=models.Index(fields=['sharpe_ratio', 'backtest'], name='static_stats_sharpe_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='staticstats',
+            index=models.Index(fields=['sortino_ratio', 'backtest'], name='static_stats_sortino_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='staticstats',
+            index=models.Index(fields=['total_return', 'backtest'], name='static_stats_return_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='staticstats',
+            index=models.Index(fields=['net_profit', 'backtest'], name='static_stats_profit_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='staticstats',
+            index=models.Index(fields=['max_drawdown_percentage', 'backtest'], name='static_stats_drawdown_idx'),
+        ),
+        migrations.RunPython(create_tickers_index, drop_tickers_index),
+    ]
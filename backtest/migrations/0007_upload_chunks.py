@@ -0,0 +1,35 @@
+# Generated by Django 5.0 on 2026-10-18 12:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backtest', '0006_list_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='backtestuploadjob',
+            name='payload_path',
+        ),
+        migrations.AddField(
+            model_name='backtestuploadjob',
+            name='attempts',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='BacktestUploadChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.IntegerField()),
+                ('data', models.BinaryField()),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='backtest.backtestuploadjob')),
+            ],
+            options={
+                'unique_together': {('job', 'position')},
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.0 on 2026-10-18 13:01
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backtest', '0007_upload_chunks'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='staticstats',
+            name='static_stats_sharpe_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='staticstats',
+            name='static_stats_sortino_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='staticstats',
+            name='static_stats_return_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='staticstats',
+            name='static_stats_profit_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='staticstats',
+            name='static_stats_drawdown_idx',
+        ),
+    ]
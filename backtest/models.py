@@ -15,6 +15,15 @@ class Backtest(models.Model):
     capital = models.FloatField(null=True, blank=True)
     strategy_allocation = models.FloatField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    timeseries_storage = models.CharField(max_length=10, choices=[('rows', 'Rows'), ('columnar', 'Columnar')], default='rows')
+    timeseries_chunk_span = models.BigIntegerField(null=True, blank=True) # columnar chunk length in timestamp units; one chunk when empty
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['strategy_name', 'id'], name='backtest_strategy_idx'),
+            models.Index(fields=['created_at', 'id'], name='backtest_created_idx'),
+            models.Index(fields=['test_start', 'test_end'], name='backtest_test_window_idx'),
+        ]
 
 class Trade(models.Model):
     backtest = models.ForeignKey(Backtest, related_name='trades', on_delete=models.CASCADE)
@@ -75,3 +84,43 @@ class DailyTimeseriesStats(models.Model):
     period_return = models.DecimalField(max_digits=15, decimal_places=6, default=0.0)
     cumulative_return = models.DecimalField(max_digits=15, decimal_places=6, default=0.0)
     percent_drawdown = models.DecimalField(max_digits=15, decimal_places=6, default=0.0)
+
+class TimeseriesBlob(models.Model):
+    """ One chunk of a columnar-stored timeseries (see backtest.timeseries for the encoding). """
+    backtest = models.ForeignKey(Backtest, related_name='timeseries_blobs', on_delete=models.CASCADE)
+    kind = models.CharField(max_length=10) # 'period' or 'daily'
+    start_timestamp = models.BigIntegerField()
+    end_timestamp = models.BigIntegerField()
+    row_count = models.IntegerField()
+    data = models.BinaryField()
+
+    class Meta:
+        unique_together = ('backtest', 'kind', 'start_timestamp')
+        ordering = ['start_timestamp']
+
+class BacktestUploadJob(models.Model):
+    PENDING = 'pending'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(PENDING, 'Pending'), (RUNNING, 'Running'), (SUCCEEDED, 'Succeeded'), (FAILED, 'Failed')]
+
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING, db_index=True)
+    payload_size = models.BigIntegerField(default=0)
+    attempts = models.IntegerField(default=0) # claims so far, a running job is reclaimed when its worker died
+    progress = models.JSONField(default=dict) # rows written per table
+    backtest = models.ForeignKey(Backtest, related_name='upload_jobs', null=True, blank=True, on_delete=models.SET_NULL)
+    error = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+class BacktestUploadChunk(models.Model):
+    """ A piece of a queued upload's raw payload, kept in the database so any worker process can read it. """
+    job = models.ForeignKey(BacktestUploadJob, related_name='chunks', on_delete=models.CASCADE)
+    position = models.IntegerField()
+    data = models.BinaryField()
+
+    class Meta:
+        unique_together = ('job', 'position')
+
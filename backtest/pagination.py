@@ -0,0 +1,36 @@
+import numpy as np
+from market_data.pagination import KeysetPagination
+
+class SectionPagination(KeysetPagination):
+    """ Keyset pages over one section of a backtest (trades, signals, timeseries) in insertion order. """
+    ordering = ('id',)
+
+class PriceDataPagination(KeysetPagination):
+    """ Keyset pages over the bars of a backtest's test range. """
+    ordering = ('timestamp', 'symbol_id')
+
+class BacktestListPagination(KeysetPagination):
+    """ Optional keyset pages over the backtest list in the ordering filter_backtests picked for the request. """
+    optional = True
+    page_size = 100
+
+    def get_ordering(self, request, queryset, view):
+        return getattr(view, 'list_ordering', self.ordering)
+
+class SeriesPagination(KeysetPagination):
+    """ Keyset pages over a decoded columnar series; the cursor is the last timestamp of the page. """
+    ordering = ('timestamp',)
+
+    def paginate_series(self, series, request):
+        """ Slice of every column of series for the requested page. """
+        self.request = request
+        self.current_ordering = self.ordering
+        page_size = self.get_page_size(request)
+        timestamps = series['timestamp']
+
+        position = self.decode_cursor(request)
+        begin = int(np.searchsorted(timestamps, position[0], side='right')) if position is not None else 0
+        stop = begin + page_size
+        self.has_next = stop < len(timestamps)
+        self.next_position = [int(timestamps[stop - 1])] if self.has_next else None
+        return {name: values[begin:stop] for name, values in series.items()}
@@ -4,10 +4,29 @@ from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 
 from .services import create_backtest, get_price_data, get_regression_data
-from .models import Backtest, StaticStats, Trade, Signal, TradeInstruction, PeriodTimeseriesStats, DailyTimeseriesStats
+from .timeseries import load_timeseries, series_rows, downsample_series, DOWNSAMPLE_METHODS, MIN_MAX_POINTS
+from .models import Backtest, BacktestUploadJob, StaticStats, Trade, Signal, TradeInstruction, PeriodTimeseriesStats, DailyTimeseriesStats
 
 logger = logging.getLogger()
 
+def sparse_fields(request):
+    """ Field names requested with ?fields= on a read (always including id), or None for all fields. """
+    if request is None or request.method != 'GET' or not request.query_params.get('fields'):
+        return None
+    return {'id', *(name.strip() for name in request.query_params['fields'].split(','))}
+
+def downsample_params(request):
+    """ (max_points, method) from ?max_points=&downsample= on a read, max_points None when not requested. Raises ValueError when invalid. """
+    if request is None or request.method != 'GET' or not request.query_params.get('max_points'):
+        return None, None
+    max_points = int(request.query_params['max_points'])
+    method = request.query_params.get('downsample', 'lttb')
+    if max_points < MIN_MAX_POINTS:
+        raise ValueError(f"max_points must be at least {MIN_MAX_POINTS}")
+    if method not in DOWNSAMPLE_METHODS:
+        raise ValueError(f"downsample must be one of {', '.join(DOWNSAMPLE_METHODS)}")
+    return max_points, method
+
 class StaticStatsSerializer(serializers.ModelSerializer):
     class Meta:
         model = StaticStats
@@ -66,13 +85,20 @@ class SignalSerializer(serializers.ModelSerializer):
 class BacktestListSerializer(serializers.ModelSerializer):
     class Meta:
         model = Backtest
-        fields = ['id', 'strategy_name', 'tickers', 'benchmark', 'data_type', 'train_start', 'train_end', 'test_start', 'test_end', 'capital', 'created_at']
+        fields = ['id', 'strategy_name', 'tickers', 'benchmark', 'data_type', 'train_start', 'train_end', 'test_start', 'test_end', 'capital', 'created_at',
+                  'timeseries_storage', 'timeseries_chunk_span']
+
+class BacktestUploadJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = BacktestUploadJob
+        fields = ['id', 'status', 'progress', 'backtest', 'error', 'payload_size', 'created_at', 'started_at', 'finished_at']
+        read_only_fields = fields
 
 class BacktestSerializer(serializers.ModelSerializer):
     parameters = BacktestListSerializer(write_only=True)
     period_timeseries_stats = PeriodTimeseriesStatsSerializer(many=True)
-    daily_timeseries_stats = DailyTimeseriesStatsSerializer(many=True)
-    static_stats = StaticStatsSerializer(many=True)
+    daily_timeseries_stats = DailyTimeseriesStatsSerializer(many=True, required=False) # computed from the period equity when omitted
+    static_stats = StaticStatsSerializer(many=True, required=False) # computed from the period equity and trades when omitted
     trades = TradeSerializer(many=True)
     signals = SignalSerializer(many=True)
     price_data = serializers.SerializerMethodField()
@@ -81,9 +107,22 @@ class BacktestSerializer(serializers.ModelSerializer):
     class Meta:
         model = Backtest
         fields = ['id', 'parameters', 'static_stats', 'regression_stats', 'trades', 'daily_timeseries_stats', 'period_timeseries_stats', 'signals', 'price_data']
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Sparse fieldsets on reads: ?fields=static_stats,trades keeps only those sections (plus id), so the others are never queried
+        requested = sparse_fields(self.context.get('request'))
+        if requested is not None:
+            for name in set(self.fields) - requested:
+                self.fields.pop(name)
+        # ?max_points= renders the timeseries sections downsampled from their arrays instead of through the nested serializers
+        self.max_points, self.downsample = downsample_params(self.context.get('request'))
+        self.downsampled_kinds = []
+        if self.max_points:
+            self.downsampled_kinds = [kind for kind in ('period', 'daily') if self.fields.pop(f'{kind}_timeseries_stats', None) is not None]
         
     def validate(self, data):
-        logger.info(f"Validating data : {data}")
+        logger.info(f"Validating backtest data with sections: {', '.join(data)}")
         try:
             validated_data = super().validate(data)
             logger.info(f"Validating successful.")
@@ -94,7 +133,7 @@ class BacktestSerializer(serializers.ModelSerializer):
     
     # POST
     def create(self, validated_data):
-        logger.info("Creating a new Backtest instance with data: %s", validated_data)
+        logger.info("Creating a new Backtest instance with %s", {key: len(value) for key, value in validated_data.items() if isinstance(value, list)})
         try:
             backtest_instance = create_backtest(validated_data)
             logger.info(f"Successfully created Backtest instance with ID: {backtest_instance.id}")
@@ -127,20 +166,28 @@ class BacktestSerializer(serializers.ModelSerializer):
         logger.info(f"Retrieving a Backtest instance with ID: {instance.id}")
         try:
             data = super().to_representation(instance)
-            data['parameters']  = {
-                "strategy_name": instance.strategy_name,
-                "tickers": instance.tickers,
-                "benchmark": instance.benchmark,
-                "data_type": instance.data_type,
-                "train_start": instance.train_start,
-                "train_end": instance.train_end,
-                "test_start": instance.test_start,
-                "test_end": instance.test_end,
-                "capital": instance.capital,
-                "created_at": instance.created_at #.isoformat(),
-            }
-            data['price_data'] = self.get_price_data(instance)
-            data['regression_stats'] = self.get_regression_stats(instance)
+            if 'parameters' in self.fields:
+                data['parameters']  = {
+                    "strategy_name": instance.strategy_name,
+                    "tickers": instance.tickers,
+                    "benchmark": instance.benchmark,
+                    "data_type": instance.data_type,
+                    "train_start": instance.train_start,
+                    "train_end": instance.train_end,
+                    "test_start": instance.test_start,
+                    "test_end": instance.test_end,
+                    "capital": instance.capital,
+                    "created_at": instance.created_at, #.isoformat(),
+                    "timeseries_storage": instance.timeseries_storage,
+                    "timeseries_chunk_span": instance.timeseries_chunk_span,
+                }
+            if instance.timeseries_storage == 'columnar':
+                for kind in ('period', 'daily'):
+                    if f'{kind}_timeseries_stats' in self.fields:
+                        data[f'{kind}_timeseries_stats'] = series_rows(kind, load_timeseries(instance, kind))
+            for kind in self.downsampled_kinds:
+                series = downsample_series(load_timeseries(instance, kind), self.max_points, self.downsample)
+                data[f'{kind}_timeseries_stats'] = series_rows(kind, series)
             logger.info(f"Successfully retrieved Backtest instance with ID: {instance.id}")
             return data
         except Exception as e:
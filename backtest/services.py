@@ -1,18 +1,77 @@
+import json
 import logging
-from django.db import transaction
+import datetime
+from functools import partial
+from django.db import connection, models, transaction
+from django.db.models import F, OuterRef, Prefetch, Subquery
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 from django.core.exceptions import ValidationError
 
-from symbols.models import Symbol
-from market_data.models import BarData
-from market_data.serializers import BarDataSerializer
+from market_data.services import cached_price_data
+from market_data.pagination import order_expressions
 from regression_analysis.models import RegressionAnalysis
 from regression_analysis.serializers import RegressionAnalysisSerializer
-from .models import Backtest, StaticStats, Trade, Signal, TradeInstruction, PeriodTimeseriesStats, DailyTimeseriesStats
+from .timeseries import store_timeseries, load_timeseries, series_arrays, align_series, nullable_list, TIMESERIES_VALUES
+from .statistics import compute_statistics, trade_arrays, series_dicts
+from .models import Backtest, StaticStats, Trade, Signal, TradeInstruction, PeriodTimeseriesStats, DailyTimeseriesStats, TimeseriesBlob
 
 logger = logging.getLogger()
 
+BULK_CREATE_BATCH_SIZE = 5000
+
+def bulk_create_rows(model, rows, batch_size=BULK_CREATE_BATCH_SIZE, progress=None, **fields):
+    """
+    Insert rows (dicts of field values, each combined with fields) in chunks of batch_size, building one chunk
+    of instances at a time. progress, if given, is called with the running row count after every chunk.
+    """
+    for offset in range(0, len(rows), batch_size):
+        objs = [model(**fields, **row) for row in rows[offset:offset + batch_size]]
+        model.objects.bulk_create(objs, batch_size=batch_size)
+        if progress:
+            progress(offset + len(objs))
+    return len(rows)
+
+def bulk_create_signals(backtest, signals_data, batch_size=BULK_CREATE_BATCH_SIZE, progress=None):
+    """
+    Insert signals in chunks and link their trade instructions through the primary keys the signal insert returns.
+    Backends that cannot return them from a bulk insert save that chunk's signals one by one instead.
+    progress, if given, is called with the running (signals, trade instructions) counts after every chunk.
+    """
+    instructions = 0
+    for offset in range(0, len(signals_data), batch_size):
+        chunk = signals_data[offset:offset + batch_size]
+        signals = [Signal(backtest=backtest, **{key: value for key, value in data.items() if key != 'trade_instructions'}) for data in chunk]
+        if connection.features.can_return_rows_from_bulk_insert:
+            Signal.objects.bulk_create(signals, batch_size=batch_size)
+        else:
+            for signal in signals:
+                signal.save()
+
+        trade_instructions = [
+            TradeInstruction(signal=signal, **ti_data)
+            for signal, data in zip(signals, chunk)
+            for ti_data in data.get('trade_instructions', [])
+        ]
+        TradeInstruction.objects.bulk_create(trade_instructions, batch_size=batch_size)
+        instructions += len(trade_instructions)
+        if progress:
+            progress(offset + len(signals), instructions)
+    return len(signals_data), instructions
+
+
+def create_backtest(validated_data, progress=None):
+    """
+    Persist a validated backtest and its nested rows in one transaction.
+    progress, if given, is called as progress(table, rows written so far) while the child tables are written.
+    """
+    def report(table):
+        return partial(progress, table) if progress else None
+
+    def report_signals(signals, instructions):
+        progress('signals', signals)
+        progress('trade_instructions', instructions)
 
-def create_backtest(validated_data):
     try:
         with transaction.atomic():
             logger.info("Starting backtest creation process.")
@@ -30,9 +89,20 @@ def create_backtest(validated_data):
             backtest = Backtest.objects.create(**parameters)
             logger.info(f"Backtest instance created with ID: {backtest.id}")
 
+            # Statistics left out of the upload are computed from the period equity and the trades
+            derived = set(TIMESERIES_VALUES) - {'equity_value'}
+            missing_period = any(not derived <= row.keys() for row in period_timeseries_stats_data)
+            if period_timeseries_stats_data and (not static_stats_data or not daily_timeseries_stats_data or missing_period):
+                timestamps, values = series_arrays(period_timeseries_stats_data)
+                statistics = compute_statistics(backtest.capital, timestamps, values[TIMESERIES_VALUES.index('equity_value')], trade_arrays(trades_data))
+                static_stats_data = static_stats_data or [statistics['static']]
+                daily_timeseries_stats_data = daily_timeseries_stats_data or series_dicts(statistics['daily'])
+                if missing_period:
+                    period_timeseries_stats_data = series_dicts(statistics['period'])
+                logger.info("Computed the statistics missing from the upload.")
+
             # Nested object creation for SummaryStats
-            for stat_data in static_stats_data:
-                StaticStats.objects.create(backtest=backtest, **stat_data)
+            bulk_create_rows(StaticStats, static_stats_data, progress=report('static_stats'), backtest=backtest)
             logger.info("Static stats created.")
             
             # Nested object creation for RegressionAnalysis
@@ -40,27 +110,27 @@ def create_backtest(validated_data):
             #     RegressionAnalysis.objects.create(backtest=backtest, **stat_data)
             # logger.info("Regression stats created.")
 
-            # Nested object creation for TimeseriesStats
-            for data in period_timeseries_stats_data:
-                PeriodTimeseriesStats.objects.create(backtest=backtest, **data)
-            logger.info("Period timeseries stats created.")
+            # Nested object creation for TimeseriesStats, as rows or as compressed columnar chunks
+            if backtest.timeseries_storage == 'columnar':
+                for kind, rows in (('period', period_timeseries_stats_data), ('daily', daily_timeseries_stats_data)):
+                    count = store_timeseries(backtest, kind, rows, backtest.timeseries_chunk_span)
+                    if progress:
+                        progress(f'{kind}_timeseries_stats', count)
+                    logger.info(f"{count} {kind} timeseries stats stored as columnar chunks.")
+            else:
+                count = bulk_create_rows(PeriodTimeseriesStats, period_timeseries_stats_data, progress=report('period_timeseries_stats'), backtest=backtest)
+                logger.info(f"{count} period timeseries stats created.")
 
-            for data in daily_timeseries_stats_data:
-                DailyTimeseriesStats.objects.create(backtest=backtest, **data)
-            logger.info("Daily timeseries stats created.")
+                count = bulk_create_rows(DailyTimeseriesStats, daily_timeseries_stats_data, progress=report('daily_timeseries_stats'), backtest=backtest)
+                logger.info(f"{count} daily timeseries stats created.")
 
             # Nested object creation for Trades
-            for trade_data in trades_data:
-                Trade.objects.create(backtest=backtest, **trade_data)
-            logger.info("Trades created.")
+            count = bulk_create_rows(Trade, trades_data, progress=report('trades'), backtest=backtest)
+            logger.info(f"{count} trades created.")
 
             # Nested object creation for Signals and their TradeInstructions
-            for signal_data in signals_data:
-                trade_instructions_data = signal_data.pop('trade_instructions', [])
-                signal_instance = Signal.objects.create(backtest=backtest, **signal_data)
-                for ti_data in trade_instructions_data:
-                    TradeInstruction.objects.create(signal=signal_instance, **ti_data)
-            logger.info("Signals and trade instructions created.")
+            signals, instructions = bulk_create_signals(backtest, signals_data, progress=report_signals if progress else None)
+            logger.info(f"{signals} signals and {instructions} trade instructions created.")
 
             return backtest
 
@@ -73,42 +143,132 @@ def create_backtest(validated_data):
         # Re-raise or handle the error as appropriate
         raise e
     
-def fetch_price_data(backtest_instance):
+def recompute_statistics(backtest):
+    """ Replace a backtest's StaticStats and daily series with ones computed from its stored period equity and trades. """
+    period = load_timeseries(backtest, 'period')
+    trades = trade_arrays(list(Trade.objects.filter(backtest=backtest).values('trade_id', 'ticker', 'quantity', 'trade_value', 'fees')))
+    statistics = compute_statistics(backtest.capital, period['timestamp'], period['equity_value'], trades)
+
+    with transaction.atomic():
+        StaticStats.objects.filter(backtest=backtest).delete()
+        static_stats = StaticStats.objects.create(backtest=backtest, **statistics['static'])
+        daily = series_dicts(statistics['daily'])
+        if backtest.timeseries_storage == 'columnar':
+            TimeseriesBlob.objects.filter(backtest=backtest, kind='daily').delete()
+            store_timeseries(backtest, 'daily', daily, backtest.timeseries_chunk_span)
+        else:
+            DailyTimeseriesStats.objects.filter(backtest=backtest).delete()
+            bulk_create_rows(DailyTimeseriesStats, daily, backtest=backtest)
+    logger.info(f"Recomputed statistics of Backtest {backtest.id} over {len(period['timestamp'])} periods and {len(daily)} days.")
+    return static_stats, len(daily)
+
+def compare_backtests(backtests, kind='daily', columns=('equity_value', 'cumulative_return'), how='union'):
+    """
+    Static stats of backtests side by side ({stat: [value per backtest]}) and their kind series aligned on one
+    timestamp index as columns ({column: [[values of a backtest] per backtest]}), in the order of backtests.
+    """
+    ids = [backtest.id for backtest in backtests]
+    stats = {}
+    for row in StaticStats.objects.filter(backtest_id__in=ids).order_by('id').values():
+        stats.setdefault(row['backtest_id'], row) # the first row, as the list ordering and serializer use
+    stat_names = [field.name for field in StaticStats._meta.fields if field.name not in ('id', 'backtest')]
+
+    index, aligned = align_series([load_timeseries(backtest, kind) for backtest in backtests], columns, how)
+    logger.info(f"Compared {len(ids)} backtests over {len(index)} aligned {kind} timestamps.")
+    return {
+        'ids': ids,
+        'strategy_names': [backtest.strategy_name for backtest in backtests],
+        'static_stats': {name: [stats.get(id, {}).get(name) for id in ids] for name in stat_names},
+        'kind': kind,
+        'timestamp': index.tolist(),
+        'series': {column: [nullable_list(values) for values in aligned[column]] for column in columns},
+    }
+
+BACKTEST_ORDERING_FIELDS = ('id', 'created_at', 'strategy_name', 'capital', 'test_start', 'test_end')
+STATIC_STATS_METRICS = tuple(field.name for field in StaticStats._meta.fields if isinstance(field, (models.FloatField, models.IntegerField)) and not field.primary_key)
+
+def _datetime_param(value, name):
+    parsed = parse_datetime(value)
+    if parsed is None:
+        date = parse_date(value)
+        if date is None:
+            raise ValueError(f"{name} must be an ISO date or datetime")
+        parsed = datetime.datetime.combine(date, datetime.time.min)
+    return timezone.make_aware(parsed) if timezone.is_naive(parsed) else parsed
+
+def filter_backtests(queryset, params):
+    """
+    Apply the list filters in params and return (queryset, ordering), ordering ending on id so it is unique:
+        strategy_name, ticker (contained in tickers), created_after/created_before (ISO date or datetime),
+        test_start/test_end (backtests whose test window overlaps it) and ordering, a Backtest field or a
+        StaticStats metric such as -sharpe_ratio (the first StaticStats row of each backtest). Ordering on a metric
+        leaves out backtests without it; on a nullable field, backtests without a value come last either way.
+        A metric ordering looks the metric up per matching backtest (through the StaticStats backtest_id index) and
+        sorts the results, so its cost grows with the number of backtests the filters keep.
+    Raises ValueError on invalid parameters.
+    """
+    if params.get('strategy_name'):
+        queryset = queryset.filter(strategy_name=params['strategy_name'])
+    if params.get('ticker'):
+        if connection.features.supports_json_field_contains:
+            queryset = queryset.filter(tickers__contains=[params['ticker']])
+        else:
+            queryset = queryset.filter(tickers__icontains=json.dumps(params['ticker']))
+    if params.get('created_after'):
+        queryset = queryset.filter(created_at__gte=_datetime_param(params['created_after'], 'created_after'))
+    if params.get('created_before'):
+        queryset = queryset.filter(created_at__lte=_datetime_param(params['created_before'], 'created_before'))
     try:
-        logger.info("Starting to fetch price data for tickers: %s", backtest_instance.tickers)
-        ticker_list = backtest_instance.tickers
-        
-        # Fetching Symbol objects for each ticker
-        symbol_objs = Symbol.objects.filter(ticker__in=ticker_list)
-        if not symbol_objs.exists():
-            logger.error(f"No Symbol objects found for tickers: {ticker_list}")
-            return []
-        
-        # Filter BarData based on Symbol objects and the date range
-        price_data = BarData.objects.filter(
-            symbol__in=symbol_objs,
-            timestamp__gte=backtest_instance.test_start,
-            timestamp__lte=backtest_instance.test_end
-        ).order_by('timestamp')
-        
-        logger.info(f"Fetched {price_data.count()} price data records for backtest {backtest_instance.id}.")
-        return price_data
-    except Exception as e:
-        logger.exception(f"Failed to fetch price data for backtest {backtest_instance.id}: {str(e)}")
-        return []
-    
+        if params.get('test_start'):
+            queryset = queryset.filter(test_end__gte=int(params['test_start']))
+        if params.get('test_end'):
+            queryset = queryset.filter(test_start__lte=int(params['test_end']))
+    except ValueError:
+        raise ValueError("test_start and test_end must be integer timestamps")
+
+    ordering = params.get('ordering', 'id')
+    name = ordering.lstrip('-')
+    if name in STATIC_STATS_METRICS:
+        metric = StaticStats.objects.filter(backtest=OuterRef('pk')).order_by('id').values(name)[:1]
+        queryset = queryset.annotate(**{name: Subquery(metric)}).filter(**{f'{name}__isnull': False})
+    elif name not in BACKTEST_ORDERING_FIELDS:
+        raise ValueError(f"ordering must be one of {', '.join(BACKTEST_ORDERING_FIELDS + STATIC_STATS_METRICS)}, optionally prefixed with -")
+    ordering = (ordering,) if name == 'id' else (ordering, 'id')
+    nullable = {name} if name in BACKTEST_ORDERING_FIELDS and Backtest._meta.get_field(name).null else set()
+    return queryset.order_by(*order_expressions(ordering, nullable)), ordering
+
+def backtest_prefetches(fields=None, timeseries=True):
+    """
+    Ordered prefetches for the nested sections BacktestSerializer renders, limited to fields when given,
+    so each section costs one query however many rows it has. timeseries=False leaves out the timeseries
+    sections, for reads that load them as arrays.
+    """
+    prefetches = {
+        'static_stats': Prefetch('static_stats', queryset=StaticStats.objects.order_by('id')),
+        'trades': Prefetch('trades', queryset=Trade.objects.order_by('id')),
+        'signals': Prefetch('signals', queryset=Signal.objects.order_by('id').prefetch_related(
+            Prefetch('trade_instructions', queryset=TradeInstruction.objects.order_by('id'))
+        )),
+        'period_timeseries_stats': Prefetch('period_timeseries_stats', queryset=PeriodTimeseriesStats.objects.order_by('id')),
+        'daily_timeseries_stats': Prefetch('daily_timeseries_stats', queryset=DailyTimeseriesStats.objects.order_by('id')),
+        'regression_stats': 'regression_stats__timeseries_data',
+    }
+    if not timeseries:
+        del prefetches['period_timeseries_stats'], prefetches['daily_timeseries_stats']
+    return [prefetch for name, prefetch in prefetches.items() if fields is None or name in fields]
+
 def get_price_data(backtest_instance):
+    """ Bars of the tickers over the test window, shared with every backtest and live session on the same universe and window. """
     try:
-        price_data = fetch_price_data(backtest_instance)
-        serializer = BarDataSerializer(price_data, many=True)
-        return serializer.data
+        logger.info("Fetching price data for tickers: %s", backtest_instance.tickers)
+        return cached_price_data(backtest_instance.tickers, backtest_instance.test_start, backtest_instance.test_end)
     except Exception as e:
-        logger.exception(f"Error serializing price data for backtest {backtest_instance.id}: {str(e)}")
+        logger.exception(f"Failed to fetch price data for backtest {backtest_instance.id}: {str(e)}")
         return []
 
 def get_regression_data(backtest_instance):
     try:
-        regression_data = RegressionAnalysis.objects.get(backtest=backtest_instance)
+        regression_data = backtest_instance.regression_stats
         serializer = RegressionAnalysisSerializer(regression_data)
         return serializer.data
     except RegressionAnalysis.DoesNotExist:
@@ -0,0 +1,128 @@
+"""
+Server-side backtest statistics.
+
+Everything is computed from the period equity series and the trades with vectorized NumPy, so a backtest
+can be uploaded with only its period equity and trades, and recomputed after corrections. Returns and
+percentages are fractions (0.05 is 5%), matching what the clients upload.
+"""
+import logging
+import numpy as np
+
+logger = logging.getLogger()
+
+TRADING_DAYS = 252
+SECONDS_PER_DAY = 86400
+
+def day_length(timestamps):
+    """ Length of a day in the unit of timestamps, inferred from their magnitude (seconds, ms, us or ns since the epoch). """
+    latest = int(timestamps.max()) if len(timestamps) else 0
+    for limit, scale in ((1e11, 1), (1e14, 10 ** 3), (1e17, 10 ** 6)):
+        if latest < limit:
+            return SECONDS_PER_DAY * scale
+    return SECONDS_PER_DAY * 10 ** 9
+
+def _ratio(numerator, denominator):
+    """ numerator / denominator as a float, 0.0 when the denominator is zero or undefined. """
+    if not denominator or not np.isfinite(denominator):
+        return 0.0
+    return float(numerator / denominator)
+
+def equity_stats(timestamps, equity, capital):
+    """ The series columns of an equity curve: period, cumulative and drawdown returns. """
+    previous = np.concatenate(([capital], equity))[:len(equity)]
+    return {
+        'timestamp': timestamps,
+        'equity_value': equity,
+        'period_return': np.divide(equity, previous, out=np.ones_like(equity), where=previous != 0) - 1,
+        'cumulative_return': equity / capital - 1,
+        'percent_drawdown': equity / np.maximum.accumulate(np.maximum(equity, capital)) - 1,
+    }
+
+def daily_rollup(timestamps, equity, capital):
+    """ Daily series from a period equity curve, each day taking the equity and timestamp of its last period. """
+    days = timestamps // day_length(timestamps)
+    closes = np.append(np.flatnonzero(np.diff(days)), len(days) - 1) if len(days) else np.empty(0, dtype=np.int64)
+    return equity_stats(timestamps[closes], equity[closes], capital)
+
+def trade_arrays(trades):
+    """ Column arrays (trade_id, ticker, quantity, trade_value, fees) from trade dicts or Trade values. """
+    return {
+        'trade_id': np.array([str(trade['trade_id']) for trade in trades]),
+        'ticker': np.array([trade['ticker'] for trade in trades]),
+        'quantity': np.array([float(trade['quantity']) for trade in trades], dtype=np.float64),
+        'trade_value': np.array([float(trade['trade_value']) for trade in trades], dtype=np.float64),
+        'fees': np.array([float(trade.get('fees') or 0) for trade in trades], dtype=np.float64),
+    }
+
+def trade_results(trades):
+    """
+    (profit, return) of every closed trade. Legs are grouped on trade_id; trade_value is the signed cash flow of
+    a leg (negative when buying), so a trade's profit is the sum of its leg values less fees and its return is
+    that profit over the cash it paid out. A trade is closed once the position in each of its tickers nets to zero.
+    """
+    if not len(trades['trade_id']):
+        return np.empty(0), np.empty(0)
+    trade_ids, trade_index = np.unique(trades['trade_id'], return_inverse=True)
+    tickers, ticker_index = np.unique(trades['ticker'], return_inverse=True)
+    count = len(trade_ids)
+
+    values = trades['trade_value']
+    profit = np.bincount(trade_index, weights=values, minlength=count) - np.bincount(trade_index, weights=trades['fees'], minlength=count)
+    cost = np.bincount(trade_index, weights=np.where(values < 0, -values, 0), minlength=count)
+
+    positions, position_index = np.unique(trade_index * len(tickers) + ticker_index, return_inverse=True)
+    open_positions = np.abs(np.bincount(position_index, weights=trades['quantity'] * -np.sign(values))) > 1e-9
+    closed = np.bincount(positions // len(tickers), weights=open_positions, minlength=count) == 0
+
+    returns = np.divide(profit, cost, out=np.zeros(count), where=cost > 0)
+    return profit[closed], returns[closed]
+
+def static_stats(capital, period, daily, trades):
+    """ The StaticStats field set from the period and daily series and the trade arrays. """
+    profit, returns = trade_results(trades)
+    wins, losses = profit > 0, profit < 0
+    gross_profit, gross_loss = profit[wins].sum(), profit[losses].sum()
+    daily_returns = daily['period_return']
+    deviation = daily_returns.std(ddof=1) if len(daily_returns) > 1 else 0.0
+    downside = np.sqrt(np.mean(np.minimum(daily_returns, 0) ** 2)) if len(daily_returns) else 0.0
+    mean_return = daily_returns.mean() if len(daily_returns) else 0.0
+    equity = period['equity_value']
+
+    return {
+        'net_profit': float(equity[-1] - capital) if len(equity) else float(profit.sum()),
+        'total_fees': float(trades['fees'].sum()),
+        'ending_equity': float(equity[-1]) if len(equity) else None,
+        'avg_trade_profit': float(profit.mean()) if len(profit) else 0.0,
+        'total_return': float(period['cumulative_return'][-1]) if len(equity) else 0.0,
+        'annual_standard_deviation_percentage': float(deviation * np.sqrt(TRADING_DAYS)),
+        'max_drawdown_percentage': float(period['percent_drawdown'].min()) if len(equity) else 0.0,
+        'avg_win_percentage': float(returns[wins].mean()) if wins.any() else 0.0,
+        'avg_loss_percentage': float(returns[losses].mean()) if losses.any() else 0.0,
+        'percent_profitable': _ratio(wins.sum(), len(profit)),
+        'total_trades': int(len(profit)),
+        'number_winning_trades': int(wins.sum()),
+        'number_losing_trades': int(losses.sum()),
+        'profit_and_loss_ratio': abs(_ratio(profit[wins].mean() if wins.any() else 0.0, profit[losses].mean() if losses.any() else 0.0)),
+        'profit_factor': abs(_ratio(gross_profit, gross_loss)),
+        'sortino_ratio': _ratio(mean_return * np.sqrt(TRADING_DAYS), downside),
+        'sharpe_ratio': _ratio(mean_return * np.sqrt(TRADING_DAYS), deviation),
+    }
+
+def compute_statistics(capital, timestamps, equity, trades):
+    """
+    {'static': StaticStats fields, 'period': period series, 'daily': daily series} from a period equity curve
+    (timestamps sorted ascending), the trade arrays and the starting capital (the first equity value when unknown).
+    """
+    equity = np.asarray(equity, dtype=np.float64)
+    if not capital:
+        capital = float(equity[0]) if len(equity) else 1.0
+    period = equity_stats(timestamps, equity, capital)
+    daily = daily_rollup(timestamps, equity, capital)
+    statistics = {'static': static_stats(capital, period, daily, trades), 'period': period, 'daily': daily}
+    logger.info(f"Computed statistics over {len(equity)} periods, {len(daily['timestamp'])} days and {len(trades['trade_id'])} trade legs.")
+    return statistics
+
+def series_dicts(series):
+    """ Series arrays as row dicts for bulk_create_rows/store_timeseries. """
+    names = list(series)
+    return [dict(zip(names, row)) for row in zip(*(series[name].tolist() for name in names))]
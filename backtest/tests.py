@@ -1,13 +1,27 @@
 import json
+import numpy as np
+import datetime
+from unittest.mock import patch
+from django.conf import settings
+from django.utils import timezone
+from django.test import override_settings
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from decimal import Decimal
 from django.urls import reverse
 from rest_framework import status
 from account.models import CustomUser
-from .models import Backtest as Backtest_model
+from .models import Backtest as Backtest_model, BacktestUploadJob, Signal, TradeInstruction, PeriodTimeseriesStats, Trade, TimeseriesBlob, StaticStats, DailyTimeseriesStats
+from .services import bulk_create_rows, bulk_create_signals
+from .jobs import process_backtest_upload_jobs, claim_backtest_upload_job
+from .timeseries import store_timeseries, load_timeseries, downsample_series
+from .statistics import compute_statistics, trade_arrays
 from symbols.models import Symbol, SecurityType
 from rest_framework.authtoken.models import Token
 from rest_framework.test import APIClient, APITestCase
 from market_data.models import BarData, QuoteData, Symbol
+from market_data.services import clear_price_data_cache, mark_bars_written
 
 # TODO: test options/cryptocurrency models
 
@@ -21,6 +35,10 @@ class Base(APITestCase):
         self.token = Token.objects.create(user=self.user)
         self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
 
+        # Cached price data would outlive the rolled back rows of other tests
+        clear_price_data_cache()
+        cache.clear()
+
 class Backtest(Base):
     def setUp(self):
         super().setUp()
@@ -159,6 +177,75 @@ class Backtest(Base):
         self.assertIn('test_start', response.data[0])
         self.assertIn('capital', response.data[0])
 
+    def test_get_backtest_list_filters(self):
+        for i in range(5):
+            backtest = Backtest_model.objects.create(strategy_name=f"Strategy {i % 2}", tickers=["MSFT"] if i < 3 else ["MSFT", "AAPL"],
+                                                     benchmark=["^GSPC"], data_type="BAR", test_start=i * 100, test_end=i * 100 + 50)
+            StaticStats.objects.create(backtest=backtest, sharpe_ratio=i / 10 if i != 2 else None)
+
+        # test
+        by_ticker = self.client.get(self.url, {'ticker': 'AAPL'})
+        by_strategy = self.client.get(self.url, {'strategy_name': 'Strategy 1', 'ticker': 'MSFT'})
+        by_window = self.client.get(self.url, {'test_start': 120, 'test_end': 320})
+        by_created = self.client.get(self.url, {'created_after': '2000-01-01', 'created_before': '2000-01-02'})
+        first_page = self.client.get(self.url, {'ordering': '-sharpe_ratio', 'page_size': 3})
+        second_page = self.client.get(self.url, {'ordering': '-sharpe_ratio', 'page_size': 3, 'cursor': first_page.data['next_cursor']})
+        invalid = self.client.get(self.url, {'ordering': 'volume'})
+
+        # validate
+        names = lambda response: [(row['strategy_name'], row['test_start']) for row in response.data]
+        self.assertEqual(len(by_ticker.data), 3)
+        self.assertEqual(names(by_strategy), [("Strategy 1", 100), ("Strategy 1", 300)])
+        self.assertEqual(names(by_window), [("Strategy 1", 100), ("Strategy 0", 200), ("Strategy 1", 300)])
+        self.assertEqual(by_created.data, [])
+        self.assertEqual([row['test_start'] for row in first_page.data['results']], [1704903000, 400, 300])
+        self.assertEqual([row['test_start'] for row in second_page.data['results']], [100, 0])
+        self.assertIsNone(second_page.data['next_cursor'])
+        self.assertEqual(invalid.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_get_backtest_list_cursor_edge_cases(self):
+        for i in range(3):
+            backtest = Backtest_model.objects.create(strategy_name=f"Strategy {i}", tickers=["MSFT"], benchmark=["^GSPC"], data_type="BAR")
+            StaticStats.objects.create(backtest=backtest, sharpe_ratio=i)
+        StaticStats.objects.create(backtest=backtest, sharpe_ratio=-5)
+
+        # test
+        by_created = [self.client.get(self.url, {'ordering': 'created_at', 'page_size': 2})]
+        while by_created[-1].data['next_cursor']:
+            by_created.append(self.client.get(self.url, {'ordering': 'created_at', 'page_size': 2, 'cursor': by_created[-1].data['next_cursor']}))
+        by_sharpe = self.client.get(self.url, {'ordering': '-sharpe_ratio'})
+
+        # validate
+        self.assertTrue(all(page.status_code == status.HTTP_200_OK for page in by_created))
+        ids = [row['id'] for page in by_created for row in page.data['results']]
+        self.assertEqual(ids, sorted(Backtest_model.objects.values_list('id', flat=True)))
+        self.assertEqual([row['strategy_name'] for row in by_sharpe.data if row['strategy_name'].startswith("Strategy")], ["Strategy 2", "Strategy 1", "Strategy 0"])
+        self.assertEqual(len(by_sharpe.data), len({row['id'] for row in by_sharpe.data}))
+
+    def test_get_backtest_list_pages_across_null(self):
+        for test_start in (None, 5, None, 7):
+            Backtest_model.objects.create(strategy_name="Window", tickers=["MSFT"], benchmark=["^GSPC"], data_type="BAR", test_start=test_start)
+        backtests = list(Backtest_model.objects.values_list('id', 'test_start'))
+
+        def page_through(ordering):
+            pages = [self.client.get(self.url, {'ordering': ordering, 'page_size': 1})]
+            while pages[-1].status_code == status.HTTP_200_OK and pages[-1].data['next_cursor']:
+                pages.append(self.client.get(self.url, {'ordering': ordering, 'page_size': 1, 'cursor': pages[-1].data['next_cursor']}))
+            return pages
+
+        # test
+        ascending = page_through('test_start')
+        descending = page_through('-test_start')
+        unpaginated = self.client.get(self.url, {'ordering': 'test_start'})
+
+        # validate
+        nulls = [id for id, test_start in backtests if test_start is None]
+        values = sorted((test_start, id) for id, test_start in backtests if test_start is not None)
+        self.assertTrue(all(page.status_code == status.HTTP_200_OK for page in ascending + descending))
+        self.assertEqual([row['id'] for page in ascending for row in page.data['results']], [id for _, id in values] + nulls)
+        self.assertEqual([row['id'] for page in descending for row in page.data['results']], [id for _, id in sorted(values, key=lambda value: -value[0])] + nulls)
+        self.assertEqual([row['id'] for row in unpaginated.data], [id for _, id in values] + nulls)
+
     def test_get_backtest_by_id(self):
         url = f"{self.url}{self.backtest_id}/"
         # test
@@ -183,6 +270,391 @@ class Backtest(Base):
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         self.assertEqual(Backtest_model.objects.count(), 2)
 
+    def test_create_backtest_links_trade_instructions(self):
+        self.backtest_data['signals'].append({
+            "timestamp": 1704904000,
+            "trade_instructions": [{"ticker": "AAPL", "action": "SELL", "trade_id": 2, "leg_id": 1, "weight": 0.1}]
+        })
+
+        # test
+        response = self.client.post(self.url, data=self.backtest_data, format='json')
+
+        # validate
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        signals = Signal.objects.filter(backtest_id=response.data['id']).order_by('timestamp')
+        self.assertEqual([[ti.leg_id for ti in signal.trade_instructions.order_by('leg_id')] for signal in signals], [[1, 2], [1]])
+        self.assertEqual(PeriodTimeseriesStats.objects.filter(backtest_id=response.data['id']).count(), 2)
+
+    def test_bulk_create_in_chunks(self):
+        backtest = Backtest_model.objects.get(id=self.backtest_id)
+        signals = [{"timestamp": i, "trade_instructions": [{"ticker": "AAPL", "action": "BUY", "trade_id": i, "leg_id": 1, "weight": 0.1}] * (i % 3)}
+                   for i in range(7)]
+        stats = [{"timestamp": i, "equity_value": 1.0} for i in range(7)]
+
+        # test
+        created_signals, created_instructions = bulk_create_signals(backtest, signals, batch_size=3)
+        created_stats = bulk_create_rows(PeriodTimeseriesStats, stats, batch_size=3, backtest=backtest)
+
+        # validate
+        self.assertEqual((created_signals, created_instructions, created_stats), (7, 6, 7))
+        for signal in Signal.objects.filter(backtest=backtest, timestamp__lt=1000):
+            self.assertEqual(signal.trade_instructions.count(), signal.timestamp % 3)
+            self.assertTrue(all(ti.trade_id == signal.timestamp for ti in signal.trade_instructions.all()))
+
+    def test_async_upload(self):
+        # test
+        with patch('backtest.jobs.SPOOL_CHUNK_SIZE', 256), patch('backtest.jobs.UPLOAD_CHUNK_BYTES', 1024):
+            response = self.client.post(f"{self.url}?async=true", data=json.dumps(self.backtest_data), content_type='application/json')
+        job = BacktestUploadJob.objects.get(id=response.data['id'])
+        chunks = list(job.chunks.order_by('position').values_list('data', flat=True))
+        processed = process_backtest_upload_jobs()
+        status_response = self.client.get(response['Location'])
+
+        # validate
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['status'], BacktestUploadJob.PENDING)
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(json.loads(b''.join(bytes(chunk) for chunk in chunks)), self.backtest_data)
+        self.assertEqual(processed, 1)
+        self.assertEqual(status_response.status_code, status.HTTP_200_OK)
+        self.assertEqual(status_response.data['status'], BacktestUploadJob.SUCCEEDED)
+        self.assertEqual(status_response.data['progress'], {
+            'static_stats': 1, 'period_timeseries_stats': 2, 'daily_timeseries_stats': 2,
+            'trades': 1, 'signals': 1, 'trade_instructions': 2,
+        })
+        self.assertEqual(Backtest_model.objects.count(), 2)
+        self.assertEqual(status_response.data['backtest'], Backtest_model.objects.latest('id').id)
+        self.assertFalse(job.chunks.exists())
+
+    def test_async_upload_invalid_payload(self):
+        del self.backtest_data['parameters']['strategy_name']
+
+        # test
+        response = self.client.post(f"{self.url}?async=true", data=json.dumps(self.backtest_data), content_type='application/json')
+        process_backtest_upload_jobs()
+        job = BacktestUploadJob.objects.get(id=response.data['id'])
+
+        # validate
+        self.assertEqual(job.status, BacktestUploadJob.FAILED)
+        self.assertIn('parameters', job.error)
+        self.assertIsNone(job.backtest)
+        self.assertEqual(Backtest_model.objects.count(), 1)
+
+    def test_async_upload_reclaims_abandoned_jobs(self):
+        expired = timezone.now() - datetime.timedelta(seconds=settings.BACKTEST_UPLOAD_JOB_TIMEOUT + 1)
+        running = BacktestUploadJob.objects.create(status=BacktestUploadJob.RUNNING, started_at=timezone.now(), attempts=1)
+        abandoned = BacktestUploadJob.objects.create(status=BacktestUploadJob.RUNNING, started_at=expired, attempts=1)
+        exhausted = BacktestUploadJob.objects.create(status=BacktestUploadJob.RUNNING, started_at=expired, attempts=settings.BACKTEST_UPLOAD_JOB_ATTEMPTS)
+
+        # test
+        claimed = claim_backtest_upload_job()
+        again = claim_backtest_upload_job()
+
+        # validate
+        self.assertEqual((claimed.id, claimed.attempts), (abandoned.id, 2))
+        self.assertIsNone(again)
+        running.refresh_from_db()
+        exhausted.refresh_from_db()
+        self.assertEqual(running.attempts, 1)
+        self.assertEqual(exhausted.status, BacktestUploadJob.FAILED)
+
+    def test_get_backtest_sparse_fields(self):
+        url = f"{self.url}{self.backtest_id}/"
+
+        # test
+        response = self.client.get(url, {'fields': 'static_stats,trades'})
+
+        # validate
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.data), {'id', 'static_stats', 'trades'})
+        self.assertEqual(response.data['trades'][0]['ticker'], "AAPL")
+
+    def test_get_backtest_sections(self):
+        url = f"{self.url}{self.backtest_id}/"
+
+        # test
+        trades = self.client.get(f"{url}trades/")
+        signals = self.client.get(f"{url}signals/")
+        first_page = self.client.get(f"{url}timeseries/", {'kind': 'daily', 'page_size': 1})
+        second_page = self.client.get(f"{url}timeseries/", {'kind': 'daily', 'page_size': 1, 'cursor': first_page.data['next_cursor']})
+        invalid = self.client.get(f"{url}timeseries/", {'kind': 'weekly'})
+
+        # validate
+        self.assertEqual(trades.status_code, 200)
+        self.assertEqual(len(trades.data['results']), 1)
+        self.assertEqual(len(signals.data['results'][0]['trade_instructions']), 2)
+        self.assertEqual(first_page.data['results'][0]['timestamp'], 1704903000)
+        self.assertEqual(second_page.data['results'][0]['timestamp'], 1704904000)
+        self.assertIsNone(second_page.data['next_cursor'])
+        self.assertEqual(invalid.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_get_backtest_price_data(self):
+        BarData.objects.create(symbol=self.symbol, timestamp=1704903060, open=101, high=102, low=100, close=101.5, volume=10)
+        url = f"{self.url}{self.backtest_id}/price-data/"
+
+        # test
+        response = self.client.get(url)
+        data = json.loads(response.content)
+
+        # validate
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(data['results']), 1)
+        self.assertEqual(data['results'][0]['symbol'], "AAPL")
+        self.assertEqual(data['results'][0]['close'], "101.5000")
+        self.assertIsNone(data['next'])
+
+    def test_get_backtest_price_data_without_window(self):
+        backtest = Backtest_model.objects.create(strategy_name="Open", tickers=["AAPL"], benchmark=["^GSPC"], data_type="BAR", test_start=1704903000)
+        url = f"{self.url}{backtest.id}/price-data/"
+
+        # test
+        response = self.client.get(url)
+
+        # validate
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_get_backtest_query_count_is_constant(self):
+        url = f"{self.url}{self.backtest_id}/"
+        backtest = Backtest_model.objects.get(id=self.backtest_id)
+        clear_price_data_cache() # compare uncached reads
+        cache.clear()
+        with CaptureQueriesContext(connection) as baseline:
+            self.client.get(url)
+
+        for i in range(10):
+            signal = Signal.objects.create(backtest=backtest, timestamp=1704905000 + i)
+            TradeInstruction.objects.bulk_create([TradeInstruction(signal=signal, ticker="AAPL", action="BUY", trade_id=i, leg_id=leg, weight=0.1) for leg in range(3)])
+            Trade.objects.create(backtest=backtest, trade_id=i, leg_id=1, timestamp=1704905000 + i, ticker="AAPL", quantity=1, avg_price=1, trade_value=1, action="BUY", fees=0)
+            BarData.objects.create(symbol=self.symbol, timestamp=1704905000 + i, open=1, high=1, low=1, close=1, volume=1)
+
+        # test
+        clear_price_data_cache()
+        cache.clear()
+        with self.assertNumQueries(len(baseline)):
+            response = self.client.get(url)
+
+        # validate
+        self.assertEqual(len(response.data['signals']), 11)
+        self.assertEqual(len(response.data['price_data']), 10)
+        self.assertEqual(response.data['price_data'][0]['symbol'], "AAPL")
+
+    def test_price_data_cache(self):
+        BarData.objects.create(symbol=self.symbol, timestamp=1704903060, open=101, high=102, low=100, close=101.5, volume=10)
+        other = Backtest_model.objects.create(strategy_name="Other", tickers=["AAPL"], benchmark=["^GSPC"], data_type="BAR",
+                                              test_start=1704903000, test_end=1705903000)
+        url = f"{self.url}{self.backtest_id}/"
+        clear_price_data_cache()
+        cache.clear()
+        with CaptureQueriesContext(connection) as miss:
+            first = self.client.get(url, {'fields': 'price_data'})
+        miss_queries = len(miss)
+
+        # test
+        with CaptureQueriesContext(connection) as hit:
+            shared = self.client.get(f"{self.url}{other.id}/", {'fields': 'price_data'})
+        hit_queries = len(hit)
+        BarData.objects.create(symbol=self.symbol, timestamp=1706000000, open=1, high=1, low=1, close=1, volume=1)
+        mark_bars_written({self.symbol.id: (1706000000, 1706000000)}) # outside the window
+        outside = self.client.get(url, {'fields': 'price_data'})
+        BarData.objects.create(symbol=self.symbol, timestamp=1704903120, open=1, high=1, low=1, close=1, volume=1)
+        mark_bars_written({self.symbol.id: (1704903120, 1704903120)})
+        inside = self.client.get(url, {'fields': 'price_data'})
+
+        # validate
+        self.assertEqual(first.data['price_data'], shared.data['price_data'])
+        self.assertEqual(first.data['price_data'][0]['close'], "101.5000")
+        self.assertEqual(hit_queries, miss_queries - 2) # no symbol or bar query
+        self.assertEqual(len(outside.data['price_data']), 1)
+        self.assertEqual([bar['timestamp'] for bar in inside.data['price_data']], [1704903060, 1704903120])
+
+    def test_columnar_timeseries_matches_rows(self):
+        self.backtest_data['parameters']['timeseries_storage'] = 'columnar'
+
+        # test
+        response = self.client.post(self.url, data=self.backtest_data, format='json')
+        columnar = self.client.get(f"{self.url}{response.data['id']}/")
+        rows = self.client.get(f"{self.url}{self.backtest_id}/")
+
+        # validate
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(PeriodTimeseriesStats.objects.filter(backtest_id=response.data['id']).count(), 0)
+        self.assertEqual(TimeseriesBlob.objects.filter(backtest_id=response.data['id']).count(), 2)
+        self.assertEqual(columnar.data['parameters']['timeseries_storage'], 'columnar')
+        self.assertEqual(json.loads(json.dumps(columnar.data['period_timeseries_stats'])), json.loads(json.dumps(rows.data['period_timeseries_stats'])))
+        self.assertEqual(json.loads(json.dumps(columnar.data['daily_timeseries_stats'])), json.loads(json.dumps(rows.data['daily_timeseries_stats'])))
+
+    def test_columnar_timeseries_slices(self):
+        backtest = Backtest_model.objects.create(strategy_name="Columnar", tickers=["AAPL"], benchmark=["^GSPC"], data_type="BAR",
+                                                 train_start=0, train_end=0, test_start=0, test_end=0, capital=1000,
+                                                 timeseries_storage='columnar', timeseries_chunk_span=100)
+        stats = [{"timestamp": i * 10, "equity_value": 1000 + i, "period_return": 0.01, "cumulative_return": i / 100, "percent_drawdown": -i / 1000}
+                 for i in range(50)]
+        url = f"{self.url}{backtest.id}/timeseries/"
+
+        # test
+        stored = store_timeseries(backtest, 'period', stats, backtest.timeseries_chunk_span)
+        series = load_timeseries(backtest, 'period', start=95, end=205)
+        columns = self.client.get(url, {'layout': 'columns', 'start': 100, 'end': 119})
+        first_page = self.client.get(url, {'page_size': 20})
+        second_page = self.client.get(url, {'page_size': 20, 'cursor': first_page.data['next_cursor'], 'end': 250})
+        invalid = self.client.get(url, {'start': 'yesterday'})
+
+        # validate
+        self.assertEqual(stored, 50)
+        self.assertEqual(TimeseriesBlob.objects.filter(backtest=backtest).count(), 5)
+        self.assertEqual(series['timestamp'].tolist(), list(range(100, 201, 10)))
+        self.assertEqual(columns.data, {'kind': 'period', 'count': 2, 'columns': {
+            'timestamp': [100, 110], 'equity_value': [1010.0, 1011.0], 'period_return': [0.01, 0.01],
+            'cumulative_return': [0.1, 0.11], 'percent_drawdown': [-0.01, -0.011],
+        }})
+        self.assertEqual([row['timestamp'] for row in first_page.data['results']], list(range(0, 200, 10)))
+        self.assertEqual(first_page.data['results'][1]['equity_value'], "1001.00")
+        self.assertEqual([row['timestamp'] for row in second_page.data['results']], list(range(200, 251, 10)))
+        self.assertIsNone(second_page.data['next_cursor'])
+        self.assertEqual(invalid.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_downsample_series_keeps_extremes(self):
+        count = 100_000
+        timestamps = np.arange(count, dtype=np.int64) * 60
+        equity = 10000 + np.sin(np.arange(count) / 5000) * 100
+        equity[61_234] = 9000 # a one-point crash
+        drawdown = equity / np.maximum.accumulate(equity) - 1
+        series = {'timestamp': timestamps, 'equity_value': equity, 'period_return': np.zeros(count),
+                  'cumulative_return': equity / 10000 - 1, 'percent_drawdown': drawdown}
+
+        for method in ('lttb', 'minmax'):
+            # test
+            sampled = downsample_series(series, 2000, method)
+
+            # validate
+            self.assertLessEqual(len(sampled['timestamp']), 2000)
+            self.assertGreater(len(sampled['timestamp']), 1000)
+            self.assertTrue(np.all(np.diff(sampled['timestamp']) > 0))
+            self.assertEqual(sampled['timestamp'][[0, -1]].tolist(), [0, (count - 1) * 60])
+            self.assertEqual(sampled['equity_value'].min(), 9000)
+            self.assertEqual(sampled['percent_drawdown'].min(), drawdown.min())
+            self.assertEqual(sampled['equity_value'].max(), equity.max())
+
+    def test_get_backtest_timeseries_max_points(self):
+        backtest = Backtest_model.objects.get(id=self.backtest_id)
+        PeriodTimeseriesStats.objects.bulk_create([
+            PeriodTimeseriesStats(backtest=backtest, timestamp=1704905000 + i, equity_value=10000 + (i % 50), period_return=0,
+                                  cumulative_return=0, percent_drawdown=-(i == 700) * 25)
+            for i in range(1000)
+        ])
+        url = f"{self.url}{self.backtest_id}/"
+
+        # test
+        section = self.client.get(f"{url}timeseries/", {'max_points': 100})
+        columns = self.client.get(f"{url}timeseries/", {'max_points': 100, 'downsample': 'minmax', 'layout': 'columns'})
+        detail = self.client.get(url, {'max_points': 100, 'fields': 'period_timeseries_stats,daily_timeseries_stats'})
+        too_few = self.client.get(f"{url}timeseries/", {'max_points': 2})
+        unknown = self.client.get(url, {'max_points': 100, 'downsample': 'average'})
+
+        # validate
+        self.assertEqual(section.status_code, 200)
+        self.assertEqual(section.data['downsampled_from'], 1002)
+        self.assertLessEqual(len(section.data['results']), 100)
+        self.assertIn("-25.000000", [row['percent_drawdown'] for row in section.data['results']])
+        self.assertEqual(columns.data['method'], 'minmax')
+        self.assertIn(1704905700, columns.data['columns']['timestamp'])
+        self.assertLessEqual(len(detail.data['period_timeseries_stats']), 100)
+        self.assertEqual(len(detail.data['daily_timeseries_stats']), 2)
+        self.assertEqual(too_few.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(unknown.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_compute_statistics(self):
+        day = 1704844800
+        timestamps = np.array([day, day + 3600, day + 86400, day + 90000])
+        trades = trade_arrays([
+            {"trade_id": 1, "ticker": "AAPL", "quantity": 10, "trade_value": -1000, "fees": 1},
+            {"trade_id": 1, "ticker": "AAPL", "quantity": 10, "trade_value": 1100, "fees": 1},
+            {"trade_id": 2, "ticker": "MSFT", "quantity": 5, "trade_value": -500, "fees": 0},
+            {"trade_id": 2, "ticker": "MSFT", "quantity": 5, "trade_value": 450, "fees": 0},
+            {"trade_id": 3, "ticker": "AAPL", "quantity": 1, "trade_value": -100, "fees": 0}, # still open
+        ])
+
+        # test
+        statistics = compute_statistics(1000, timestamps, [1010, 990, 1100, 1050], trades)
+
+        # validate
+        static, daily = statistics['static'], statistics['daily']
+        daily_returns = np.array([990 / 1000 - 1, 1050 / 990 - 1])
+        self.assertEqual(daily['timestamp'].tolist(), [day + 3600, day + 90000])
+        np.testing.assert_allclose(daily['period_return'], daily_returns)
+        np.testing.assert_allclose(statistics['period']['percent_drawdown'], [0, 990 / 1010 - 1, 0, 1050 / 1100 - 1])
+        self.assertEqual((static['total_trades'], static['number_winning_trades'], static['number_losing_trades']), (2, 1, 1))
+        self.assertAlmostEqual(static['net_profit'], 50)
+        self.assertAlmostEqual(static['total_return'], 0.05)
+        self.assertAlmostEqual(static['total_fees'], 2)
+        self.assertAlmostEqual(static['avg_trade_profit'], 24)
+        self.assertAlmostEqual(static['percent_profitable'], 0.5)
+        self.assertAlmostEqual(static['profit_factor'], 98 / 50)
+        self.assertAlmostEqual(static['avg_win_percentage'], 0.098)
+        self.assertAlmostEqual(static['avg_loss_percentage'], -0.1)
+        self.assertAlmostEqual(static['max_drawdown_percentage'], 1050 / 1100 - 1)
+        self.assertAlmostEqual(static['sharpe_ratio'], daily_returns.mean() / daily_returns.std(ddof=1) * np.sqrt(252))
+
+    def test_create_backtest_computes_statistics(self):
+        del self.backtest_data['static_stats']
+        del self.backtest_data['daily_timeseries_stats']
+        self.backtest_data['period_timeseries_stats'] = [
+            {"timestamp": 1704903000, "equity_value": 100500.0},
+            {"timestamp": 1704989400, "equity_value": 99495.0},
+        ]
+
+        # test
+        response = self.client.post(self.url, data=self.backtest_data, format='json')
+        detail = self.client.get(f"{self.url}{response.data['id']}/")
+
+        # validate
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(detail.data['static_stats']), 1)
+        self.assertAlmostEqual(detail.data['static_stats'][0]['ending_equity'], 99495.0)
+        self.assertAlmostEqual(detail.data['static_stats'][0]['max_drawdown_percentage'], -0.01)
+        self.assertEqual(len(detail.data['daily_timeseries_stats']), 2)
+        self.assertEqual(detail.data['period_timeseries_stats'][1]['period_return'], "-0.010000")
+        self.assertEqual(detail.data['period_timeseries_stats'][0]['cumulative_return'], "0.005000")
+
+    def test_recompute_statistics(self):
+        Trade.objects.create(backtest_id=self.backtest_id, trade_id=1, leg_id=2, timestamp=1704904000, ticker="AAPL",
+                             quantity=4, avg_price=140, trade_value=560, action="SELL", fees=1)
+
+        # test
+        response = self.client.post(f"{self.url}{self.backtest_id}/recompute-stats/")
+
+        # validate
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['daily_timeseries_stats'], 1)
+        self.assertEqual(response.data['static_stats']['total_trades'], 1)
+        self.assertAlmostEqual(response.data['static_stats']['avg_trade_profit'], 560 - 522.96 - 1)
+        self.assertEqual(StaticStats.objects.filter(backtest_id=self.backtest_id).count(), 1)
+        self.assertEqual(DailyTimeseriesStats.objects.filter(backtest_id=self.backtest_id).count(), 1)
+
+    def test_compare_backtests(self):
+        other = Backtest_model.objects.create(strategy_name="Other", tickers=["AAPL"], benchmark=["^GSPC"], data_type="BAR", capital=1000,
+                                              timeseries_storage='columnar')
+        store_timeseries(other, 'daily', [{"timestamp": 1704903500 + i * 500, "equity_value": 1000 + i} for i in range(3)])
+        StaticStats.objects.create(backtest_id=self.backtest_id, sharpe_ratio=-1) # a later row is not the one compared
+        url = f"{self.url}compare/"
+
+        # test
+        union = self.client.get(url, {'ids': f"{self.backtest_id},{other.id}"})
+        intersection = self.client.get(url, {'ids': f"{other.id},{self.backtest_id}", 'align': 'intersection', 'columns': 'equity_value'})
+        missing = self.client.get(url, {'ids': f"{self.backtest_id},{other.id + 1}"})
+        invalid = self.client.get(url, {'ids': f"{self.backtest_id}", 'columns': 'equity_value,volume'})
+
+        # validate
+        self.assertEqual(union.status_code, 200)
+        self.assertEqual(union.data['ids'], [self.backtest_id, other.id])
+        self.assertEqual(union.data['static_stats']['sharpe_ratio'], [10.72015, None])
+        self.assertEqual(union.data['timestamp'], [1704903000, 1704903500, 1704904000, 1704904500])
+        self.assertEqual(union.data['series']['equity_value'], [[10000.0, 10000.0, 10000.0, None], [None, 1000.0, 1001.0, 1002.0]])
+        self.assertEqual(intersection.data['timestamp'], [1704904000])
+        self.assertEqual(intersection.data['series'], {'equity_value': [[1001.0], [10000.0]]})
+        self.assertEqual(missing.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(invalid.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_delete_backtest(self):
         url = f"{self.url}{self.backtest_id}/"
         
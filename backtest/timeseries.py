@@ -0,0 +1,204 @@
+"""
+Columnar storage for backtest timeseries stats.
+
+A series is split into chunks (by timestamp // chunk_span, or every TIMESERIES_CHUNK_ROWS rows) and each chunk
+is stored as one TimeseriesBlob holding zlib(timestamp deltas as int64 + each value column as float64), all
+little-endian. The first delta is the chunk's first timestamp, so a chunk decodes on its own.
+"""
+import zlib
+import functools
+import logging
+import numpy as np
+
+from .models import TimeseriesBlob, PeriodTimeseriesStats, DailyTimeseriesStats
+
+logger = logging.getLogger()
+
+TIMESERIES_VALUES = ('equity_value', 'period_return', 'cumulative_return', 'percent_drawdown')
+TIMESERIES_MODELS = {'period': PeriodTimeseriesStats, 'daily': DailyTimeseriesStats}
+TIMESERIES_CHUNK_ROWS = 262_144
+
+def encode_chunk(timestamps, values):
+    deltas = np.diff(timestamps, prepend=np.int64(0)).astype('<i8')
+    return zlib.compress(deltas.tobytes() + values.astype('<f8').tobytes())
+
+def decode_chunk(data, row_count):
+    raw = zlib.decompress(bytes(data))
+    timestamps = np.cumsum(np.frombuffer(raw, dtype='<i8', count=row_count))
+    values = np.frombuffer(raw, dtype='<f8', offset=row_count * 8).reshape(len(TIMESERIES_VALUES), row_count)
+    return timestamps, values
+
+def series_arrays(rows):
+    """ (timestamps, values[column, row]) sorted by timestamp from validated stat dicts. """
+    if any(row.get('timestamp') is None for row in rows):
+        raise ValueError("Every timeseries row requires a timestamp.")
+    timestamps = np.fromiter((row['timestamp'] for row in rows), dtype=np.int64, count=len(rows))
+    values = np.array([[float(row.get(name, 0)) for row in rows] for name in TIMESERIES_VALUES], dtype=np.float64).reshape(len(TIMESERIES_VALUES), len(rows))
+    order = np.argsort(timestamps, kind='stable')
+    return timestamps[order], values[:, order]
+
+def store_timeseries(backtest, kind, rows, chunk_span=None):
+    """ Encode and save a series as TimeseriesBlob chunks. Returns the number of rows stored. """
+    if not rows:
+        return 0
+    timestamps, values = series_arrays(rows)
+    if chunk_span:
+        keys = timestamps // chunk_span
+        bounds = np.flatnonzero(np.diff(keys)) + 1
+    else:
+        bounds = np.arange(TIMESERIES_CHUNK_ROWS, len(timestamps), TIMESERIES_CHUNK_ROWS)
+
+    blobs = [
+        TimeseriesBlob(
+            backtest=backtest,
+            kind=kind,
+            start_timestamp=int(chunk_timestamps[0]),
+            end_timestamp=int(chunk_timestamps[-1]),
+            row_count=len(chunk_timestamps),
+            data=encode_chunk(chunk_timestamps, chunk_values),
+        )
+        for chunk_timestamps, chunk_values in zip(np.split(timestamps, bounds), np.split(values, bounds, axis=1))
+    ]
+    TimeseriesBlob.objects.bulk_create(blobs)
+    logger.info(f"Stored {len(timestamps)} {kind} timeseries rows of backtest {backtest.id} in {len(blobs)} chunks.")
+    return len(timestamps)
+
+def load_timeseries(backtest, kind, start=None, end=None):
+    """
+    A backtest's series as {'timestamp': int64 array, <value>: float64 array, ...} ordered by timestamp,
+    optionally limited to start <= timestamp <= end. Works for both storage modes; columnar storage only
+    decodes the chunks overlapping the range. Rows without a timestamp are left out.
+    """
+    if backtest.timeseries_storage == 'columnar':
+        blobs = TimeseriesBlob.objects.filter(backtest=backtest, kind=kind)
+        if start is not None:
+            blobs = blobs.filter(end_timestamp__gte=start)
+        if end is not None:
+            blobs = blobs.filter(start_timestamp__lte=end)
+        chunks = [decode_chunk(data, row_count) for data, row_count in blobs.order_by('start_timestamp').values_list('data', 'row_count')]
+        timestamps = np.concatenate([chunk[0] for chunk in chunks]) if chunks else np.empty(0, dtype=np.int64)
+        values = np.concatenate([chunk[1] for chunk in chunks], axis=1) if chunks else np.empty((len(TIMESERIES_VALUES), 0))
+    else:
+        rows = TIMESERIES_MODELS[kind].objects.filter(backtest=backtest, timestamp__isnull=False)
+        if start is not None:
+            rows = rows.filter(timestamp__gte=start)
+        if end is not None:
+            rows = rows.filter(timestamp__lte=end)
+        rows = list(rows.order_by('timestamp', 'id').values_list('timestamp', *TIMESERIES_VALUES))
+        timestamps = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+        values = np.array([row[1:] for row in rows], dtype=np.float64).reshape(len(rows), len(TIMESERIES_VALUES)).T
+
+    mask = np.ones(len(timestamps), dtype=bool)
+    if start is not None:
+        mask &= timestamps >= start
+    if end is not None:
+        mask &= timestamps <= end
+    series = {'timestamp': timestamps[mask]}
+    for name, column in zip(TIMESERIES_VALUES, values):
+        series[name] = column[mask]
+    return series
+
+def series_rows(kind, series):
+    """ Series arrays as the row dicts the timeseries stats serializers produce (decimals as fixed-point strings). """
+    model = TIMESERIES_MODELS[kind]
+    formats = {name: f"{{:.{model._meta.get_field(name).decimal_places}f}}" for name in TIMESERIES_VALUES}
+    names = ('equity_value', 'percent_drawdown', 'cumulative_return', 'period_return') # serializer field order
+    columns = [series['timestamp'].tolist()] + [[formats[name].format(value) for value in series[name].tolist()] for name in names]
+    return [dict(zip(('timestamp',) + names, row)) for row in zip(*columns)]
+
+def series_columns(series):
+    """ Series arrays as JSON-ready lists keyed by column. """
+    return {name: values.tolist() for name, values in series.items()}
+
+DOWNSAMPLE_METHODS = ('lttb', 'minmax')
+MIN_MAX_POINTS = 16
+
+def series_extremes(series):
+    """ Indexes of the first and last point and of the lowest and highest point of every value column (peak equity, max drawdown, ...). """
+    count = len(series['timestamp'])
+    extremes = [0, count - 1] + [pick(series[name]) for name in TIMESERIES_VALUES for pick in (np.argmin, np.argmax)]
+    return np.unique(np.array(extremes, dtype=np.int64))
+
+def lttb_indexes(x, y, threshold):
+    """
+    Largest-Triangle-Three-Buckets: keeps the first and last point and, from each of threshold - 2 buckets, the point
+    forming the largest triangle with the previously kept point and the average of the next bucket.
+    """
+    count = len(x)
+    if threshold >= count or threshold < 3:
+        return np.arange(count)
+    x = (x - x[0]).astype(np.float64)
+    edges = np.linspace(1, count - 1, threshold - 1).astype(np.int64)
+    widths = np.diff(edges)
+    average_x = np.add.reduceat(x[:count - 1], edges[:-1]) / widths
+    average_y = np.add.reduceat(y[:count - 1], edges[:-1]) / widths
+    next_x = np.append(average_x[1:], x[-1])
+    next_y = np.append(average_y[1:], y[-1])
+
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, count - 1
+    for bucket in range(threshold - 2):
+        start, stop = edges[bucket], edges[bucket + 1]
+        previous = selected[bucket]
+        area = np.abs((x[previous] - next_x[bucket]) * (y[start:stop] - y[previous]) - (x[previous] - x[start:stop]) * (next_y[bucket] - y[previous]))
+        selected[bucket + 1] = start + np.argmax(area)
+    return selected
+
+def minmax_indexes(y, threshold):
+    """ The lowest and highest point of each of threshold // 2 equal-width buckets. """
+    count = len(y)
+    if threshold >= count:
+        return np.arange(count)
+    width = -(-count // max(threshold // 2, 1))
+    buckets = -(-count // width)
+    padded = np.full(buckets * width, np.nan)
+    padded[:count] = y
+    padded = padded.reshape(buckets, width)
+    offsets = np.arange(buckets) * width
+    return np.unique(np.concatenate([offsets + np.nanargmin(padded, axis=1), offsets + np.nanargmax(padded, axis=1)]))
+
+def downsample_series(series, max_points, method='lttb', column='equity_value'):
+    """
+    At most max_points points of series, picked on column with LTTB or min/max per bucket. The extremes of every
+    column are always kept, so the drawn peak equity and max drawdown match the full series.
+    """
+    count = len(series['timestamp'])
+    if count <= max_points:
+        return series
+    extremes = series_extremes(series)
+    budget = max_points - len(extremes)
+    if method == 'minmax':
+        indexes = minmax_indexes(series[column], budget)
+    else:
+        indexes = lttb_indexes(series['timestamp'], series[column], budget)
+    indexes = np.union1d(indexes, extremes)
+    logger.info(f"Downsampled a series of {count} points to {len(indexes)} with {method}.")
+    return {name: values[indexes] for name, values in series.items()}
+
+def align_series(series_list, columns, how='union'):
+    """
+    Align several series on one timestamp index, the union or the intersection of their timestamps.
+    Returns (index, {column: float64 array [series, index]}). A series holds its last value between its own
+    timestamps and is NaN before its first and after its last one.
+    """
+    timestamps = [series['timestamp'] for series in series_list]
+    if not timestamps:
+        index = np.empty(0, dtype=np.int64)
+    elif how == 'intersection':
+        index = functools.reduce(np.intersect1d, timestamps)
+    else:
+        index = functools.reduce(np.union1d, timestamps)
+
+    aligned = {column: np.full((len(series_list), len(index)), np.nan) for column in columns}
+    for row, series in enumerate(series_list):
+        if not len(series['timestamp']):
+            continue
+        position = np.searchsorted(series['timestamp'], index, side='right') - 1
+        valid = (position >= 0) & (index <= series['timestamp'][-1])
+        for column in columns:
+            aligned[column][row, valid] = series[column][position[valid]]
+    return index, aligned
+
+def nullable_list(values):
+    """ A float array as a JSON-ready list with NaN as None. """
+    return np.where(np.isnan(values), None, values).tolist()
@@ -1,9 +1,10 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import BacktestViewSet
+from .views import BacktestViewSet, BacktestUploadJobViewSet
                 
 router = DefaultRouter()
 router.register(r'backtest', BacktestViewSet)
+router.register(r'backtest-jobs', BacktestUploadJobViewSet)
 
 
 urlpatterns = [
@@ -1,18 +1,31 @@
 import logging
+from django.http import HttpResponse
+from django.urls import reverse
 from rest_framework import viewsets
+from rest_framework.decorators import action
 from django.db import transaction
 from rest_framework.response import Response
 from rest_framework import status
 
-from .models import Backtest, StaticStats, Trade, Signal, PeriodTimeseriesStats, DailyTimeseriesStats
+from market_data.models import BarData
+from market_data.services import fast_values, iter_json_rows
+from .jobs import spool_backtest_upload
+from .services import backtest_prefetches, recompute_statistics, compare_backtests, filter_backtests
+from .timeseries import load_timeseries, series_rows, series_columns, downsample_series, TIMESERIES_VALUES
+from .pagination import SectionPagination, PriceDataPagination, SeriesPagination, BacktestListPagination
+from .models import Backtest, BacktestUploadJob, StaticStats, Trade, Signal, PeriodTimeseriesStats, DailyTimeseriesStats
 from .serializers import (BacktestSerializer, StaticStatsSerializer, TradeSerializer, SignalSerializer, 
-                          BacktestListSerializer, PeriodTimeseriesStatsSerializer, DailyTimeseriesStatsSerializer)
+                          BacktestListSerializer, PeriodTimeseriesStatsSerializer, DailyTimeseriesStatsSerializer,
+                          BacktestUploadJobSerializer, sparse_fields, downsample_params)
 
 logger = logging.getLogger()
 
+MAX_COMPARED_BACKTESTS = 20
+
 class BacktestViewSet(viewsets.ModelViewSet):
     queryset = Backtest.objects.all()
     serializer_class = BacktestSerializer
+    pagination_class = BacktestListPagination
 
     def get_serializer_class(self):
         action = self.action
@@ -30,18 +43,172 @@ class BacktestViewSet(viewsets.ModelViewSet):
         finally:
             logger.info("Exiting get_serializer_class")
     
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.action == 'list':
+            queryset, self.list_ordering = filter_backtests(queryset, self.request.query_params)
+        return queryset
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'retrieve':
+            queryset = queryset.prefetch_related(*backtest_prefetches(sparse_fields(self.request), timeseries=not self.request.query_params.get('max_points')))
+        return queryset
+
     # POST
     def create(self, request, *args, **kwargs):
         logger.info("Attempting to create a Backtest instance.")
+        if request.query_params.get('async', '').lower() in ('1', 'true', 'yes'):
+            return self.create_async(request)
         try:
             return super().create(request, *args, **kwargs)
         except Exception as e:
             logger.error(f"Failed to create a Backtest instance: {e}")
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
     
+    def create_async(self, request):
+        """ Store the raw upload and queue it for the worker; the payload is validated there. """
+        if request.content_type.split(';')[0].strip().lower() != 'application/json':
+            return Response({"error": "Content-Type must be application/json"}, status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+        try:
+            job = spool_backtest_upload(request.stream)
+        except Exception as e:
+            logger.error(f"Failed to spool a Backtest upload: {e}")
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        status_url = reverse('backtestuploadjob-detail', args=[job.id])
+        data = BacktestUploadJobSerializer(job).data
+        data['status_url'] = request.build_absolute_uri(status_url)
+        return Response(data, status=status.HTTP_202_ACCEPTED, headers={'Location': status_url})
+
+    def paginated_section(self, queryset, serializer_class):
+        paginator = SectionPagination()
+        page = paginator.paginate_queryset(queryset, self.request, view=self)
+        return paginator.get_paginated_response(serializer_class(page, many=True).data)
+
+    @action(detail=True, methods=['get'])
+    def trades(self, request, *args, **kwargs):
+        backtest = self.get_object()
+        logger.info(f"Retrieving trades of Backtest {backtest.id}.")
+        return self.paginated_section(Trade.objects.filter(backtest=backtest), TradeSerializer)
+
+    @action(detail=True, methods=['get'])
+    def signals(self, request, *args, **kwargs):
+        backtest = self.get_object()
+        logger.info(f"Retrieving signals of Backtest {backtest.id}.")
+        queryset = Signal.objects.filter(backtest=backtest).prefetch_related('trade_instructions')
+        return self.paginated_section(queryset, SignalSerializer)
+
+    @action(detail=True, methods=['get'])
+    def timeseries(self, request, *args, **kwargs):
+        """
+        One timeseries section, optionally limited to ?start=/?end= (inclusive timestamps).
+        ?layout=columns returns the whole range as one list per column instead of paginated rows.
+        """
+        kind = request.query_params.get('kind', 'period')
+        sections = {
+            'period': (PeriodTimeseriesStats, PeriodTimeseriesStatsSerializer),
+            'daily': (DailyTimeseriesStats, DailyTimeseriesStatsSerializer),
+        }
+        if kind not in sections:
+            return Response({"error": "kind must be one of period, daily"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            start, end = (int(request.query_params[name]) if request.query_params.get(name) else None for name in ('start', 'end'))
+        except ValueError:
+            return Response({"error": "start and end must be integer timestamps"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            max_points, method = downsample_params(request)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        backtest = self.get_object()
+        logger.info(f"Retrieving {kind} timeseries of Backtest {backtest.id} ({backtest.timeseries_storage} storage).")
+        layout = request.query_params.get('layout')
+        if layout == 'columns' or max_points:
+            series = load_timeseries(backtest, kind, start, end)
+            data = {'kind': kind, 'count': len(series['timestamp'])}
+            if max_points:
+                series = downsample_series(series, max_points, method)
+                data.update(count=len(series['timestamp']), downsampled_from=data['count'], method=method)
+            if layout == 'columns':
+                data['columns'] = series_columns(series)
+            else:
+                data['results'] = series_rows(kind, series)
+            return Response(data)
+
+        if backtest.timeseries_storage == 'columnar':
+            paginator = SeriesPagination()
+            page = paginator.paginate_series(load_timeseries(backtest, kind, start, end), request)
+            return paginator.get_paginated_response(series_rows(kind, page))
+
+        model, serializer_class = sections[kind]
+        queryset = model.objects.filter(backtest=backtest)
+        if start is not None:
+            queryset = queryset.filter(timestamp__gte=start)
+        if end is not None:
+            queryset = queryset.filter(timestamp__lte=end)
+        return self.paginated_section(queryset, serializer_class)
+
+    @action(detail=False, methods=['get'])
+    def compare(self, request, *args, **kwargs):
+        """
+        ?ids=1,2,3 side by side: static stats per backtest and the ?kind= (daily) series ?columns= (equity_value,
+        cumulative_return) aligned on the ?align=union (or intersection) of their timestamps.
+        """
+        try:
+            ids = [int(id) for id in request.query_params.get('ids', '').split(',') if id.strip()]
+        except ValueError:
+            return Response({"error": "ids must be a comma separated list of backtest ids"}, status=status.HTTP_400_BAD_REQUEST)
+        kind = request.query_params.get('kind', 'daily')
+        how = request.query_params.get('align', 'union')
+        columns = [name.strip() for name in request.query_params.get('columns', 'equity_value,cumulative_return').split(',') if name.strip()]
+        if not 1 <= len(ids) <= MAX_COMPARED_BACKTESTS:
+            return Response({"error": f"ids must name between 1 and {MAX_COMPARED_BACKTESTS} backtests"}, status=status.HTTP_400_BAD_REQUEST)
+        if kind not in ('period', 'daily') or how not in ('union', 'intersection') or not set(columns) <= set(TIMESERIES_VALUES):
+            return Response({"error": f"kind must be period or daily, align union or intersection and columns among {', '.join(TIMESERIES_VALUES)}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        backtests = Backtest.objects.in_bulk(ids)
+        missing = [id for id in ids if id not in backtests]
+        if missing:
+            return Response({"error": f"Backtests not found: {', '.join(map(str, missing))}"}, status=status.HTTP_404_NOT_FOUND)
+        logger.info(f"Comparing Backtests {ids}.")
+        return Response(compare_backtests([backtests[id] for id in ids], kind, columns, how))
+
+    @action(detail=True, methods=['post'], url_path='recompute-stats')
+    def recompute_stats(self, request, *args, **kwargs):
+        """ Recompute the static stats and daily series from the stored period equity and trades. """
+        backtest = self.get_object()
+        logger.info(f"Recomputing statistics of Backtest {backtest.id}.")
+        try:
+            static_stats, days = recompute_statistics(backtest)
+        except Exception as e:
+            logger.error(f"Failed to recompute statistics of Backtest {backtest.id}: {e}")
+            return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        return Response({'static_stats': StaticStatsSerializer(static_stats).data, 'daily_timeseries_stats': days})
+
+    @action(detail=True, methods=['get'], url_path='price-data')
+    def price_data(self, request, *args, **kwargs):
+        backtest = self.get_object()
+        logger.info(f"Retrieving price data of Backtest {backtest.id}.")
+        if backtest.test_start is None or backtest.test_end is None:
+            return Response({"error": "Backtest has no test_start/test_end window."}, status=status.HTTP_400_BAD_REQUEST)
+        queryset = BarData.objects.filter(
+            symbol__ticker__in=backtest.tickers,
+            timestamp__gte=backtest.test_start,
+            timestamp__lte=backtest.test_end,
+        )
+        paginator = PriceDataPagination()
+        page = paginator.paginate_queryset(fast_values(queryset), request, view=self)
+        return HttpResponse(paginator.get_paginated_json(iter_json_rows(BarData, page)), content_type='application/json')
+
     # GET
     def retrieve(self, request, *args, **kwargs):
         logger.info(f"Attempting to retrieve a Backtest instance with ID: {kwargs.get('pk')}")
+        try:
+            downsample_params(request)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
         try:
             return super().retrieve(request, *args, **kwargs)
         except Exception as e:
@@ -52,6 +219,8 @@ class BacktestViewSet(viewsets.ModelViewSet):
         logger.info(f"Attempting to retrieve list of Backtest instances.")
         try:
             return super().list(request, *args, **kwargs)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             logger.error(f"Failed to retrieve a list of Backtest instances.")
             return Response({"error": str(e)}, status=status.HTTP_404_NOT_FOUND)
@@ -82,6 +251,7 @@ class BacktestViewSet(viewsets.ModelViewSet):
         except Exception as e:
             logger.error(f"Failed to delete a Backtest instance: {e}")
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
-    
-
 
+class BacktestUploadJobViewSet(viewsets.ReadOnlyModelViewSet):
+    queryset = BacktestUploadJob.objects.all().order_by('-id')
+    serializer_class = BacktestUploadJobSerializer
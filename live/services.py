@@ -1,10 +1,9 @@
 import logging
 from django.db import transaction
+from django.db.models import Prefetch
 from django.core.exceptions import ValidationError
 
-from symbols.models import Symbol
-from market_data.models import BarData
-from market_data.serializers import BarDataSerializer
+from market_data.services import cached_price_data
 from .models import LiveSession, AccountSummary, Trade, Signal, TradeInstruction
 
 logger = logging.getLogger()
@@ -54,35 +53,21 @@ def create_live_session(validated_data):
         # Re-raise or handle the error as appropriate
         raise e
     
-def fetch_price_data(live_session_instance):
-    try:
-        logger.info("Starting to fetch price data for tickers: %s", live_session_instance.tickers)
-        ticker_list = live_session_instance.tickers
-        
-        # Fetching Symbol objects for each ticker
-        symbol_objs = Symbol.objects.filter(ticker__in=ticker_list)
-        if not symbol_objs.exists():
-            logger.error(f"No Symbol objects found for tickers: {ticker_list}")
-            return []
-        
-        # Filter BarData based on Symbol objects and the date range
-        price_data = BarData.objects.filter(
-            symbol__in=symbol_objs,
-            timestamp__gte=live_session_instance.test_start,
-            timestamp__lte=live_session_instance.test_end
-        ).order_by('timestamp')
-        
-        logger.info(f"Fetched {price_data.count()} price data records for live_session {live_session_instance.id}.")
-        return price_data
-    except Exception as e:
-        logger.exception(f"Failed to fetch price data for live_session {live_session_instance.id}: {str(e)}")
-        return []
-    
+def live_session_prefetches():
+    """ Ordered prefetches for the nested sections LiveSessionSerializer renders, one query per section. """
+    return [
+        Prefetch('account_data', queryset=AccountSummary.objects.order_by('id')),
+        Prefetch('trades', queryset=Trade.objects.order_by('id')),
+        Prefetch('signals', queryset=Signal.objects.order_by('id').prefetch_related(
+            Prefetch('trade_instructions', queryset=TradeInstruction.objects.order_by('id'))
+        )),
+    ]
+
 def get_price_data(live_session_instance):
+    """ Bars of the tickers over the test window, shared with every backtest and live session on the same universe and window. """
     try:
-        price_data = fetch_price_data(live_session_instance)
-        serializer = BarDataSerializer(price_data, many=True)
-        return serializer.data
+        logger.info("Fetching price data for tickers: %s", live_session_instance.tickers)
+        return cached_price_data(live_session_instance.tickers, live_session_instance.test_start, live_session_instance.test_end)
     except Exception as e:
-        logger.exception(f"Error serializing price data for live_session {live_session_instance.id}: {str(e)}")
+        logger.exception(f"Failed to fetch price data for live_session {live_session_instance.id}: {str(e)}")
         return []
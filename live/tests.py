@@ -7,7 +7,11 @@ from decimal import Decimal
 from account.models import CustomUser
 from symbols.models import Symbol, SecurityType
 from market_data.models import BarData,Symbol
-from .models import LiveSession
+from market_data.services import clear_price_data_cache
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from .models import LiveSession, Signal, TradeInstruction
 
 
 class Base(APITestCase):
@@ -20,6 +24,10 @@ class Base(APITestCase):
         self.token = Token.objects.create(user=self.user)
         self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
 
+        # Cached price data would outlive the rolled back rows of other tests
+        clear_price_data_cache()
+        cache.clear()
+
 class LiveSessionTests(Base):
     def setUp(self):
         super().setUp()
@@ -150,6 +158,26 @@ class LiveSessionTests(Base):
         self.assertIn('trades', response.data)
         self.assertIn('account_data', response.data)
 
+    def test_get_live_session_query_count_is_constant(self):
+        url = f"{self.url}{self.live_session_id}/"
+        live_session = LiveSession.objects.get(id=self.live_session_id)
+        symbol = Symbol.objects.create(ticker="HE", security_type=self.security_type)
+        with CaptureQueriesContext(connection) as baseline:
+            self.client.get(url)
+
+        for i in range(10):
+            signal = Signal.objects.create(live_session=live_session, timestamp=1704905000 + i)
+            TradeInstruction.objects.create(signal=signal, ticker="AAPL", action="BUY", trade_id=i, leg_id=1, weight=0.1)
+            BarData.objects.create(symbol=symbol, timestamp=1704905000 + i, open=1, high=1, low=1, close=1, volume=1)
+
+        # test
+        with self.assertNumQueries(len(baseline)):
+            response = self.client.get(url)
+
+        # validate
+        self.assertEqual(len(response.data['signals']), live_session.signals.count())
+        self.assertEqual(len(response.data['price_data']), 10)
+
     def test_create_live_session(self):
         # test
         response = self.client.post(self.url, data=self.live_session_data, format='json')
@@ -5,6 +5,7 @@ from rest_framework.response import Response
 
 from .models import LiveSession
 from .serializers import (LiveSessionSerializer, LiveSessionListSerializer)
+from .services import live_session_prefetches
 
 logger = logging.getLogger()
 
@@ -28,6 +29,12 @@ class LiveSessionViewSet(viewsets.ModelViewSet):
         finally:
             logger.info("Exiting get_serializer_class")
     
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'retrieve':
+            queryset = queryset.prefetch_related(*live_session_prefetches())
+        return queryset
+
     # POST
     def create(self, request, *args, **kwargs):
         logger.info("Attempting to create a LiveSession instance.")
@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class LiveSessionConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "live_session"
+
+    def ready(self):
+        from django.conf import settings
+        if settings.LIVE_SESSION_WRITE_BEHIND:
+            from .store import check_state_cache
+            check_state_cache()
@@ -0,0 +1,168 @@
+"""
+Fan-out of live session document updates to streaming subscribers.
+
+Every committed write publishes one event per document version. Subscribers are bounded asyncio queues on the
+ASGI event loop fed by the in-process bus, so a write reaches every viewer of the session served by this process
+without a query. With LIVE_SESSION_EVENT_BROKER = 'cache' events go through the Django cache instead, standing in
+for a broker between processes: each process polls it once per LIVE_SESSION_EVENT_POLL for each streamed
+session, however many viewers it has.
+
+Events are {'type': 'delta', 'kind', 'version', 'format', 'delta'} where format is merge-patch (RFC 7396),
+json-patch (RFC 6902) or replace (delta is the whole document), always relative to version - 1. A subscriber
+that falls behind gets {'type': 'resync'} and is sent the full state again; clients skip versions they have.
+"""
+import asyncio
+import logging
+import threading
+from collections import defaultdict
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+RESYNC = {'type': 'resync'}
+
+class _NotMergeable(Exception):
+    pass
+
+def _merge_diff(source, target):
+    if not isinstance(source, dict) or not isinstance(target, dict):
+        if target is None:
+            raise _NotMergeable()
+        return target
+    patch = {key: None for key in source if key not in target}
+    for key, value in target.items():
+        if key not in source or source[key] != value:
+            patch[key] = _merge_diff(source.get(key), value)
+    return patch
+
+def diff_document(source, target):
+    """ (format, delta) turning source into target: a merge patch, or replace when target holds nulls a merge patch cannot set. """
+    try:
+        return 'merge-patch', _merge_diff(source, target)
+    except _NotMergeable:
+        return 'replace', target
+
+class Subscription:
+    """ The events of one session for one stream, bounded to LIVE_SESSION_STREAM_QUEUE before it resyncs. """
+    def __init__(self, session_id, loop):
+        self.session_id = session_id
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=settings.LIVE_SESSION_STREAM_QUEUE)
+        self.behind = False
+
+    def deliver(self, event):
+        """ Queue an event from any thread. False when the subscriber's event loop is gone. """
+        if self.loop.is_closed():
+            return False
+        try:
+            self.loop.call_soon_threadsafe(self._put, event)
+        except RuntimeError: # closed since the check
+            return False
+        return True
+
+    def _put(self, event):
+        if self.behind:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESYNC)
+            self.behind = True
+
+    async def get(self):
+        event = await self.queue.get()
+        if event is RESYNC:
+            self.behind = False
+        return event
+
+class CacheBroker:
+    """ Events of a session kept in the Django cache under a sequence counter, for subscribers in other processes. """
+    prefix = 'live_session:events'
+    backlog = 1000
+
+    def publish(self, session_id, event):
+        counter = f"{self.prefix}:{session_id}"
+        cache.add(counter, 0, timeout=None)
+        sequence = cache.incr(counter)
+        cache.set(f"{counter}:{sequence}", event, timeout=settings.LIVE_SESSION_EVENT_TTL)
+
+    def cursor(self, session_id):
+        return cache.get(f"{self.prefix}:{session_id}", 0)
+
+    def read(self, session_id, cursor):
+        """ (events after cursor, new cursor); a resync when more than backlog events were missed. """
+        counter = f"{self.prefix}:{session_id}"
+        latest = cache.get(counter, 0)
+        if latest <= cursor:
+            return [], latest
+        if latest - cursor > self.backlog:
+            return [RESYNC], latest
+        keys = [f"{counter}:{sequence}" for sequence in range(cursor + 1, latest + 1)]
+        events = cache.get_many(keys)
+        if len(events) < len(keys):
+            return [RESYNC], latest
+        return [events[key] for key in keys], latest
+
+class SessionEventBus:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscriptions = defaultdict(set)
+        self.pollers = {}
+
+    @property
+    def broker(self):
+        return CacheBroker() if settings.LIVE_SESSION_EVENT_BROKER == 'cache' else None
+
+    def subscribe(self, session_id):
+        """ A Subscription on the running event loop. """
+        loop = asyncio.get_running_loop()
+        subscription = Subscription(session_id, loop)
+        with self.lock:
+            self.subscriptions[session_id].add(subscription)
+            if self.broker is not None and session_id not in self.pollers:
+                self.pollers[session_id] = loop.create_task(self._poll(session_id))
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            subscriptions = self.subscriptions.get(subscription.session_id, set())
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                self.subscriptions.pop(subscription.session_id, None)
+                poller = self.pollers.pop(subscription.session_id, None)
+                if poller is not None and not poller.get_loop().is_closed():
+                    poller.cancel()
+
+    def publish(self, session_id, event):
+        broker = self.broker
+        if broker is not None:
+            broker.publish(session_id, event)
+        else:
+            self.deliver(session_id, event)
+
+    def deliver(self, session_id, event):
+        with self.lock:
+            subscriptions = list(self.subscriptions.get(session_id, ()))
+        for subscription in subscriptions:
+            if not subscription.deliver(event):
+                logger.warning(f"Dropped a stream of session {session_id} whose event loop is closed.")
+                self.unsubscribe(subscription)
+
+    async def _poll(self, session_id):
+        broker = self.broker
+        cursor = await sync_to_async(broker.cursor)(session_id)
+        while True:
+            await asyncio.sleep(settings.LIVE_SESSION_EVENT_POLL)
+            try:
+                events, cursor = await sync_to_async(broker.read)(session_id, cursor)
+            except Exception as e:
+                logger.error(f"Failed to read events of session {session_id} from the cache: {e}")
+                continue
+            for event in events:
+                self.deliver(session_id, event)
+
+session_events = SessionEventBus()
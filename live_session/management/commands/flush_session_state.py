@@ -0,0 +1,21 @@
+import time
+from django.db import close_old_connections
+from django.core.management.base import BaseCommand
+
+from live_session.store import flush
+
+class Command(BaseCommand):
+    help = "Write live session documents held by the write-behind store to the database."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--session', type=int, help="Only flush this session")
+        parser.add_argument('--interval', type=float, help="Keep flushing every this many seconds instead of once")
+
+    def handle(self, *args, **options):
+        while True:
+            close_old_connections()
+            flushed = flush(options['session'])
+            self.stdout.write(f"Flushed {flushed} live session documents.")
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,54 @@
+# Generated by Django 5.0 on 2026-10-18 12:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('live_session', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='account',
+            name='version',
+            field=models.BigIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='marketdata',
+            name='version',
+            field=models.BigIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='version',
+            field=models.BigIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='position',
+            name='version',
+            field=models.BigIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='risk',
+            name='version',
+            field=models.BigIntegerField(default=1),
+        ),
+        migrations.CreateModel(
+            name='StateSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=20)),
+                ('version', models.BigIntegerField()),
+                ('codec', models.CharField(max_length=10)),
+                ('data', models.BinaryField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='live_session.session')),
+            ],
+            options={
+                'unique_together': {('session', 'kind', 'version')},
+            },
+        ),
+    ]
@@ -10,20 +10,36 @@ class Session(models.Model):
 class Position(models.Model):
     session = models.OneToOneField(Session, related_name='positions', on_delete=models.CASCADE)
     data = JSONField()  
+    version = models.BigIntegerField(default=1) # bumped on every write, see live_session.services
 
 class Account(models.Model):
     session = models.OneToOneField(Session, related_name='account', on_delete=models.CASCADE)
     data = JSONField()  
+    version = models.BigIntegerField(default=1)
 
 class Order(models.Model):
     session = models.OneToOneField(Session, related_name='orders', on_delete=models.CASCADE)
     data = JSONField()  
+    version = models.BigIntegerField(default=1)
 
 class Risk(models.Model):
     session = models.OneToOneField(Session, related_name='risk', on_delete=models.CASCADE)
     data = JSONField()  
+    version = models.BigIntegerField(default=1)
 
 class MarketData(models.Model):
     session = models.OneToOneField(Session, related_name='market_data', on_delete=models.CASCADE)
     data = JSONField()  
-
+    version = models.BigIntegerField(default=1)
+
+class StateSnapshot(models.Model):
+    """ One version of a session document, kept for the last LIVE_SESSION_STATE_HISTORY writes of its kind. """
+    session = models.ForeignKey(Session, related_name='snapshots', on_delete=models.CASCADE)
+    kind = models.CharField(max_length=20) # positions, account, orders, risk or market_data
+    version = models.BigIntegerField()
+    codec = models.CharField(max_length=10) # msgpack, or json+zlib for documents msgpack cannot encode
+    data = models.BinaryField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('session', 'kind', 'version')
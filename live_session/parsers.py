@@ -0,0 +1,12 @@
+from rest_framework.parsers import JSONParser
+from rest_framework.settings import api_settings
+
+from .patch import JSON_PATCH_MEDIA_TYPE, MERGE_PATCH_MEDIA_TYPE
+
+class JSONPatchParser(JSONParser):
+    media_type = JSON_PATCH_MEDIA_TYPE
+
+class MergePatchParser(JSONParser):
+    media_type = MERGE_PATCH_MEDIA_TYPE
+
+DOCUMENT_PARSER_CLASSES = [*api_settings.DEFAULT_PARSER_CLASSES, JSONPatchParser, MergePatchParser]
@@ -0,0 +1,123 @@
+"""
+JSON Patch (RFC 6902) and JSON Merge Patch (RFC 7396) for live session documents.
+"""
+import copy
+
+JSON_PATCH_MEDIA_TYPE = 'application/json-patch+json'
+MERGE_PATCH_MEDIA_TYPE = 'application/merge-patch+json'
+PATCH_OPERATIONS = ('add', 'remove', 'replace', 'move', 'copy', 'test')
+
+class PatchError(ValueError):
+    """ A malformed patch, or one that does not apply to the document (RFC 6902 error handling). """
+
+def parse_pointer(pointer):
+    """ Reference tokens of a JSON Pointer (RFC 6901), '' being the whole document. """
+    if not isinstance(pointer, str) or (pointer and not pointer.startswith('/')):
+        raise PatchError(f"Invalid JSON pointer: {pointer!r}")
+    if not pointer:
+        return []
+    return [token.replace('~1', '/').replace('~0', '~') for token in pointer[1:].split('/')]
+
+def validate_operations(operations):
+    """ Check the shape of a JSON Patch document. Returns the operations with their paths parsed. """
+    if not isinstance(operations, list):
+        raise PatchError("A JSON Patch must be an array of operations.")
+    parsed = []
+    for operation in operations:
+        if not isinstance(operation, dict) or operation.get('op') not in PATCH_OPERATIONS:
+            raise PatchError(f"Invalid operation: {operation!r}")
+        if operation['op'] in ('add', 'replace', 'test') and 'value' not in operation:
+            raise PatchError(f"Operation {operation['op']} needs a value.")
+        item = dict(operation, path=parse_pointer(operation.get('path')))
+        if operation['op'] in ('move', 'copy'):
+            item['from'] = parse_pointer(operation.get('from'))
+        parsed.append(item)
+    return parsed
+
+def _array_index(container, token, allow_end=False):
+    if allow_end and token == '-':
+        return len(container)
+    if not token.isdigit() or (token != '0' and token.startswith('0')):
+        raise PatchError(f"Invalid array index: {token}")
+    index = int(token)
+    if index > len(container) or (index == len(container) and not allow_end):
+        raise PatchError(f"Array index out of range: {token}")
+    return index
+
+def _parent(document, path):
+    target = document
+    for token in path[:-1]:
+        if isinstance(target, list):
+            target = target[_array_index(target, token)]
+        elif isinstance(target, dict) and token in target:
+            target = target[token]
+        else:
+            raise PatchError(f"Path not found: /{'/'.join(path)}")
+    return target
+
+def _get(document, path):
+    if not path:
+        return document
+    parent, token = _parent(document, path), path[-1]
+    if isinstance(parent, list):
+        return parent[_array_index(parent, token)]
+    if isinstance(parent, dict) and token in parent:
+        return parent[token]
+    raise PatchError(f"Path not found: /{'/'.join(path)}")
+
+def _add(document, path, value):
+    if not path:
+        return value
+    parent, token = _parent(document, path), path[-1]
+    if isinstance(parent, list):
+        parent.insert(_array_index(parent, token, allow_end=True), value)
+    elif isinstance(parent, dict):
+        parent[token] = value
+    else:
+        raise PatchError(f"Path not found: /{'/'.join(path)}")
+    return document
+
+def _remove(document, path):
+    if not path:
+        raise PatchError("Cannot remove the whole document.")
+    _get(document, path)
+    parent, token = _parent(document, path), path[-1]
+    if isinstance(parent, list):
+        del parent[_array_index(parent, token)]
+    else:
+        del parent[token]
+    return document
+
+def apply_json_patch(document, operations):
+    """ The document with a JSON Patch applied; the input is left unchanged. Raises PatchError. """
+    document = copy.deepcopy(document)
+    for operation in validate_operations(operations):
+        op, path = operation['op'], operation['path']
+        if op == 'add':
+            document = _add(document, path, copy.deepcopy(operation['value']))
+        elif op == 'remove':
+            document = _remove(document, path)
+        elif op == 'replace':
+            document = _add(_remove(document, path), path, copy.deepcopy(operation['value'])) if path else copy.deepcopy(operation['value'])
+        elif op == 'move':
+            if path[:len(operation['from'])] == operation['from'] and path != operation['from']:
+                raise PatchError("Cannot move a value into one of its children.")
+            value = _get(document, operation['from'])
+            document = _add(_remove(document, operation['from']), path, value)
+        elif op == 'copy':
+            document = _add(document, path, copy.deepcopy(_get(document, operation['from'])))
+        elif _get(document, path) != operation['value']:
+            raise PatchError(f"Test failed at /{'/'.join(path)}")
+    return document
+
+def apply_merge_patch(target, patch):
+    """ The target with a JSON Merge Patch applied (null removes a member); the input is left unchanged. """
+    if not isinstance(patch, dict):
+        return copy.deepcopy(patch)
+    result = copy.deepcopy(target) if isinstance(target, dict) else {}
+    for key, value in patch.items():
+        if value is None:
+            result.pop(key, None)
+        else:
+            result[key] = apply_merge_patch(result.get(key), value)
+    return result
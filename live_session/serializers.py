@@ -9,32 +9,32 @@ class CreateSessionSerializer(serializers.ModelSerializer):
 class PositionSerializer(serializers.ModelSerializer):
     class Meta:
         model = Position
-        fields = ['id', 'session', 'data']
-        extra_kwargs = {'session': {'read_only': True}}
+        fields = ['id', 'session', 'data', 'version']
+        extra_kwargs = {'session': {'read_only': True}, 'version': {'read_only': True}}
 
 class AccountSerializer(serializers.ModelSerializer):
     class Meta:
         model = Account
-        fields = ['id', 'session', 'data']
-        extra_kwargs = {'session': {'read_only': True}}
+        fields = ['id', 'session', 'data', 'version']
+        extra_kwargs = {'session': {'read_only': True}, 'version': {'read_only': True}}
 
 class OrderSerializer(serializers.ModelSerializer):
     class Meta:
         model = Order
-        fields = ['id', 'session', 'data']
-        extra_kwargs = {'session': {'read_only': True}}
+        fields = ['id', 'session', 'data', 'version']
+        extra_kwargs = {'session': {'read_only': True}, 'version': {'read_only': True}}
 
 class RiskSerializer(serializers.ModelSerializer):
     class Meta:
         model = Risk
-        fields = ['id', 'session', 'data']
-        extra_kwargs = {'session': {'read_only': True}}
+        fields = ['id', 'session', 'data', 'version']
+        extra_kwargs = {'session': {'read_only': True}, 'version': {'read_only': True}}
 
 class MarketDataSerializer(serializers.ModelSerializer):
     class Meta:
         model = MarketData
-        fields = ['id', 'session', 'data']
-        extra_kwargs = {'session': {'read_only': True}}
+        fields = ['id', 'session', 'data', 'version']
+        extra_kwargs = {'session': {'read_only': True}, 'version': {'read_only': True}}
 
 class SessionDetailSerializer(serializers.ModelSerializer):
     positions = PositionSerializer(read_only=True)
@@ -46,3 +46,23 @@ class SessionDetailSerializer(serializers.ModelSerializer):
     class Meta:
         model = Session
         fields = ['session_id', 'positions', 'account', 'orders', 'risk', 'market_data']
+
+class DocumentWriteSerializer(serializers.Serializer):
+    data = serializers.JSONField()
+    version = serializers.IntegerField(required=False, help_text="Expected current version, like If-Match")
+
+class SessionSnapshotSerializer(serializers.Serializer):
+    """ Any subset of a session's documents, written together by POST/PUT /sessions/{id}/snapshot/. """
+    positions = DocumentWriteSerializer(required=False)
+    account = DocumentWriteSerializer(required=False)
+    orders = DocumentWriteSerializer(required=False)
+    risk = DocumentWriteSerializer(required=False)
+    market_data = DocumentWriteSerializer(required=False)
+
+    def validate(self, attrs):
+        unknown = set(self.initial_data) - set(self.fields) if isinstance(self.initial_data, dict) else set()
+        if unknown:
+            raise serializers.ValidationError(f"Unknown documents: {', '.join(sorted(unknown))}")
+        if not attrs:
+            raise serializers.ValidationError("No documents given.")
+        return attrs
@@ -0,0 +1,268 @@
+import re
+import json
+import zlib
+import logging
+import msgpack
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.core.exceptions import ObjectDoesNotExist
+
+from .models import Session, Position, Account, Order, Risk, MarketData, StateSnapshot
+from .events import session_events, diff_document
+from .patch import JSON_PATCH_MEDIA_TYPE, PatchError, validate_operations, apply_json_patch, apply_merge_patch
+
+logger = logging.getLogger(__name__)
+
+DOCUMENT_MODELS = {
+    'positions': Position,
+    'account': Account,
+    'orders': Order,
+    'risk': Risk,
+    'market_data': MarketData,
+}
+
+class VersionConflict(Exception):
+    """ A version-checked write named a version other than the document's current one. """
+    def __init__(self, version):
+        super().__init__(f"Version conflict, the current version is {version}.")
+        self.version = version
+
+def parse_if_match(request):
+    """ Expected document version from an If-Match header ("3", "\"3\"" or W/"3"), None when absent. Raises ValueError. """
+    value = request.headers.get('If-Match')
+    if not value:
+        return None
+    value = value.strip()
+    if value.startswith('W/'):
+        value = value[2:]
+    try:
+        return int(value.strip('"'))
+    except ValueError:
+        raise ValueError("If-Match must be a document version")
+
+def encode_state(data):
+    """ (codec, bytes) of a JSON document: msgpack, or zlib-compressed JSON for integers msgpack cannot hold (beyond 64 bits). """
+    try:
+        return 'msgpack', msgpack.packb(data, use_bin_type=True)
+    except OverflowError:
+        return 'json+zlib', zlib.compress(json.dumps(data, separators=(',', ':')).encode())
+
+def decode_state(codec, blob):
+    if codec == 'msgpack':
+        return msgpack.unpackb(bytes(blob), raw=False)
+    return json.loads(zlib.decompress(bytes(blob)))
+
+def append_snapshot(document, kind):
+    """ Store the document's current version in the history and drop versions beyond LIVE_SESSION_STATE_HISTORY. """
+    codec, blob = encode_state(document.data)
+    StateSnapshot.objects.create(session_id=document.session_id, kind=kind, version=document.version, codec=codec, data=blob)
+    StateSnapshot.objects.filter(
+        session_id=document.session_id, kind=kind, version__lte=document.version - settings.LIVE_SESSION_STATE_HISTORY
+    ).delete()
+
+def publish_update(document, kind, delta_format='replace', delta=None):
+    """ Send a document's new version to its session's streams once the write commits (see live_session.events). """
+    event = {
+        'type': 'delta',
+        'kind': kind,
+        'version': document.version,
+        'format': delta_format,
+        'delta': document.data if delta_format == 'replace' else delta,
+    }
+    transaction.on_commit(lambda: session_events.publish(document.session_id, event), robust=True)
+
+def write_document(document, kind, data, expected_version=None):
+    """
+    Replace a session document and record the new version. With expected_version the write only applies if the
+    document is still at that version (compare-and-set in the UPDATE), otherwise VersionConflict is raised.
+    Updates document in place and returns the new version.
+    """
+    model = type(document)
+    base_version, base_data = document.version, document.data
+    with transaction.atomic():
+        documents = model.objects.filter(pk=document.pk)
+        if expected_version is not None:
+            documents = documents.filter(version=expected_version)
+        if not documents.update(data=data, version=F('version') + 1):
+            raise VersionConflict(model.objects.filter(pk=document.pk).values_list('version', flat=True).first())
+        document.data = data
+        document.version = model.objects.values_list('version', flat=True).get(pk=document.pk)
+        append_snapshot(document, kind)
+        if document.version == base_version + 1:
+            publish_update(document, kind, *diff_document(base_data, data))
+        else:
+            publish_update(document, kind)
+    logger.info(f"Wrote {kind} version {document.version} of session {document.session_id}.")
+    return document.version
+
+def document_state(session_id, kind, since=None):
+    """
+    Latest version of a session document ({'version', 'data'}), or with since the snapshots after that version,
+    oldest first, decoding only those. complete is False when the history no longer reaches back to since.
+    """
+    document = DOCUMENT_MODELS[kind].objects.filter(session_id=session_id).values('version', 'data').first()
+    if document is None:
+        return None
+    if since is None:
+        return {'kind': kind, 'version': document['version'], 'data': document['data']}
+
+    snapshots = list(
+        StateSnapshot.objects.filter(session_id=session_id, kind=kind, version__gt=since)
+        .order_by('version').values_list('version', 'codec', 'data', 'created_at')
+    )
+    complete = since >= document['version'] or (bool(snapshots) and snapshots[0][0] == since + 1)
+    return {
+        'kind': kind,
+        'version': document['version'],
+        'complete': complete,
+        'snapshots': [
+            {'version': version, 'data': decode_state(codec, blob), 'created_at': created_at}
+            for version, codec, blob, created_at in snapshots
+        ],
+    }
+
+PATCH_ATTEMPTS = 3
+_PLAIN_INDEX = re.compile(r'^(0|[1-9][0-9]*)$')
+
+def _jsonb_json_patch(operations):
+    """
+    (expression, params, conditions, condition_params) applying parsed JSON Patch operations with jsonb_set and #-,
+    the conditions holding exactly when every operation applies. None when an operation needs the Python path
+    (move, copy, array inserts, whole-document targets).
+    """
+    expression, params = 'data', []
+    conditions, condition_params = [], []
+    for operation in operations:
+        op, path = operation['op'], operation['path']
+        if not path or op in ('move', 'copy') or any(token.startswith('-') or (token[:1].isdigit() and not _PLAIN_INDEX.match(token)) for token in path):
+            return None
+        if op == 'add' and (path[-1] == '-' or _PLAIN_INDEX.match(path[-1])):
+            return None
+
+        if op == 'test':
+            conditions.append(f"({expression}) #> %s::text[] = %s::jsonb")
+            condition_params += params + [path, json.dumps(operation['value'])]
+            continue
+        if op == 'add':
+            conditions.append(f"jsonb_typeof(({expression}) #> %s::text[]) = 'object'")
+            condition_params += params + [path[:-1]]
+        else:
+            conditions.append(f"({expression}) #> %s::text[] IS NOT NULL")
+            condition_params += params + [path]
+        if op == 'remove':
+            expression, params = f"({expression}) #- %s::text[]", params + [path]
+        else:
+            expression, params = f"jsonb_set({expression}, %s::text[], %s::jsonb, true)", params + [path, json.dumps(operation['value'])]
+    return expression, params, conditions, condition_params
+
+def _jsonb_merge_patch(patch):
+    """ The same for a merge patch that only sets or removes top-level members; None when it nests. """
+    if not isinstance(patch, dict) or any(isinstance(value, dict) for value in patch.values()):
+        return None
+    values = {key: value for key, value in patch.items() if value is not None}
+    removed = [key for key, value in patch.items() if value is None]
+    return "(data || %s::jsonb) - %s::text[]", [json.dumps(values), removed], ["jsonb_typeof(data) = 'object'"], []
+
+def _patch_in_database(document, patch, media_type, expected_version):
+    """ Apply the patch with one UPDATE ... RETURNING on PostgreSQL. Returns (version, data), or None to fall back. """
+    statement = _jsonb_json_patch(patch) if media_type == JSON_PATCH_MEDIA_TYPE else _jsonb_merge_patch(patch)
+    if statement is None:
+        return None
+    expression, params, conditions, condition_params = statement
+    conditions = ['id = %s'] + (['version = %s'] if expected_version is not None else []) + conditions
+    condition_params = [document.pk] + ([expected_version] if expected_version is not None else []) + condition_params
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"UPDATE {type(document)._meta.db_table} SET data = {expression}, version = version + 1 "
+            f"WHERE {' AND '.join(conditions)} RETURNING version, data",
+            params + condition_params,
+        )
+        row = cursor.fetchone()
+    if row is None:
+        return None
+    return row[0], json.loads(row[1]) if isinstance(row[1], (str, bytes)) else row[1]
+
+def patch_document(document, kind, patch, media_type, expected_version=None):
+    """
+    Apply a JSON Patch (RFC 6902) or JSON Merge Patch (RFC 7396) to a session document server-side, so a writer only
+    sends what changed. With expected_version the patch only applies to that version, otherwise VersionConflict is
+    raised; without it the patch applies to the current version. Raises PatchError when the patch is malformed or
+    does not apply. Updates document in place and returns the new version.
+
+    On PostgreSQL, patches that map onto jsonb_set/#- (add, replace, remove and test on object members, top-level
+    merge patches) run as a single guarded UPDATE; anything else, or a guard that fails, goes through the read,
+    apply and compare-and-set path, which also produces the precise error.
+    """
+    if media_type == JSON_PATCH_MEDIA_TYPE:
+        operations = validate_operations(patch)
+    elif not isinstance(patch, dict):
+        raise PatchError("A merge patch must be a JSON object.")
+
+    model = type(document)
+    if connection.vendor == 'postgresql':
+        with transaction.atomic():
+            patched = _patch_in_database(document, operations if media_type == JSON_PATCH_MEDIA_TYPE else patch, media_type, expected_version)
+            if patched is not None:
+                document.version, document.data = patched
+                append_snapshot(document, kind)
+                publish_update(document, kind, 'json-patch' if media_type == JSON_PATCH_MEDIA_TYPE else 'merge-patch', patch)
+        if patched is not None:
+            logger.info(f"Patched {kind} to version {document.version} of session {document.session_id} in the database.")
+            return document.version
+
+    for attempt in range(PATCH_ATTEMPTS):
+        current = model.objects.filter(pk=document.pk).values('version', 'data').first()
+        if expected_version is not None and current['version'] != expected_version:
+            raise VersionConflict(current['version'])
+        if media_type == JSON_PATCH_MEDIA_TYPE:
+            data = apply_json_patch(current['data'], patch)
+        else:
+            data = apply_merge_patch(current['data'], patch)
+        document.version, document.data = current['version'], current['data']
+        try:
+            return write_document(document, kind, data, current['version'])
+        except VersionConflict:
+            if expected_version is not None or attempt == PATCH_ATTEMPTS - 1:
+                raise
+            logger.info(f"Retrying {kind} patch of session {document.session_id} after a concurrent write.")
+
+def session_state(session_id):
+    """ {kind: {'version', 'data'}} of the session's existing documents. """
+    session = load_session(session_id)
+    documents = [(kind, session_document(session, kind)) for kind in DOCUMENT_MODELS] if session else []
+    return {kind: {'version': document.version, 'data': document.data} for kind, document in documents if document is not None}
+
+def load_session(session_id):
+    """ A session with all its documents in one joined query (the document related names are the kinds), None when missing. """
+    return Session.objects.select_related(*DOCUMENT_MODELS).filter(session_id=session_id).first()
+
+def session_document(session, kind):
+    """ A document of a session loaded by load_session, None when the session has none. """
+    try:
+        return getattr(session, kind)
+    except ObjectDoesNotExist:
+        return None
+
+def write_session_snapshot(session, documents):
+    """
+    Write several documents of a session loaded by load_session in one transaction: {kind: {'data', 'version'}},
+    version being optional and checked like If-Match. Existing documents are updated through write_document,
+    missing ones created. A VersionConflict rolls back every document. Returns {kind: new version}.
+    """
+    versions = {}
+    with transaction.atomic():
+        for kind, document in documents.items():
+            instance = session_document(session, kind)
+            if instance is None:
+                if document.get('version') not in (None, 0):
+                    raise VersionConflict(0)
+                instance = DOCUMENT_MODELS[kind].objects.create(session=session, data=document['data'])
+                append_snapshot(instance, kind)
+                publish_update(instance, kind)
+                setattr(session, kind, instance)
+            else:
+                write_document(instance, kind, document['data'], document.get('version'))
+            versions[kind] = instance.version
+    logger.info(f"Wrote {', '.join(versions)} of session {session.session_id} in one transaction.")
+    return versions
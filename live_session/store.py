@@ -0,0 +1,199 @@
+"""
+Write-behind store for hot live session documents.
+
+With LIVE_SESSION_WRITE_BEHIND on, document writes update the copy held in the LIVE_SESSION_STATE_CACHE cache and
+reads are served from it. A document is written to the database when a write finds its last flush at least
+LIVE_SESSION_FLUSH_INTERVAL seconds old, on POST /sessions/{id}/flush/ (session close), and by the
+flush_session_state management command, which also catches documents that stopped receiving writes. However many
+writes a document takes, the database sees at most one UPDATE (and one snapshot) per interval.
+
+Durability: a write is acknowledged once it is in the cache. Writes newer than the last flush are lost if the
+cache loses the entry (restart, eviction), so that is at most LIVE_SESSION_FLUSH_INTERVAL of updates for a
+document under continuous writes, or everything since the last flush when nothing flushes a document that went
+quiet; run flush_session_state --interval to bound that too. A lost entry is reloaded from the database at the
+flushed version, and writers holding a later version then get a 409 and resync. The cache must be shared by
+every worker and held in memory: Redis or Memcached under a dedicated alias. The database cache would turn every
+write into several database writes of the whole pickled document, and LocMemCache is not shared between
+processes, so startup fails with either (check_state_cache). State snapshots (live_session.services) record
+flushed versions only; stream events are sent for every write.
+"""
+import time
+import uuid
+import logging
+from types import SimpleNamespace
+from contextlib import ExitStack, contextmanager
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+
+from .events import diff_document
+from .models import Session
+from .services import (DOCUMENT_MODELS, VersionConflict, append_snapshot, publish_update, load_session,
+                       session_state as stored_session_state, write_session_snapshot as store_session_snapshot)
+
+logger = logging.getLogger(__name__)
+
+LOCK_TIMEOUT = 5
+LOCK_WAIT = 0.001
+
+def write_behind_enabled():
+    return settings.LIVE_SESSION_WRITE_BEHIND
+
+UNSUITABLE_CACHE_BACKENDS = (
+    'django.core.cache.backends.db.DatabaseCache',
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+    'django.core.cache.backends.filebased.FileBasedCache',
+)
+
+def check_state_cache():
+    """ Raise ImproperlyConfigured unless LIVE_SESSION_STATE_CACHE is a shared in-memory cache; called at startup with write-behind on. """
+    alias = settings.LIVE_SESSION_STATE_CACHE
+    backend = settings.CACHES.get(alias, {}).get('BACKEND')
+    if backend is None or backend in UNSUITABLE_CACHE_BACKENDS:
+        raise ImproperlyConfigured(
+            f"LIVE_SESSION_WRITE_BEHIND needs LIVE_SESSION_STATE_CACHE to name a shared in-memory cache (Redis or Memcached), "
+            f"'{alias}' uses {backend}."
+        )
+
+def state_cache():
+    return caches[settings.LIVE_SESSION_STATE_CACHE]
+
+def _key(session_id, kind):
+    return f"live_session:state:{session_id}:{kind}"
+
+@contextmanager
+def document_lock(session_id, kind):
+    """ Serialize writers of one document across workers with an add-only cache key. """
+    key, token = f"{_key(session_id, kind)}:lock", uuid.uuid4().hex
+    deadline = time.monotonic() + LOCK_TIMEOUT
+    while not state_cache().add(key, token, timeout=LOCK_TIMEOUT):
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"Timed out waiting for the {kind} lock of session {session_id}.")
+        time.sleep(LOCK_WAIT)
+    try:
+        yield
+    finally:
+        if state_cache().get(key) == token:
+            state_cache().delete(key)
+
+def load_document(session_id, kind):
+    """ The cached entry of a document ({'id', 'session_id', 'version', 'data', 'flushed_version', 'flushed_at'}), loaded from the database on a miss. None when there is no document. """
+    entry = state_cache().get(_key(session_id, kind))
+    if entry is None:
+        entry = DOCUMENT_MODELS[kind].objects.filter(session_id=session_id).values('id', 'session_id', 'version', 'data').first()
+        if entry is None:
+            return None
+        entry.update(flushed_version=entry['version'], flushed_at=time.time())
+        state_cache().add(_key(session_id, kind), entry, timeout=None)
+    return entry
+
+def document_response(entry):
+    """ An entry in the document serializers' shape. """
+    return {'id': entry['id'], 'session': entry['session_id'], 'data': entry['data'], 'version': entry['version']}
+
+def write_document(session_id, kind, update, expected_version=None):
+    """
+    Apply update(data) -> new data to the cached document and bump its version; with expected_version only if
+    the document is still at that version, otherwise VersionConflict is raised. Flushes the document when its
+    last flush is older than LIVE_SESSION_FLUSH_INTERVAL. Returns the entry, None when there is no document.
+    """
+    with document_lock(session_id, kind):
+        entry = load_document(session_id, kind)
+        if entry is None:
+            return None
+        if expected_version is not None and entry['version'] != expected_version:
+            raise VersionConflict(entry['version'])
+        delta = _apply_update(kind, entry, update)
+    publish_update(SimpleNamespace(**entry), kind, *delta)
+    return entry
+
+def _apply_update(kind, entry, update):
+    """ Write the next version of a locked entry, flushing it when due. Returns the (format, delta) to publish. """
+    data = update(entry['data'])
+    delta = diff_document(entry['data'], data)
+    entry.update(data=data, version=entry['version'] + 1)
+    if time.time() - entry['flushed_at'] >= settings.LIVE_SESSION_FLUSH_INTERVAL:
+        flush_entry(kind, entry)
+    state_cache().set(_key(entry['session_id'], kind), entry, timeout=None)
+    return delta
+
+def flush_entry(kind, entry):
+    """ Write a cached document to the database if it is newer there, never moving the stored version back. """
+    if entry['version'] > entry['flushed_version']:
+        document = SimpleNamespace(**entry)
+        with transaction.atomic():
+            if DOCUMENT_MODELS[kind].objects.filter(pk=entry['id'], version__lt=entry['version']).update(data=entry['data'], version=entry['version']):
+                append_snapshot(document, kind)
+        logger.info(f"Flushed {kind} version {entry['version']} of session {entry['session_id']} ({entry['version'] - entry['flushed_version']} writes).")
+    entry.update(flushed_version=entry['version'], flushed_at=time.time())
+
+def flush(session_id=None):
+    """ Write every cached document with unflushed versions (of one session, or all) to the database. Returns how many were written. """
+    flushed = 0
+    for kind, model in DOCUMENT_MODELS.items():
+        sessions = [session_id] if session_id is not None else model.objects.values_list('session_id', flat=True)
+        keys = {_key(session, kind): session for session in sessions}
+        for key, entry in state_cache().get_many(list(keys)).items():
+            if entry['version'] <= entry['flushed_version']:
+                continue
+            with document_lock(keys[key], kind):
+                entry = state_cache().get(key)
+                if entry is not None and entry['version'] > entry['flushed_version']:
+                    flush_entry(kind, entry)
+                    state_cache().set(key, entry, timeout=None)
+                    flushed += 1
+    return flushed
+
+def evict(session_id, kind=None):
+    """ Drop cached documents without writing them, for documents or sessions being deleted. """
+    if settings.LIVE_SESSION_STATE_CACHE not in settings.CACHES:
+        return
+    state_cache().delete_many([_key(session_id, kind) for kind in ([kind] if kind else DOCUMENT_MODELS)])
+
+def cached_documents(session_id):
+    """ {kind: entry} of the session's documents currently in the store. """
+    entries = state_cache().get_many([_key(session_id, kind) for kind in DOCUMENT_MODELS])
+    return {kind: entries[_key(session_id, kind)] for kind in DOCUMENT_MODELS if _key(session_id, kind) in entries}
+
+def session_state(session_id):
+    """ {kind: {'version', 'data'}} of the session's documents, cached versions first. """
+    entries = cached_documents(session_id)
+    state = stored_session_state(session_id) if len(entries) < len(DOCUMENT_MODELS) else {}
+    for kind, entry in entries.items():
+        state[kind] = {'version': entry['version'], 'data': entry['data']}
+    return state
+
+def write_session_snapshot(session_id, documents):
+    """
+    The write-behind counterpart of services.write_session_snapshot. The documents are locked in DOCUMENT_MODELS
+    order and every expected version is checked before anything is written, so a VersionConflict leaves all of
+    them unchanged. Missing documents are created in the database, the only case needing the session lookup.
+    Raises Session.DoesNotExist. Returns {kind: new version}.
+    """
+    kinds = [kind for kind in DOCUMENT_MODELS if kind in documents]
+    versions, deltas = {}, {}
+    with ExitStack() as locks:
+        for kind in kinds:
+            locks.enter_context(document_lock(session_id, kind))
+        entries = {kind: load_document(session_id, kind) for kind in kinds}
+        for kind in kinds:
+            current = entries[kind]['version'] if entries[kind] is not None else 0
+            expected = documents[kind].get('version')
+            if expected is not None and expected != current:
+                raise VersionConflict(current)
+
+        missing = {kind: documents[kind] for kind in kinds if entries[kind] is None}
+        if missing:
+            session = load_session(session_id)
+            if session is None:
+                raise Session.DoesNotExist(f"Session {session_id} not found.")
+            versions.update(store_session_snapshot(session, missing))
+        for kind in kinds:
+            if entries[kind] is not None:
+                deltas[kind] = _apply_update(kind, entries[kind], lambda data, document=documents[kind]: document['data'])
+                versions[kind] = entries[kind]['version']
+    for kind, delta in deltas.items():
+        publish_update(SimpleNamespace(**entries[kind]), kind, *delta)
+    return versions
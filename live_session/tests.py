@@ -1,4 +1,6 @@
 import json
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.authtoken.models import Token
@@ -7,7 +9,20 @@ from decimal import Decimal
 from account.models import CustomUser
 from symbols.models import Symbol, SecurityType
 from market_data.models import BarData,Symbol
-from .models import Session, Position, Account, Order, Risk, MarketData
+from django.test import override_settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.core.management import call_command
+from io import StringIO
+from .models import Session, Position, Account, Order, Risk, MarketData, StateSnapshot
+from .services import encode_state, decode_state, load_session, _jsonb_json_patch, _jsonb_merge_patch
+from unittest import skipUnless
+from .store import check_state_cache
+from django.core.exceptions import ImproperlyConfigured
+from .serializers import SessionDetailSerializer
+from .patch import PatchError, apply_json_patch, apply_merge_patch, validate_operations
+from .events import CacheBroker, RESYNC, diff_document, session_events
+import asyncio
 
 #TODO: Risk and MarketData
 
@@ -325,3 +340,323 @@ class SessionViewSetTests(Base):
         self.assertEqual(Account.objects.count(), 1)
         self.assertEqual(Account.objects.last().data["FullAvailableFunds"], 777777)
     
+
+    def test_versioned_position_writes(self):
+        url = f"{self.url}{self.session.session_id}/positions/"
+        state_url = f"{self.url}{self.session.session_id}/state/positions/"
+        data = lambda action: {"data": dict(self.positon_data["data"], action=action)}
+
+        # test
+        first = self.client.put(url, data=data("SELL"), format='json', HTTP_IF_MATCH='"1"')
+        stale = self.client.put(url, data=data("HOLD"), format='json', HTTP_IF_MATCH='"1"')
+        unchecked = self.client.put(url, data=data("BUY"), format='json')
+        invalid = self.client.put(url, data=data("BUY"), format='json', HTTP_IF_MATCH='latest')
+        latest = self.client.get(state_url)
+        since = self.client.get(state_url, {'since': 1})
+
+        # validate
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertEqual(first.data['version'], 2)
+        self.assertEqual(stale.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(stale.data['version'], 2)
+        self.assertEqual(unchecked.data['version'], 3)
+        self.assertEqual(invalid.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Position.objects.get().data["action"], "BUY")
+        self.assertEqual((latest.data['version'], latest.data['data']['action'], latest['ETag']), (3, "BUY", '"3"'))
+        self.assertTrue(since.data['complete'])
+        self.assertEqual([(snapshot['version'], snapshot['data']['action']) for snapshot in since.data['snapshots']], [(2, "SELL"), (3, "BUY")])
+
+    def test_state_history_is_bounded(self):
+        url = f"{self.url}{self.session.session_id}/orders/"
+
+        # test
+        with override_settings(LIVE_SESSION_STATE_HISTORY=3):
+            for quantity in range(5):
+                self.client.put(url, data={"data": dict(self.order_data["data"], totalQty=quantity)}, format='json')
+        since = self.client.get(f"{self.url}{self.session.session_id}/state/orders/", {'since': 1})
+        unknown = self.client.get(f"{self.url}{self.session.session_id}/state/trades/")
+
+        # validate
+        self.assertEqual(list(StateSnapshot.objects.filter(kind='orders').order_by('version').values_list('version', flat=True)), [4, 5, 6])
+        self.assertFalse(since.data['complete'])
+        self.assertEqual([snapshot['data']['totalQty'] for snapshot in since.data['snapshots']], [2, 3, 4])
+        self.assertEqual(unknown.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_state_encoding_round_trip(self):
+        document = {"orders": [{"orderId": 5, "status": "Submitted", "lmtPrice": 101.25, "tags": None}], "count": 1}
+
+        # test
+        codec, blob = encode_state(document)
+        wide_codec, wide_blob = encode_state({"id": 2 ** 70})
+
+        # validate
+        self.assertEqual(codec, 'msgpack')
+        self.assertEqual(decode_state(codec, blob), document)
+        self.assertEqual(decode_state('msgpack', memoryview(blob)), document)
+        self.assertEqual(wide_codec, 'json+zlib')
+        self.assertEqual(decode_state(wide_codec, wide_blob), {"id": 2 ** 70})
+
+    def test_patch_position_deltas(self):
+        url = f"{self.url}{self.session.session_id}/positions/"
+        operations = [{"op": "test", "path": "/action", "value": "BUY"}, {"op": "replace", "path": "/quantity", "value": 50}, {"op": "add", "path": "/fills", "value": [150]}]
+
+        # test
+        patched = self.client.patch(url, data=json.dumps(operations), content_type='application/json-patch+json', HTTP_IF_MATCH='"1"')
+        stale = self.client.patch(url, data=json.dumps(operations), content_type='application/json-patch+json', HTTP_IF_MATCH='"1"')
+        merged = self.client.patch(url, data=json.dumps({"price": 161, "initial_margin": None}), content_type='application/merge-patch+json')
+        appended = self.client.patch(url, data=json.dumps([{"op": "add", "path": "/fills/-", "value": 151}]), content_type='application/json-patch+json')
+        failed = self.client.patch(url, data=json.dumps([{"op": "test", "path": "/action", "value": "SELL"}]), content_type='application/json-patch+json')
+        malformed = self.client.patch(url, data=json.dumps({"op": "replace"}), content_type='application/json-patch+json')
+
+        # validate
+        self.assertEqual((patched.status_code, patched.data['version'], patched['ETag']), (status.HTTP_200_OK, 2, '"2"'))
+        self.assertEqual((stale.status_code, stale.data['version']), (status.HTTP_409_CONFLICT, 2))
+        self.assertEqual((merged.data['version'], appended.data['version']), (3, 4))
+        self.assertEqual(failed.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertEqual(malformed.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        position = Position.objects.get()
+        self.assertEqual(position.version, 4)
+        self.assertEqual((position.data["quantity"], position.data["price"], position.data["fills"]), (50, 161, [150, 151]))
+        self.assertNotIn("initial_margin", position.data)
+        self.assertEqual(StateSnapshot.objects.filter(kind='positions').count(), 4)
+
+    def test_json_patch_operations(self):
+        document = {"orders": [{"id": 1}, {"id": 2}], "a/b": {"~c": 1}}
+
+        # test
+        patched = apply_json_patch(document, [
+            {"op": "add", "path": "/orders/1", "value": {"id": 3}},
+            {"op": "remove", "path": "/orders/0"},
+            {"op": "copy", "from": "/orders/0", "path": "/last"},
+            {"op": "move", "from": "/a~1b/~0c", "path": "/count"},
+        ])
+        merged = apply_merge_patch({"a": {"b": 1, "c": 2}, "d": 1}, {"a": {"b": None, "e": {"f": 1}}, "d": [1]})
+
+        # validate
+        self.assertEqual(patched, {"orders": [{"id": 3}, {"id": 2}], "a/b": {}, "last": {"id": 3}, "count": 1})
+        self.assertEqual(document["orders"], [{"id": 1}, {"id": 2}])
+        self.assertEqual(merged, {"a": {"c": 2, "e": {"f": 1}}, "d": [1]})
+        for operations in ([{"op": "remove", "path": "/missing"}], [{"op": "add", "path": "/orders/5", "value": 1}], [{"op": "move", "from": "/orders", "path": "/orders/0"}]):
+            with self.assertRaises(PatchError):
+                apply_json_patch(document, operations)
+
+    def test_jsonb_patch_sql(self):
+        operations = validate_operations([
+            {"op": "test", "path": "/ticker", "value": "AAPL"},
+            {"op": "add", "path": "/fills/a~1b", "value": {"qty": 1}},
+            {"op": "replace", "path": "/orders/0/qty", "value": 2},
+            {"op": "remove", "path": "/ticker"},
+        ])
+
+        # test
+        expression, params, conditions, condition_params = _jsonb_json_patch(operations)
+        merge = _jsonb_merge_patch({"price": 161, "ticker": None, "fills": [1]})
+
+        # validate
+        self.assertEqual(expression, "(jsonb_set(jsonb_set(data, %s::text[], %s::jsonb, true), %s::text[], %s::jsonb, true)) #- %s::text[]")
+        self.assertEqual(params, [["fills", "a/b"], '{"qty": 1}', ["orders", "0", "qty"], "2", ["ticker"]])
+        self.assertEqual(conditions, [
+            "(data) #> %s::text[] = %s::jsonb",
+            "jsonb_typeof((data) #> %s::text[]) = 'object'",
+            "(jsonb_set(data, %s::text[], %s::jsonb, true)) #> %s::text[] IS NOT NULL",
+            "(jsonb_set(jsonb_set(data, %s::text[], %s::jsonb, true), %s::text[], %s::jsonb, true)) #> %s::text[] IS NOT NULL",
+        ])
+        self.assertEqual(condition_params, [
+            ["ticker"], '"AAPL"',
+            ["fills"],
+            ["fills", "a/b"], '{"qty": 1}', ["orders", "0", "qty"],
+            ["fills", "a/b"], '{"qty": 1}', ["orders", "0", "qty"], "2", ["ticker"],
+        ])
+        self.assertEqual(merge, ("(data || %s::jsonb) - %s::text[]", ['{"price": 161, "fills": [1]}', ["ticker"]], ["jsonb_typeof(data) = 'object'"], []))
+        for patch in ([{"op": "move", "from": "/a", "path": "/b"}], [{"op": "add", "path": "/orders/0", "value": 1}],
+                      [{"op": "add", "path": "/orders/-", "value": 1}], [{"op": "replace", "path": "/orders/01", "value": 1}],
+                      [{"op": "replace", "path": "", "value": {}}]):
+            self.assertIsNone(_jsonb_json_patch(validate_operations(patch)))
+        self.assertIsNone(_jsonb_merge_patch({"fills": {"a": 1}}))
+
+    @skipUnless(connection.vendor == 'postgresql', "jsonb patches run on PostgreSQL only")
+    def test_jsonb_patch_in_database(self):
+        url = f"{self.url}{self.session.session_id}/positions/"
+
+        # test
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(url, data=json.dumps([{"op": "test", "path": "/ticker", "value": "AAPL"}, {"op": "replace", "path": "/price", "value": 161}, {"op": "remove", "path": "/ticker"}]), content_type='application/json-patch+json')
+        updates = [query['sql'] for query in queries.captured_queries if query['sql'].startswith('UPDATE')]
+        merged = self.client.patch(url, data=json.dumps({"ticker": "MSFT", "price": None}), content_type='application/merge-patch+json')
+        failed = self.client.patch(url, data=json.dumps([{"op": "test", "path": "/ticker", "value": "AAPL"}]), content_type='application/json-patch+json')
+
+        # validate
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(updates), 1)
+        self.assertIn('RETURNING', updates[0])
+        self.assertEqual(merged.status_code, status.HTTP_200_OK)
+        self.assertEqual(failed.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        position = Position.objects.get(session=self.session)
+        self.assertEqual(position.version, 3)
+        self.assertNotIn("price", position.data)
+        self.assertEqual(position.data["ticker"], "MSFT")
+
+    async def test_stream_session_updates(self):
+        url = f"{self.url}{self.session.session_id}/positions/"
+        headers = {'Authorization': 'Token ' + self.token.key}
+
+        def write(method, *args, **kwargs):
+            with self.captureOnCommitCallbacks(execute=True):
+                return getattr(self.client, method)(url, *args, **kwargs)
+
+        # test
+        response = await self.async_client.get(f"{self.url}{self.session.session_id}/stream/", headers=headers)
+        unauthenticated = await self.async_client.get(f"{self.url}{self.session.session_id}/stream/")
+        missing = await self.async_client.get(f"{self.url}99/stream/", headers=headers)
+        stream = aiter(response.streaming_content)
+        state = (await anext(stream)).decode()
+        await sync_to_async(write)('put', data={"data": dict(self.positon_data["data"], price=161)}, format='json')
+        merged = (await anext(stream)).decode()
+        await sync_to_async(write)('patch', data=json.dumps([{"op": "remove", "path": "/ticker"}]), content_type='application/json-patch+json')
+        patched = (await anext(stream)).decode()
+        await stream.aclose()
+
+        # validate
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertEqual(unauthenticated.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(missing.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertTrue(state.startswith('event: state\n'))
+        self.assertEqual(json.loads(state.split('data: ')[1])['positions']['version'], 1)
+        self.assertIn('id: positions:2\n', merged)
+        event = json.loads(merged.split('data: ')[1])
+        self.assertEqual((event['format'], event['delta']), ('merge-patch', {"price": 161}))
+        event = json.loads(patched.split('data: ')[1])
+        self.assertEqual((event['version'], event['format'], event['delta']), (3, 'merge-patch', {"ticker": None}))
+
+    def test_event_deltas_and_cache_broker(self):
+        broker = CacheBroker()
+        cache.clear()
+
+        # test
+        diff = diff_document({"a": {"b": 1, "c": 2}, "d": 1}, {"a": {"b": 1, "c": 3}, "e": [1]})
+        replaced = diff_document({"a": 1}, {"a": None})
+        for version in (1, 2):
+            broker.publish(7, {'type': 'delta', 'version': version})
+        events, cursor = broker.read(7, 0)
+        caught_up, _ = broker.read(7, cursor)
+        with override_settings(LIVE_SESSION_EVENT_TTL=0):
+            broker.publish(7, {'type': 'delta', 'version': 3})
+        expired, _ = broker.read(7, cursor)
+
+        # validate
+        self.assertEqual(diff, ('merge-patch', {"a": {"c": 3}, "d": None, "e": [1]}))
+        self.assertEqual(replaced, ('replace', {"a": None}))
+        self.assertEqual(([event['version'] for event in events], cursor), ([1, 2], 2))
+        self.assertEqual(caught_up, [])
+        self.assertEqual(expired, [RESYNC])
+
+    @override_settings(LIVE_SESSION_WRITE_BEHIND=True, LIVE_SESSION_STATE_CACHE='default', LIVE_SESSION_FLUSH_INTERVAL=60)
+    def test_write_behind_session_state(self):
+        url = f"{self.url}{self.session.session_id}/positions/"
+        cache.clear()
+
+        # test
+        for price in (161, 162, 163):
+            written = self.client.put(url, data={"data": dict(self.positon_data["data"], price=price)}, format='json')
+        stale = self.client.put(url, data={"data": self.positon_data["data"]}, format='json', HTTP_IF_MATCH='"2"')
+        patched = self.client.patch(url, data=json.dumps([{"op": "replace", "path": "/quantity", "value": 5}]), content_type='application/json-patch+json', HTTP_IF_MATCH='"4"')
+        cached = self.client.get(url)
+        detail = self.client.get(f"{self.url}{self.session.session_id}/")
+        stored_before = Position.objects.values_list('version', flat=True).get()
+        flushed = self.client.post(f"{self.url}{self.session.session_id}/flush/")
+        output = StringIO()
+        call_command('flush_session_state', stdout=output)
+        behind = self.client.put(f"{self.url}{self.session.session_id}/snapshot/", data={"positions": {"data": {"price": 1}, "version": 5}, "risk": {"data": {}}}, format='json')
+        snapshot = self.client.get(f"{self.url}{self.session.session_id}/snapshot/")
+
+        # validate
+        self.assertEqual(written.data['version'], 4)
+        self.assertEqual((stale.status_code, stale.data['version']), (status.HTTP_409_CONFLICT, 4))
+        self.assertEqual((patched.status_code, patched.data['version']), (status.HTTP_200_OK, 5))
+        self.assertEqual((cached.data['version'], cached.data['data']['price'], cached.data['data']['quantity']), (5, 163, 5))
+        self.assertEqual((detail.data['positions']['version'], detail.data['positions']['data']['quantity']), (5, 5))
+        self.assertEqual(stored_before, 1)
+        self.assertEqual(flushed.data['flushed'], 1)
+        position = Position.objects.get()
+        self.assertEqual((position.version, position.data['price'], position.data['quantity']), (5, 163, 5))
+        self.assertEqual(list(StateSnapshot.objects.filter(kind='positions').values_list('version', flat=True).order_by('version')), [1, 5])
+        self.assertIn("Flushed 0", output.getvalue())
+        self.assertEqual(behind.data['versions'], {"positions": 6, "risk": 1})
+        self.assertEqual((snapshot.data['positions']['version'], snapshot.data['positions']['data'], snapshot.data['risk']['version']), (6, {"price": 1}, 1))
+        self.assertEqual(Position.objects.get().version, 5)
+
+    def test_session_snapshot(self):
+        url = f"{self.url}{self.session.session_id}/snapshot/"
+        documents = {
+            "positions": {"data": dict(self.positon_data["data"], price=170), "version": 1},
+            "orders": {"data": dict(self.order_data["data"], status="Filled")},
+            "risk": {"data": {"var": 0.05}},
+        }
+
+        # test
+        written = self.client.put(url, data=documents, format='json')
+        stale = self.client.post(url, data={"orders": {"data": {}}, "positions": {"data": {}, "version": 1}}, format='json')
+        unknown = self.client.post(url, data={"trades": {"data": {}}}, format='json')
+        missing = self.client.post(f"{self.url}99/snapshot/", data={"risk": {"data": {}}}, format='json')
+        snapshot = self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            detail = SessionDetailSerializer(load_session(self.session.session_id)).data
+        query_count = len(queries)
+
+        # validate
+        self.assertEqual(written.status_code, status.HTTP_200_OK)
+        self.assertEqual(written.data['versions'], {"positions": 2, "orders": 2, "risk": 1})
+        self.assertEqual((stale.status_code, stale.data['version']), (status.HTTP_409_CONFLICT, 2))
+        self.assertEqual(Order.objects.get().version, 2)
+        self.assertEqual(unknown.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(missing.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(snapshot.data['positions']['data']['price'], 170)
+        self.assertEqual((snapshot.data['orders']['data']['status'], snapshot.data['risk']['version']), ("Filled", 1))
+        self.assertIsNone(snapshot.data['market_data'])
+        self.assertEqual(query_count, 1)
+        self.assertEqual(detail['risk']['data'], {"var": 0.05})
+
+    def test_write_after_subscriber_loop_closed(self):
+        url = f"{self.url}{self.session.session_id}/positions/"
+
+        async def subscribe():
+            return session_events.subscribe(self.session.session_id)
+
+        # test
+        subscription = asyncio.run(subscribe())
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.put(url, data={"data": dict(self.positon_data["data"], price=161)}, format='json')
+
+        # validate
+        self.assertTrue(subscription.loop.is_closed())
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['version'], 2)
+        self.assertNotIn(self.session.session_id, session_events.subscriptions)
+
+    def test_write_behind_requires_shared_memory_cache(self):
+        redis = {'live_session': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://localhost:6379'}}
+        database = {'live_session': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'midas_cache'}}
+
+        # test / validate
+        with override_settings(CACHES=redis, LIVE_SESSION_STATE_CACHE='live_session'):
+            check_state_cache()
+        for caches in (database, {}):
+            with override_settings(CACHES=caches, LIVE_SESSION_STATE_CACHE='live_session'), self.assertRaises(ImproperlyConfigured):
+                check_state_cache()
+        with override_settings(LIVE_SESSION_STATE_CACHE='default'), self.assertRaises(ImproperlyConfigured):
+            check_state_cache()
+
+    @override_settings(LIVE_SESSION_WRITE_BEHIND=True, LIVE_SESSION_STATE_CACHE='default', LIVE_SESSION_FLUSH_INTERVAL=60)
+    def test_write_behind_snapshot_conflict(self):
+        url = f"{self.url}{self.session.session_id}/snapshot/"
+        cache.clear()
+
+        # test
+        stale = self.client.put(url, data={"positions": {"data": {"price": 1}, "version": 1}, "orders": {"data": {}, "version": 99}, "risk": {"data": {}}}, format='json')
+        snapshot = self.client.get(url)
+
+        # validate
+        self.assertEqual((stale.status_code, stale.data['version']), (status.HTTP_409_CONFLICT, 1))
+        self.assertEqual((snapshot.data['positions']['version'], snapshot.data['orders']['version']), (1, 1))
+        self.assertEqual(snapshot.data['positions']['data']['ticker'], "AAPL")
+        self.assertIsNone(snapshot.data['risk'])
@@ -42,5 +42,7 @@ urlpatterns = [
         'patch': 'partial_update', 
         'delete': 'destroy',  
     }), name='session-positions'),
+    path('sessions/<int:session_id>/state/<str:kind>/', views.DocumentStateView.as_view(), name='session-state'),
+    path('sessions/<int:session_id>/stream/', views.session_stream, name='session-stream'),
+    path('sessions/<int:session_id>/snapshot/', views.SessionSnapshotView.as_view(), name='session-snapshot'),
 ]
-
@@ -1,22 +1,43 @@
 
+import json
+import asyncio
 import logging
+from asgiref.sync import sync_to_async
 from rest_framework import viewsets
 from rest_framework.views import APIView
+from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from rest_framework import viewsets, status
 from django.shortcuts import get_object_or_404
-from django.http import Http404
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
 from django.db import IntegrityError
 from .models import Session, Position, Account, Order, Risk, MarketData
+from .services import (VersionConflict, DOCUMENT_MODELS, append_snapshot, publish_update, write_document, patch_document,
+                       parse_if_match, document_state, session_state, load_session, write_session_snapshot)
+from .events import RESYNC, session_events
+from . import store
+from .patch import validate_operations, apply_json_patch, apply_merge_patch
+from .patch import JSON_PATCH_MEDIA_TYPE, MERGE_PATCH_MEDIA_TYPE, PatchError
+from .parsers import DOCUMENT_PARSER_CLASSES
 from .serializers import (PositionSerializer, OrderSerializer, AccountSerializer,
-                            RiskSerializer, CreateSessionSerializer, MarketDataSerializer, SessionDetailSerializer)
+                            RiskSerializer, CreateSessionSerializer, MarketDataSerializer, SessionDetailSerializer,
+                            SessionSnapshotSerializer)
 
 logger = logging.getLogger(__name__)
 
 class SessionViewSet(viewsets.ModelViewSet):
     queryset = Session.objects.all()
 
+    def get_queryset(self):
+        if self.action == 'retrieve':
+            return Session.objects.select_related(*DOCUMENT_MODELS)
+        return super().get_queryset()
+
     def get_serializer_class(self):
         action = self.action
         logger.info(f"Entering get_serializer_class with action: {action}")
@@ -42,7 +63,11 @@ class SessionViewSet(viewsets.ModelViewSet):
         name = self.kwargs.get('name')
         logger.info(f"Attempting to retrieve a LiveSession instance with name: {name}")
         try:
-            return super().retrieve(request, *args, **kwargs)
+            response = super().retrieve(request, *args, **kwargs)
+            if store.write_behind_enabled():
+                for kind, entry in store.cached_documents(kwargs.get('pk')).items():
+                    response.data[kind] = store.document_response(entry)
+            return response
         except Exception as e:
             logger.error(f"Failed to retrieve a LiveSession instance: {e}")
             return Response({"error": str(e)}, status=status.HTTP_404_NOT_FOUND)
@@ -51,17 +76,100 @@ class SessionViewSet(viewsets.ModelViewSet):
     def destroy(self, request, *args, **kwargs):
         logger.info(f"Attempting to delete a LiveSession instance with ID: {kwargs.get('pk')}")
         try:
-            return super().destroy(request, *args, **kwargs)
+            response = super().destroy(request, *args, **kwargs)
+            store.evict(kwargs.get('pk'))
+            return response
         except Exception as e:
             logger.error(f"Failed to delete a LiveSession instance: {e}")
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-class PositionViewSet(viewsets.ModelViewSet):
+    # POST /sessions/{id}/flush/
+    @action(detail=True, methods=['post'])
+    def flush(self, request, pk=None):
+        """ Write the session's documents held by the write-behind store to the database, e.g. when the session closes. """
+        session = self.get_object()
+        flushed = store.flush(session.session_id)
+        logger.info(f"Flushed {flushed} documents of session ID {session.session_id}.")
+        return Response({"flushed": flushed})
+
+class SessionDocumentMixin:
+    """
+    PATCH with Content-Type application/json-patch+json (RFC 6902) or application/merge-patch+json (RFC 7396)
+    applies the delta to the stored document server-side; If-Match makes it apply to that version only.
+    The response carries the new version instead of the whole document.
+
+    With LIVE_SESSION_WRITE_BEHIND reads and writes go to the write-behind store (live_session.store) instead.
+    """
+    parser_classes = DOCUMENT_PARSER_CLASSES
+
+    def patch_media_type(self, request):
+        media_type = request.content_type.split(';')[0].strip()
+        if request.method == 'PATCH' and media_type in (JSON_PATCH_MEDIA_TYPE, MERGE_PATCH_MEDIA_TYPE):
+            return media_type
+        return None
+
+    def is_delta_update(self, request):
+        return self.patch_media_type(request) is not None
+
+    def delta_update(self, request, instance):
+        session_id = self.kwargs.get('session_id')
+        try:
+            version = patch_document(instance, self.document_kind, request.data, self.patch_media_type(request), self.expected_version)
+        except VersionConflict as e:
+            logger.warning(f"Rejected stale {self.document_kind} patch for session ID {session_id}: {e}")
+            return Response({"error": str(e), "version": e.version}, status=status.HTTP_409_CONFLICT)
+        except PatchError as e:
+            logger.error(f"Failed to patch {self.document_kind} for session ID {session_id}: {e}")
+            return Response({"error": str(e)}, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        logger.info(f"Patched {self.document_kind} for session ID {session_id} to version {version}.")
+        return Response({"id": instance.id, "session": instance.session_id, "version": version}, headers={'ETag': f'"{version}"'})
+
+    def cached_retrieve(self, session_id):
+        entry = store.load_document(session_id, self.document_kind)
+        if entry is None:
+            raise Http404
+        return Response(store.document_response(entry), headers={'ETag': f'"{entry["version"]}"'})
+
+    def cached_update(self, request):
+        session_id = self.kwargs.get('session_id')
+        media_type = self.patch_media_type(request)
+        try:
+            if media_type == JSON_PATCH_MEDIA_TYPE:
+                validate_operations(request.data)
+                update = lambda data: apply_json_patch(data, request.data)
+            elif media_type == MERGE_PATCH_MEDIA_TYPE:
+                if not isinstance(request.data, dict):
+                    raise PatchError("A merge patch must be a JSON object.")
+                update = lambda data: apply_merge_patch(data, request.data)
+            else:
+                serializer = self.get_serializer(data=request.data, partial=(request.method == 'PATCH'))
+                serializer.is_valid(raise_exception=True)
+                update = lambda data: serializer.validated_data.get('data', data)
+            entry = store.write_document(session_id, self.document_kind, update, self.expected_version)
+        except VersionConflict as e:
+            logger.warning(f"Rejected stale {self.document_kind} write for session ID {session_id}: {e}")
+            return Response({"error": str(e), "version": e.version}, status=status.HTTP_409_CONFLICT)
+        except PatchError as e:
+            logger.error(f"Failed to patch {self.document_kind} for session ID {session_id}: {e}")
+            return Response({"error": str(e)}, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+        if entry is None:
+            return Response({"error": f"No {self.document_kind} for session ID {session_id}."}, status=status.HTTP_404_NOT_FOUND)
+        logger.debug(f"Wrote {self.document_kind} version {entry['version']} of session ID {session_id} to the write-behind store.")
+        response = store.document_response(entry)
+        if media_type:
+            del response['data']
+        return Response(response, headers={'ETag': f'"{entry["version"]}"'})
+
+class PositionViewSet(SessionDocumentMixin, viewsets.ModelViewSet):
     serializer_class = PositionSerializer
+    document_kind = 'positions'
 
     def retrieve_or_list(self, request, *args, **kwargs):
         session_id = kwargs.get('session_id')
         if session_id:
+            if store.write_behind_enabled():
+                return self.cached_retrieve(session_id)
             # Assuming you have logic to determine if this should list or retrieve
             position = get_object_or_404(Position, session__session_id=session_id)
             serializer = self.get_serializer(position)
@@ -86,6 +194,8 @@ class PositionViewSet(viewsets.ModelViewSet):
         session = get_object_or_404(Session, session_id=session_id)
         try:
             serializer.save(session=session)
+            append_snapshot(serializer.instance, self.document_kind)
+            publish_update(serializer.instance, self.document_kind)
             logger.info(f"Position for session ID {session_id} created successfully.")
         except Exception as e:
             logger.error(f"Error saving Position for session ID {session_id}: {e}", exc_info=True)
@@ -103,12 +213,24 @@ class PositionViewSet(viewsets.ModelViewSet):
     def update(self, request, *args, **kwargs):
         session_id = kwargs.get('session_id')
         logger.info(f"Attempting to update Position for session ID {session_id}.")
+        try:
+            self.expected_version = parse_if_match(request)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if store.write_behind_enabled():
+            return self.cached_update(request)
 
         instance = get_object_or_404(Position, session__session_id=session_id)
+        if self.is_delta_update(request):
+            return self.delta_update(request, instance)
         serializer = self.get_serializer(instance, data=request.data, partial=(request.method == 'PATCH'))
         
         if serializer.is_valid(raise_exception=True):
-            self.perform_update(serializer)
+            try:
+                self.perform_update(serializer)
+            except VersionConflict as e:
+                logger.warning(f"Rejected stale Position write for session ID {session_id}: {e}")
+                return Response({"error": str(e), "version": e.version}, status=status.HTTP_409_CONFLICT)
             logger.info(f"Position for session ID {session_id} updated successfully.")
             return Response(serializer.data)
         else:
@@ -117,7 +239,10 @@ class PositionViewSet(viewsets.ModelViewSet):
 
     def perform_update(self, serializer):
         try:
-            serializer.save()
+            document = serializer.instance
+            write_document(document, self.document_kind, serializer.validated_data.get('data', document.data), self.expected_version)
+        except VersionConflict:
+            raise
         except Exception as e:
             logger.error(f"Failed to perform update: {e}", exc_info=True)
             raise
@@ -131,6 +256,7 @@ class PositionViewSet(viewsets.ModelViewSet):
             instance = get_object_or_404(Position, session__session_id=session_id)
             # Perform the deletion
             instance.delete()
+            store.evict(session_id, self.document_kind)
             logger.info(f"Position for session ID {session_id} deleted successfully.")
             # Return a success response
             return Response(status=status.HTTP_204_NO_CONTENT)
@@ -141,12 +267,15 @@ class PositionViewSet(viewsets.ModelViewSet):
             logger.error(f"Failed to delete Position for session ID {session_id}: {e}", exc_info=True)
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-class AccountViewSet(viewsets.ModelViewSet):
+class AccountViewSet(SessionDocumentMixin, viewsets.ModelViewSet):
     serializer_class = AccountSerializer
+    document_kind = 'account'
 
     def retrieve_or_list(self, request, *args, **kwargs):
         session_id = kwargs.get('session_id')
         if session_id:
+            if store.write_behind_enabled():
+                return self.cached_retrieve(session_id)
             # Assuming you have logic to determine if this should list or retrieve
             account = get_object_or_404(Account, session__session_id=session_id)
             serializer = self.get_serializer(account)
@@ -171,6 +300,8 @@ class AccountViewSet(viewsets.ModelViewSet):
         session = get_object_or_404(Session, session_id=session_id)
         try:
             serializer.save(session=session)
+            append_snapshot(serializer.instance, self.document_kind)
+            publish_update(serializer.instance, self.document_kind)
             logger.info(f"Account for session ID {session_id} created successfully.")
         except Exception as e:
             logger.error(f"Error saving Account for session ID {session_id}: {e}", exc_info=True)
@@ -188,12 +319,24 @@ class AccountViewSet(viewsets.ModelViewSet):
     def update(self, request, *args, **kwargs):
         session_id = kwargs.get('session_id')
         logger.info(f"Attempting to update Account for session ID {session_id}.")
+        try:
+            self.expected_version = parse_if_match(request)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if store.write_behind_enabled():
+            return self.cached_update(request)
 
         instance = get_object_or_404(Account, session__session_id=session_id)
+        if self.is_delta_update(request):
+            return self.delta_update(request, instance)
         serializer = self.get_serializer(instance, data=request.data, partial=(request.method == 'PATCH'))
         
         if serializer.is_valid(raise_exception=True):
-            self.perform_update(serializer)
+            try:
+                self.perform_update(serializer)
+            except VersionConflict as e:
+                logger.warning(f"Rejected stale Account write for session ID {session_id}: {e}")
+                return Response({"error": str(e), "version": e.version}, status=status.HTTP_409_CONFLICT)
             logger.info(f"Account for session ID {session_id} updated successfully.")
             return Response(serializer.data)
         else:
@@ -202,7 +345,10 @@ class AccountViewSet(viewsets.ModelViewSet):
 
     def perform_update(self, serializer):
         try:
-            serializer.save()
+            document = serializer.instance
+            write_document(document, self.document_kind, serializer.validated_data.get('data', document.data), self.expected_version)
+        except VersionConflict:
+            raise
         except Exception as e:
             logger.error(f"Failed to perform update: {e}", exc_info=True)
             raise
@@ -216,6 +362,7 @@ class AccountViewSet(viewsets.ModelViewSet):
             instance = get_object_or_404(Account, session__session_id=session_id)
             # Perform the deletion
             instance.delete()
+            store.evict(session_id, self.document_kind)
             logger.info(f"Account for session ID {session_id} deleted successfully.")
             # Return a success response
             return Response(status=status.HTTP_204_NO_CONTENT)
@@ -226,12 +373,15 @@ class AccountViewSet(viewsets.ModelViewSet):
             logger.error(f"Failed to delete Account for session ID {session_id}: {e}", exc_info=True)
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-class OrderViewSet(viewsets.ModelViewSet):
+class OrderViewSet(SessionDocumentMixin, viewsets.ModelViewSet):
     serializer_class = OrderSerializer
+    document_kind = 'orders'
 
     def retrieve_or_list(self, request, *args, **kwargs):
         session_id = kwargs.get('session_id')
         if session_id:
+            if store.write_behind_enabled():
+                return self.cached_retrieve(session_id)
             # Assuming you have logic to determine if this should list or retrieve
             order = get_object_or_404(Order, session__session_id=session_id)
             serializer = self.get_serializer(order)
@@ -256,6 +406,8 @@ class OrderViewSet(viewsets.ModelViewSet):
         session = get_object_or_404(Session, session_id=session_id)
         try:
             serializer.save(session=session)
+            append_snapshot(serializer.instance, self.document_kind)
+            publish_update(serializer.instance, self.document_kind)
             logger.info(f"Order for session ID {session_id} created successfully.")
         except Exception as e:
             logger.error(f"Error saving Order for session ID {session_id}: {e}", exc_info=True)
@@ -273,12 +425,24 @@ class OrderViewSet(viewsets.ModelViewSet):
     def update(self, request, *args, **kwargs):
         session_id = kwargs.get('session_id')
         logger.info(f"Attempting to update Order for session ID {session_id}.")
+        try:
+            self.expected_version = parse_if_match(request)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if store.write_behind_enabled():
+            return self.cached_update(request)
 
         instance = get_object_or_404(Order, session__session_id=session_id)
+        if self.is_delta_update(request):
+            return self.delta_update(request, instance)
         serializer = self.get_serializer(instance, data=request.data, partial=(request.method == 'PATCH'))
         
         if serializer.is_valid(raise_exception=True):
-            self.perform_update(serializer)
+            try:
+                self.perform_update(serializer)
+            except VersionConflict as e:
+                logger.warning(f"Rejected stale Order write for session ID {session_id}: {e}")
+                return Response({"error": str(e), "version": e.version}, status=status.HTTP_409_CONFLICT)
             logger.info(f"Order for session ID {session_id} updated successfully.")
             return Response(serializer.data)
         else:
@@ -287,7 +451,10 @@ class OrderViewSet(viewsets.ModelViewSet):
 
     def perform_update(self, serializer):
         try:
-            serializer.save()
+            document = serializer.instance
+            write_document(document, self.document_kind, serializer.validated_data.get('data', document.data), self.expected_version)
+        except VersionConflict:
+            raise
         except Exception as e:
             logger.error(f"Failed to perform update: {e}", exc_info=True)
             raise
@@ -301,6 +468,7 @@ class OrderViewSet(viewsets.ModelViewSet):
             instance = get_object_or_404(Order, session__session_id=session_id)
             # Perform the deletion
             instance.delete()
+            store.evict(session_id, self.document_kind)
             logger.info(f"Order for session ID {session_id} deleted successfully.")
             # Return a success response
             return Response(status=status.HTTP_204_NO_CONTENT)
@@ -311,12 +479,15 @@ class OrderViewSet(viewsets.ModelViewSet):
             logger.error(f"Failed to delete Order for session ID {session_id}: {e}", exc_info=True)
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-class RiskViewSet(viewsets.ModelViewSet):
+class RiskViewSet(SessionDocumentMixin, viewsets.ModelViewSet):
     serializer_class = RiskSerializer
+    document_kind = 'risk'
 
     def retrieve_or_list(self, request, *args, **kwargs):
         session_id = kwargs.get('session_id')
         if session_id:
+            if store.write_behind_enabled():
+                return self.cached_retrieve(session_id)
             # Assuming you have logic to determine if this should list or retrieve
             risk = get_object_or_404(Risk, session__session_id=session_id)
             serializer = self.get_serializer(risk)
@@ -341,6 +512,8 @@ class RiskViewSet(viewsets.ModelViewSet):
         session = get_object_or_404(Session, session_id=session_id)
         try:
             serializer.save(session=session)
+            append_snapshot(serializer.instance, self.document_kind)
+            publish_update(serializer.instance, self.document_kind)
             logger.info(f"Risk for session ID {session_id} created successfully.")
         except Exception as e:
             logger.error(f"Error saving Risk for session ID {session_id}: {e}", exc_info=True)
@@ -358,12 +531,24 @@ class RiskViewSet(viewsets.ModelViewSet):
     def update(self, request, *args, **kwargs):
         session_id = kwargs.get('session_id')
         logger.info(f"Attempting to update Risk for session ID {session_id}.")
+        try:
+            self.expected_version = parse_if_match(request)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if store.write_behind_enabled():
+            return self.cached_update(request)
 
         instance = get_object_or_404(Risk, session__session_id=session_id)
+        if self.is_delta_update(request):
+            return self.delta_update(request, instance)
         serializer = self.get_serializer(instance, data=request.data, partial=(request.method == 'PATCH'))
         
         if serializer.is_valid(raise_exception=True):
-            self.perform_update(serializer)
+            try:
+                self.perform_update(serializer)
+            except VersionConflict as e:
+                logger.warning(f"Rejected stale Risk write for session ID {session_id}: {e}")
+                return Response({"error": str(e), "version": e.version}, status=status.HTTP_409_CONFLICT)
             logger.info(f"Risk for session ID {session_id} updated successfully.")
             return Response(serializer.data)
         else:
@@ -372,7 +557,10 @@ class RiskViewSet(viewsets.ModelViewSet):
 
     def perform_update(self, serializer):
         try:
-            serializer.save()
+            document = serializer.instance
+            write_document(document, self.document_kind, serializer.validated_data.get('data', document.data), self.expected_version)
+        except VersionConflict:
+            raise
         except Exception as e:
             logger.error(f"Failed to perform update: {e}", exc_info=True)
             raise
@@ -386,6 +574,7 @@ class RiskViewSet(viewsets.ModelViewSet):
             instance = get_object_or_404(Risk, session__session_id=session_id)
             # Perform the deletion
             instance.delete()
+            store.evict(session_id, self.document_kind)
             logger.info(f"Risk for session ID {session_id} deleted successfully.")
             # Return a success response
             return Response(status=status.HTTP_204_NO_CONTENT)
@@ -396,12 +585,15 @@ class RiskViewSet(viewsets.ModelViewSet):
             logger.error(f"Failed to delete Risk for session ID {session_id}: {e}", exc_info=True)
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-class MarketDataViewSet(viewsets.ModelViewSet):
+class MarketDataViewSet(SessionDocumentMixin, viewsets.ModelViewSet):
     serializer_class = MarketDataSerializer
+    document_kind = 'market_data'
 
     def retrieve_or_list(self, request, *args, **kwargs):
         session_id = kwargs.get('session_id')
         if session_id:
+            if store.write_behind_enabled():
+                return self.cached_retrieve(session_id)
             # Assuming you have logic to determine if this should list or retrieve
             market_data = get_object_or_404(MarketData, session__session_id=session_id)
             serializer = self.get_serializer(market_data)
@@ -426,6 +618,8 @@ class MarketDataViewSet(viewsets.ModelViewSet):
         session = get_object_or_404(Session, session_id=session_id)
         try:
             serializer.save(session=session)
+            append_snapshot(serializer.instance, self.document_kind)
+            publish_update(serializer.instance, self.document_kind)
             logger.info(f"MarketData for session ID {session_id} created successfully.")
         except Exception as e:
             logger.error(f"Error saving MarketData for session ID {session_id}: {e}", exc_info=True)
@@ -443,12 +637,24 @@ class MarketDataViewSet(viewsets.ModelViewSet):
     def update(self, request, *args, **kwargs):
         session_id = kwargs.get('session_id')
         logger.info(f"Attempting to update MarketData for session ID {session_id}.")
+        try:
+            self.expected_version = parse_if_match(request)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if store.write_behind_enabled():
+            return self.cached_update(request)
 
         instance = get_object_or_404(MarketData, session__session_id=session_id)
+        if self.is_delta_update(request):
+            return self.delta_update(request, instance)
         serializer = self.get_serializer(instance, data=request.data, partial=(request.method == 'PATCH'))
         
         if serializer.is_valid(raise_exception=True):
-            self.perform_update(serializer)
+            try:
+                self.perform_update(serializer)
+            except VersionConflict as e:
+                logger.warning(f"Rejected stale MarketData write for session ID {session_id}: {e}")
+                return Response({"error": str(e), "version": e.version}, status=status.HTTP_409_CONFLICT)
             logger.info(f"MarketData for session ID {session_id} updated successfully.")
             return Response(serializer.data)
         else:
@@ -457,7 +663,10 @@ class MarketDataViewSet(viewsets.ModelViewSet):
 
     def perform_update(self, serializer):
         try:
-            serializer.save()
+            document = serializer.instance
+            write_document(document, self.document_kind, serializer.validated_data.get('data', document.data), self.expected_version)
+        except VersionConflict:
+            raise
         except Exception as e:
             logger.error(f"Failed to perform update: {e}", exc_info=True)
             raise
@@ -471,6 +680,7 @@ class MarketDataViewSet(viewsets.ModelViewSet):
             instance = get_object_or_404(MarketData, session__session_id=session_id)
             # Perform the deletion
             instance.delete()
+            store.evict(session_id, self.document_kind)
             logger.info(f"MarketData for session ID {session_id} deleted successfully.")
             # Return a success response
             return Response(status=status.HTTP_204_NO_CONTENT)
@@ -480,3 +690,118 @@ class MarketDataViewSet(viewsets.ModelViewSet):
         except Exception as e:
             logger.error(f"Failed to delete MarketData for session ID {session_id}: {e}", exc_info=True)
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+class DocumentStateView(APIView):
+    """
+    GET /sessions/{session_id}/state/{kind}/ returns the latest version of a session document;
+    ?since=N returns the snapshots written after version N instead, so a reader only decodes what it missed.
+    """
+    def get(self, request, session_id, kind):
+        if kind not in DOCUMENT_MODELS:
+            return Response({"error": f"kind must be one of {', '.join(DOCUMENT_MODELS)}"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            since = int(request.query_params['since']) if request.query_params.get('since') else None
+        except ValueError:
+            return Response({"error": "since must be a document version"}, status=status.HTTP_400_BAD_REQUEST)
+
+        logger.info(f"Retrieving {kind} state of session ID {session_id} since version {since}.")
+        if since is None and store.write_behind_enabled():
+            entry = store.load_document(session_id, kind)
+            state = entry and {'kind': kind, 'version': entry['version'], 'data': entry['data']}
+        else:
+            state = document_state(session_id, kind, since)
+        if state is None:
+            return Response({"error": f"No {kind} for session ID {session_id}."}, status=status.HTTP_404_NOT_FOUND)
+        return Response(state, headers={'ETag': f'"{state["version"]}"'})
+
+class SessionSnapshotView(APIView):
+    """
+    GET /sessions/{session_id}/snapshot/ returns the session with all its documents from one joined query.
+    POST or PUT takes any subset of the documents, {kind: {"data": ..., "version": expected version (optional)}},
+    and writes them in one transaction after a single session lookup; a stale version rolls back all of them.
+    With the write-behind store the versions are all checked under the documents' locks before any is written.
+    """
+    def get(self, request, session_id):
+        logger.info(f"Retrieving the snapshot of session ID {session_id}.")
+        session = load_session(session_id)
+        if session is None:
+            return Response({"error": f"Session {session_id} not found."}, status=status.HTTP_404_NOT_FOUND)
+        snapshot = SessionDetailSerializer(session).data
+        if store.write_behind_enabled():
+            for kind, entry in store.cached_documents(session_id).items():
+                snapshot[kind] = store.document_response(entry)
+        return Response(snapshot)
+
+    def post(self, request, session_id):
+        serializer = SessionSnapshotSerializer(data=request.data)
+        if not serializer.is_valid():
+            logger.error(f"Invalid snapshot for session ID {session_id}: {serializer.errors}")
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        logger.info(f"Writing {', '.join(serializer.validated_data)} of session ID {session_id}.")
+        try:
+            if store.write_behind_enabled():
+                versions = store.write_session_snapshot(session_id, serializer.validated_data)
+            else:
+                session = load_session(session_id)
+                if session is None:
+                    raise Session.DoesNotExist(f"Session {session_id} not found.")
+                versions = write_session_snapshot(session, serializer.validated_data)
+        except Session.DoesNotExist as e:
+            return Response({"error": str(e)}, status=status.HTTP_404_NOT_FOUND)
+        except VersionConflict as e:
+            logger.warning(f"Rejected stale snapshot for session ID {session_id}: {e}")
+            return Response({"error": str(e), "version": e.version}, status=status.HTTP_409_CONFLICT)
+        return Response({"session_id": session_id, "versions": versions})
+
+    def put(self, request, session_id):
+        return self.post(request, session_id)
+
+def current_session_state(session_id):
+    return store.session_state(session_id) if store.write_behind_enabled() else session_state(session_id)
+
+def server_sent_event(event, data, event_id=None):
+    lines = [f"event: {event}"] + ([f"id: {event_id}"] if event_id else [])
+    return "\n".join(lines + [f"data: {json.dumps(data, cls=DjangoJSONEncoder)}", "", ""])
+
+async def session_events_stream(session_id, subscription):
+    """ The session's full state, then every update as a delta; the full state again after a resync. """
+    try:
+        state = await sync_to_async(current_session_state)(session_id)
+        yield server_sent_event('state', state)
+        while True:
+            try:
+                event = await asyncio.wait_for(subscription.get(), settings.LIVE_SESSION_STREAM_KEEPALIVE)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            if event is RESYNC:
+                state = await sync_to_async(current_session_state)(session_id)
+                yield server_sent_event('state', state)
+            else:
+                yield server_sent_event('delta', event, f"{event['kind']}:{event['version']}")
+    finally:
+        session_events.unsubscribe(subscription)
+
+async def session_stream(request, session_id):
+    """
+    GET /sessions/{session_id}/stream/ as text/event-stream: a 'state' event with every document of the session,
+    then a 'delta' event per document write (see live_session.events), so viewers stop polling the session.
+    Needs an ASGI server (midasbackend.asgi); authenticated with the same token header as the API.
+    """
+    try:
+        credentials = await sync_to_async(TokenAuthentication().authenticate)(request)
+    except AuthenticationFailed as e:
+        return JsonResponse({"error": str(e)}, status=status.HTTP_401_UNAUTHORIZED)
+    if credentials is None:
+        return JsonResponse({"error": "Authentication credentials were not provided."}, status=status.HTTP_401_UNAUTHORIZED)
+    if not await Session.objects.filter(session_id=session_id).aexists():
+        return JsonResponse({"error": f"Session {session_id} not found."}, status=status.HTTP_404_NOT_FOUND)
+
+    logger.info(f"Streaming session ID {session_id} to {credentials[0]}.")
+    subscription = session_events.subscribe(session_id)
+    return StreamingHttpResponse(
+        session_events_stream(session_id, subscription),
+        content_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
@@ -0,0 +1,58 @@
+import time
+import uuid
+from django.db import transaction
+from django.core.management.base import BaseCommand
+
+from symbols.models import Symbol
+from market_data.models import BarData
+from market_data.services import ingest_market_data, INGEST_BATCH_SIZE
+
+MINUTE = 60 * 1_000_000_000
+
+class Rollback(Exception):
+    pass
+
+def benchmark_ticker():
+    """ A fresh ticker, so a benchmark never writes next to or collides with a stored symbol. """
+    return f"BENCH{uuid.uuid4().hex[:5].upper()}"
+
+def synthetic_bars(ticker, count, start=1704067200000000000):
+    return [
+        {
+            "symbol": ticker,
+            "timestamp": start + i * MINUTE,
+            "open": "100.2500",
+            "high": "100.7500",
+            "low": "99.7500",
+            "close": "100.5000",
+            "volume": 1000 + i % 500,
+        }
+        for i in range(count)
+    ]
+
+class Command(BaseCommand):
+    help = "Benchmark the set-based BarData ingest path. All writes are rolled back."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[10_000, 100_000, 1_000_000])
+        parser.add_argument('--batch-size', type=int, default=INGEST_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        for size in options['sizes']:
+            ticker = benchmark_ticker()
+            rows = synthetic_bars(ticker, size)
+            try:
+                with transaction.atomic():
+                    Symbol.objects.create(ticker=ticker)
+                    started = time.perf_counter()
+                    result = ingest_market_data(BarData, rows, batch_size=options['batch_size'])
+                    elapsed = time.perf_counter() - started
+                    raise Rollback()
+            except Rollback:
+                pass
+            finally:
+                Symbol.objects.filter(ticker=ticker).delete()
+
+            self.stdout.write(
+                f"{size:>10,} bars  {elapsed:8.2f}s  {result['created'] / elapsed:>12,.0f} rows/s  errors={len(result['errors'])}"
+            )
@@ -0,0 +1,42 @@
+import time
+from django.db import transaction
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from symbols.models import Symbol
+from market_data.models import BarData
+from market_data.serializers import BarDataSerializer
+from market_data.services import ingest_market_data, fast_values, iter_json_array
+from .benchmark_bar_ingest import Rollback, benchmark_ticker, synthetic_bars
+
+class Command(BaseCommand):
+    help = "Compare the serializer and fast read paths for a BarData range. All writes are rolled back."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100_000)
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+        ticker = benchmark_ticker()
+        try:
+            with transaction.atomic():
+                Symbol.objects.create(ticker=ticker)
+                ingest_market_data(BarData, synthetic_bars(ticker, rows))
+                queryset = BarData.objects.filter(symbol__ticker=ticker)
+
+                started = time.perf_counter()
+                serialized = JSONRenderer().render(BarDataSerializer(queryset.select_related('symbol'), many=True).data)
+                serializer_elapsed = time.perf_counter() - started
+
+                started = time.perf_counter()
+                fast = ''.join(iter_json_array(BarData, fast_values(queryset).iterator()))
+                fast_elapsed = time.perf_counter() - started
+                raise Rollback()
+        except Rollback:
+            pass
+        finally:
+            Symbol.objects.filter(ticker=ticker).delete()
+
+        self.stdout.write(f"serializer  {rows:>10,} rows  {serializer_elapsed:8.2f}s  {rows / serializer_elapsed:>12,.0f} rows/s  {len(serialized):,} bytes")
+        self.stdout.write(f"fast        {rows:>10,} rows  {fast_elapsed:8.2f}s  {rows / fast_elapsed:>12,.0f} rows/s  {len(fast):,} bytes")
+        self.stdout.write(f"speedup     {serializer_elapsed / fast_elapsed:.1f}x")
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from symbols.models import Symbol
+from market_data.services import rebuild_bar_rollups
+
+class Command(BaseCommand):
+    help = "Rebuild the hourly and daily BarData rollups from the raw bars."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tickers', help="Comma separated tickers to rebuild (default: all)")
+
+    def handle(self, *args, **options):
+        symbol_ids = None
+        if options['tickers']:
+            symbol_ids = list(Symbol.objects.filter(ticker__in=options['tickers'].split(',')).values_list('id', flat=True))
+        count = rebuild_bar_rollups(symbol_ids)
+        self.stdout.write(f"Rebuilt rollups for {count} symbols.")
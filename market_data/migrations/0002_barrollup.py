@@ -0,0 +1,68 @@
+# Generated by Django 5.0 on 2026-10-18 11:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+HOUR = 3600 * 1_000_000_000
+DAY = 86400 * 1_000_000_000
+
+ROLLUP_SQL = """
+INSERT INTO market_data_barrollup (symbol_id, timestamp, open, high, low, close, volume, resolution)
+SELECT symbol_id, bucket, MIN(first_open), MAX(high), MIN(low), MIN(last_close), CAST(SUM(volume) AS BIGINT), %s
+FROM (
+    SELECT
+        src.symbol_id,
+        (src.timestamp / %s) * %s AS bucket,
+        src.high,
+        src.low,
+        src.volume,
+        FIRST_VALUE(src.open) OVER w AS first_open,
+        LAST_VALUE(src.close) OVER w AS last_close
+    FROM
+        (SELECT * FROM {table} WHERE {condition}) src
+    WINDOW w AS (
+        PARTITION BY src.symbol_id, (src.timestamp / %s) * %s
+        ORDER BY src.timestamp
+        ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING
+    )
+) bars
+GROUP BY
+    symbol_id,
+    bucket
+"""
+
+def build_rollups(apps, schema_editor):
+    """ Backfill hourly rollups from the existing bars, then daily rollups from the hourly ones. """
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(ROLLUP_SQL.format(table='market_data_bardata', condition='1 = 1'), [HOUR] * 5)
+        cursor.execute(ROLLUP_SQL.format(table='market_data_barrollup', condition='resolution = %s'), [DAY, DAY, DAY, HOUR, DAY, DAY])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market_data', '0001_initial'),
+        ('symbols', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BarRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolution', models.BigIntegerField()),
+                ('timestamp', models.BigIntegerField()),
+                ('open', models.DecimalField(decimal_places=4, max_digits=10)),
+                ('close', models.DecimalField(decimal_places=4, max_digits=10)),
+                ('high', models.DecimalField(decimal_places=4, max_digits=10)),
+                ('low', models.DecimalField(decimal_places=4, max_digits=10)),
+                ('volume', models.BigIntegerField()),
+                ('symbol', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bar_rollups', to='symbols.symbol')),
+            ],
+            options={
+                'ordering': ['timestamp'],
+                'unique_together': {('symbol', 'resolution', 'timestamp')},
+            },
+        ),
+        migrations.RunPython(build_rollups, migrations.RunPython.noop),
+    ]
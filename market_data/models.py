@@ -40,4 +40,21 @@ class QuoteData(models.Model):
     def __str__(self):
         return f"BarData(ticker={self.symbol}, timestamp={self.timestamp})"
 
+class BarRollup(models.Model):
+    """ OHLCV of BarData bucketed at a coarser resolution (bucket size in nanoseconds), kept current on every bar write. """
+    symbol = models.ForeignKey(Symbol, on_delete=models.CASCADE, related_name='bar_rollups')
+    resolution = models.BigIntegerField()
+    timestamp = models.BigIntegerField()
+    open = models.DecimalField(max_digits=10, decimal_places=4)
+    close = models.DecimalField(max_digits=10, decimal_places=4)
+    high = models.DecimalField(max_digits=10, decimal_places=4)
+    low = models.DecimalField(max_digits=10, decimal_places=4)
+    volume = models.BigIntegerField()
+
+    class Meta:
+        unique_together = ('symbol', 'resolution', 'timestamp')
+        ordering = ['timestamp']
+
+    def __str__(self):
+        return f"BarRollup(ticker={self.symbol}, resolution={self.resolution}, timestamp={self.timestamp})"
 
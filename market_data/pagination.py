@@ -0,0 +1,181 @@
+import json
+import base64
+import decimal
+import binascii
+import datetime
+import logging
+from collections import OrderedDict
+from django.core.exceptions import ValidationError
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+logger = logging.getLogger(__name__)
+
+def keyset_filter(ordering, position, nullable=()):
+    """
+    Rows strictly after position for a composite ordering, e.g. ('timestamp', 'symbol_id') gives
+    timestamp > t OR (timestamp = t AND symbol_id > s). A leading '-' marks a descending field.
+    Fields named in nullable sort their NULLs last in either direction (see order_expressions).
+    """
+    condition = Q()
+    for i, field in enumerate(ordering):
+        name = field.lstrip('-')
+        if position[i] is None: # nothing sorts after NULL on this field
+            continue
+        term = Q(**{f"{name}__{'lt' if field.startswith('-') else 'gt'}": position[i]})
+        if name in nullable:
+            term |= Q(**{f"{name}__isnull": True})
+        for prior, value in zip(ordering[:i], position[:i]):
+            term &= Q(**{f"{prior.lstrip('-')}__isnull": True} if value is None else {prior.lstrip('-'): value})
+        condition |= term
+    return condition
+
+def order_expressions(ordering, nullable=()):
+    """ order_by() arguments for an ordering, the nullable fields putting NULLs last as keyset_filter expects. """
+    return [
+        (F(field[1:]).desc(nulls_last=True) if field.startswith('-') else F(field).asc(nulls_last=True)) if field.lstrip('-') in nullable else field
+        for field in ordering
+    ]
+
+def _cursor_value(value):
+    """ JSON form of the ordering values json cannot encode, full precision (unlike DjangoJSONEncoder's milliseconds). """
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    raise TypeError(f"Cannot encode {type(value).__name__} in a cursor")
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination over a unique composite ordering.
+
+    Each page is a range scan starting after the last key of the previous page, so the cost of a page
+    does not grow with its depth the way OFFSET paging does. The cursor is an opaque token holding that key.
+    With optional=True the view stays unpaginated unless the client sends a cursor or page size.
+    """
+    ordering = ('id',)
+    page_size = 1000
+    max_page_size = 10000
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    optional = False
+
+    def get_ordering(self, request, queryset, view):
+        return self.ordering
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(page_size, self.max_page_size))
+
+    def encode_cursor(self, position):
+        return base64.urlsafe_b64encode(json.dumps(position, default=_cursor_value).encode()).decode()
+
+    def decode_cursor(self, request):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None
+        try:
+            position = json.loads(base64.urlsafe_b64decode(token.encode()))
+        except (binascii.Error, UnicodeDecodeError, ValueError):
+            raise NotFound("Invalid cursor")
+        if not isinstance(position, list) or len(position) != len(self.current_ordering):
+            raise NotFound("Invalid cursor")
+        if any(isinstance(value, bool) or not isinstance(value, (str, int, float, type(None))) for value in position):
+            raise NotFound("Invalid cursor")
+        return position
+
+    def ordering_field(self, queryset, name):
+        """ The model field, or annotation output field, behind an ordering name. """
+        annotation = queryset.query.annotations.get(name)
+        return annotation.output_field if annotation is not None else queryset.model._meta.get_field(name)
+
+    def nullable_fields(self, queryset):
+        return {field.lstrip('-') for field in self.current_ordering if self.ordering_field(queryset, field.lstrip('-')).null}
+
+    def clean_position(self, queryset, position):
+        """ Decoded cursor values as the Python types of the ordering fields (datetimes travel as ISO strings). Raises NotFound when one does not convert. """
+        values = []
+        for field, value in zip(self.current_ordering, position):
+            model_field = self.ordering_field(queryset, field.lstrip('-'))
+            try:
+                values.append(None if value is None else model_field.to_python(value))
+            except (ValidationError, TypeError, ValueError):
+                raise NotFound("Invalid cursor")
+        return values
+
+    def get_position(self, item):
+        names = [field.lstrip('-') for field in self.current_ordering]
+        if isinstance(item, dict):
+            return [item[name] for name in names]
+        return [getattr(item, name) for name in names]
+
+    def paginate_queryset(self, queryset, request, view=None):
+        params = request.query_params
+        if self.optional and self.cursor_query_param not in params and self.page_size_query_param not in params:
+            return None
+
+        self.request = request
+        self.current_ordering = tuple(self.get_ordering(request, queryset, view))
+        page_size = self.get_page_size(request)
+
+        nullable = self.nullable_fields(queryset)
+        queryset = queryset.order_by(*order_expressions(self.current_ordering, nullable))
+        position = self.decode_cursor(request)
+        if position is not None:
+            queryset = queryset.filter(keyset_filter(self.current_ordering, self.clean_position(queryset, position), nullable))
+
+        page = list(queryset[:page_size + 1])
+        self.has_next = len(page) > page_size
+        page = page[:page_size]
+        self.next_position = self.get_position(page[-1]) if self.has_next else None
+        logger.debug(f"Keyset page of {len(page)} rows ordered by {self.current_ordering}.")
+        return page
+
+    def get_next_cursor(self):
+        if self.next_position is None:
+            return None
+        return self.encode_cursor(self.next_position)
+
+    def get_next_link(self):
+        cursor = self.get_next_cursor()
+        if cursor is None:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('next_cursor', self.get_next_cursor()),
+            ('results', data),
+        ]))
+
+    def get_paginated_json(self, json_rows):
+        """ Paginated body assembled from already-encoded JSON rows, for views that bypass serializers. """
+        return '{"next":%s,"next_cursor":%s,"results":[%s]}' % (
+            json.dumps(self.get_next_link()), json.dumps(self.get_next_cursor()), ','.join(json_rows)
+        )
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'next_cursor': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
+
+class MarketDataPagination(KeysetPagination):
+    """
+    Keyset pages over (timestamp, symbol_id), unique since (symbol, timestamp) is the unique key of BarData/QuoteData.
+    That key's index leads with symbol, so pages filtered to one symbol are index range scans; pages across
+    symbols still sort by timestamp.
+    """
+    ordering = ('timestamp', 'symbol_id')
+    optional = True
@@ -0,0 +1,118 @@
+"""
+Packed columnar encoding for BarData/QuoteData ranges.
+
+A response body is a header followed by record batches:
+
+    magic    b'MDCOL1\n'
+    header   uint32 length + UTF-8 JSON {"model", "columns": [{"name", "dtype", "scale"}], "symbols", "next_cursor"}
+    batch    uint32 row count, then each column as row count contiguous little-endian values of its dtype
+    end      uint32 0
+
+Timestamps, symbol ids and volumes are int64. Prices are float64, or int64 multiplied by 10 ** scale
+when the client asks for ?scaled=true. A column decodes with numpy.frombuffer(buffer, dtype).
+"""
+import json
+import struct
+import numpy as np
+from django.db.models import F, BigIntegerField, DecimalField, FloatField
+from django.db.models.functions import Cast, Round
+from rest_framework.renderers import BaseRenderer
+
+from .services import value_fields
+
+COLUMNAR_MEDIA_TYPE = 'application/vnd.midas.columnar'
+COLUMNAR_MAGIC = b'MDCOL1\n'
+COLUMNAR_BATCH_SIZE = 65536
+
+def columnar_columns(model, scaled=False):
+    """
+    (name, dtype, scale, expression) for every exported column of a market data model.
+    Integer columns are read as stored (expression None); prices are converted in the database.
+    """
+    columns = [('symbol_id', '<i8', None, None)]
+    for field in value_fields(model):
+        if not isinstance(field, DecimalField):
+            columns.append((field.name, '<i8', None, None))
+        elif scaled:
+            scale = field.decimal_places
+            columns.append((field.name, '<i8', scale, Cast(Round(F(field.name) * 10 ** scale), BigIntegerField())))
+        else:
+            columns.append((field.name, '<f8', None, Cast(F(field.name), FloatField())))
+    return columns
+
+def columnar_values(queryset, columns):
+    """ Named rows holding the encoded value of every column; keeps symbol_id/timestamp for keyset paging. """
+    aliases = {f'{name}_value': expression for name, _, _, expression in columns if expression is not None}
+    names = [name if expression is None else f'{name}_value' for name, _, _, expression in columns]
+    return queryset.annotate(**aliases).values_list(*names, named=True)
+
+def encode_header(model, columns, symbols, next_cursor=None):
+    header = json.dumps({
+        'model': model._meta.model_name,
+        'columns': [{'name': name, 'dtype': dtype, 'scale': scale} for name, dtype, scale, _ in columns],
+        'symbols': {str(symbol_id): ticker for symbol_id, ticker in symbols.items()},
+        'next_cursor': next_cursor,
+    }).encode()
+    return COLUMNAR_MAGIC + struct.pack('<I', len(header)) + header
+
+def encode_batch(rows, columns):
+    parts = [struct.pack('<I', len(rows))]
+    for values, (_, dtype, _, _) in zip(zip(*rows), columns):
+        parts.append(np.fromiter(values, dtype=dtype, count=len(rows)).tobytes())
+    return b''.join(parts)
+
+def iter_columnar(model, rows, columns, symbols, next_cursor=None, batch_size=COLUMNAR_BATCH_SIZE):
+    """ Stream header, record batches of batch_size rows and the end marker. """
+    yield encode_header(model, columns, symbols, next_cursor)
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == batch_size:
+            yield encode_batch(batch, columns)
+            batch = []
+    if batch:
+        yield encode_batch(batch, columns)
+    yield struct.pack('<I', 0)
+
+def read_columnar(data):
+    """ Decode a columnar body into (header, {column: numpy array}). """
+    if not data.startswith(COLUMNAR_MAGIC):
+        raise ValueError("Not a columnar market data stream.")
+    offset = len(COLUMNAR_MAGIC)
+    (length,) = struct.unpack_from('<I', data, offset)
+    offset += 4
+    header = json.loads(data[offset:offset + length])
+    offset += length
+
+    chunks = {column['name']: [] for column in header['columns']}
+    while True:
+        (count,) = struct.unpack_from('<I', data, offset)
+        offset += 4
+        if count == 0:
+            break
+        for column in header['columns']:
+            dtype = np.dtype(column['dtype'])
+            chunks[column['name']].append(np.frombuffer(data, dtype=dtype, count=count, offset=offset))
+            offset += count * dtype.itemsize
+
+    arrays = {
+        column['name']: np.concatenate(chunks[column['name']]) if chunks[column['name']] else np.empty(0, dtype=column['dtype'])
+        for column in header['columns']
+    }
+    return header, arrays
+
+class ColumnarRenderer(BaseRenderer):
+    """
+    Content negotiation entry for the packed columnar format (Accept: application/vnd.midas.columnar
+    or ?format=columnar). List views stream the body themselves; anything else that reaches this
+    renderer, such as an error payload, is encoded as JSON.
+    """
+    media_type = COLUMNAR_MEDIA_TYPE
+    format = 'columnar'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return json.dumps(data, default=str).encode()
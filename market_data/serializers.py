@@ -17,11 +17,11 @@ class BarDataSerializer(serializers.ModelSerializer):
         fields = ['id', 'symbol', 'timestamp', 'open', 'close', 'high', 'low', 'volume']
 
     def to_representation(self, instance):
-        logger.info(f"Serializing BarData instance with ID: {instance.id}")
+        logger.debug(f"Serializing BarData instance with ID: {instance.id}")
         try:
             ret = super().to_representation(instance)
             ret['symbol'] = instance.symbol.ticker
-            logger.info(f"Successfully serialized BarData instance with ID: {instance.id}")
+            logger.debug(f"Successfully serialized BarData instance with ID: {instance.id}")
             return ret
         except Exception as e:
             logger.error(f"Error during serialization of BarData instance with ID: {instance.id}: {e}")
@@ -58,11 +58,11 @@ class QuoteDataSerializer(serializers.ModelSerializer):
         fields = ['id', 'symbol', 'timestamp', 'ask', 'ask_size', 'bid', 'bid_size']
 
     def to_representation(self, instance):
-        logger.info(f"Serializing QuoteData instance with ID: {instance.id}")
+        logger.debug(f"Serializing QuoteData instance with ID: {instance.id}")
         try:
             ret = super().to_representation(instance)
             ret['symbol'] = instance.symbol.ticker
-            logger.info(f"Successfully serialized QuoteData instance with ID: {instance.id}")
+            logger.debug(f"Successfully serialized QuoteData instance with ID: {instance.id}")
             return ret
         except Exception as e:
             logger.error(f"Error during serialization of QuoteData instance with ID: {instance.id}: {e}")
@@ -1,129 +1,786 @@
+import io
+import re
+import csv
+import json
+import time
+import zlib
+import hashlib
 import logging
-from decimal import Decimal
-from datetime import datetime
-from django.db import connection
-
-def aggregate_bars(tickers, start_timestamp, end_timestamp, interval):
-    interval_mapping = {
-        's': 'strftime("%Y-%m-%d %H:%M:%S", mdb.timestamp / 1000000000, "unixepoch")',
-        'm': 'strftime("%Y-%m-%d %H:%M", mdb.timestamp / 1000000000, "unixepoch")',
-        'h': 'strftime("%Y-%m-%d %H", mdb.timestamp / 1000000000, "unixepoch")',
-        'd': 'date(mdb.timestamp / 1000000000, "unixepoch")'
-    }
-
-    if interval not in interval_mapping:
-        raise ValueError("Invalid interval. Choose from 's', 'm', 'h', 'd'.")
-
-    interval_expression = interval_mapping[interval]
-    tickers_placeholder = ','.join(['%s'] * len(tickers))
-
-    query = f"""
-    WITH InitialValues AS (
-        SELECT
-            mdb.symbol_id,
-            s.ticker,
-            {interval_expression} AS interval_time,
-            mdb.open,
-            mdb.high,
-            mdb.low,
-            mdb.close,
-            mdb.volume,
-            ROW_NUMBER() OVER (PARTITION BY mdb.symbol_id, {interval_expression} ORDER BY mdb.timestamp) AS row_num_open,
-            ROW_NUMBER() OVER (PARTITION BY mdb.symbol_id, {interval_expression} ORDER BY mdb.timestamp DESC) AS row_num_close
-        FROM
-            market_data_bardata mdb
-        JOIN
-            symbols_symbol s ON mdb.symbol_id = s.id
-        WHERE
-            s.ticker IN ({tickers_placeholder})
-            AND mdb.timestamp BETWEEN %s AND %s
-    ),
-    DailyData AS (
+import threading
+from collections import OrderedDict
+from decimal import Decimal, DecimalException
+from functools import partial
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, models, transaction
+from django.db.models import F, Q
+
+from symbols.models import Symbol
+from .models import BarData, BarRollup
+
+logger = logging.getLogger(__name__)
+
+INGEST_BATCH_SIZE = 5000
+BIGINT_MIN, BIGINT_MAX = -9223372036854775808, 9223372036854775807
+UNIQUE_ERROR = 'The fields symbol, timestamp must make a unique set.'
+ON_CONFLICT_POLICIES = ('ignore', 'overwrite')
+STREAM_FORMATS = {
+    'application/x-ndjson': 'ndjson',
+    'application/jsonl': 'ndjson',
+    'application/jsonlines': 'ndjson',
+    'text/csv': 'csv',
+}
+STREAM_CHUNK_SIZE = 64 * 1024
+MAX_LINE_BYTES = 1024 * 1024
+MAX_REPORTED_ERRORS = 1000
+FAST_READ_CHUNK_SIZE = 2000
+INTERVAL_NANOSECONDS = {
+    's': 1_000_000_000,
+    'm': 60 * 1_000_000_000,
+    'h': 3600 * 1_000_000_000,
+    'd': 86400 * 1_000_000_000,
+    'w': 7 * 86400 * 1_000_000_000,
+}
+ROLLUP_RESOLUTIONS = (INTERVAL_NANOSECONDS['h'], INTERVAL_NANOSECONDS['d']) # each level is built from the one before, the first from BarData
+WEEK_ORIGIN = 4 * INTERVAL_NANOSECONDS['d'] # 1970-01-01 was a Thursday; weekly buckets start on Monday 00:00 UTC
+AGGREGATE_CACHE_PREFIX = 'market_data:aggregate'
+BAR_WRITES_CACHE_PREFIX = 'market_data:bar_writes'
+BAR_WRITE_MARK_TIMEOUT = 7 * 86400
+MAX_TRACKED_BAR_WRITES = 1000
+PRICE_DATA_CACHE_PREFIX = 'market_data:price_data'
+_DURATION = re.compile(r'(\d*)([smhdw])')
+_TRAILING_ZEROS = re.compile(r'\.0*\s*$')
+
+def _to_int(value):
+    if isinstance(value, int) and not isinstance(value, bool):
+        number = value
+    else:
+        try:
+            number = int(_TRAILING_ZEROS.sub('', str(value)))
+        except (TypeError, ValueError):
+            raise ValueError('A valid integer is required.')
+    if number < BIGINT_MIN:
+        raise ValueError(f'Ensure this value is greater than or equal to {BIGINT_MIN}.')
+    if number > BIGINT_MAX:
+        raise ValueError(f'Ensure this value is less than or equal to {BIGINT_MAX}.')
+    return number
+
+def _to_decimal(value, max_digits, decimal_places):
+    # Same rules and messages as DRF's DecimalField, without the per-field overhead.
+    try:
+        number = Decimal(str(value).strip())
+    except DecimalException:
+        raise ValueError('A valid number is required.')
+    if not number.is_finite():
+        raise ValueError('A valid number is required.')
+
+    sign, digittuple, exponent = number.as_tuple()
+    if exponent >= 0:
+        total_digits = whole_digits = len(digittuple) + exponent
+        places = 0
+    elif len(digittuple) > abs(exponent):
+        total_digits = len(digittuple)
+        whole_digits = total_digits - abs(exponent)
+        places = abs(exponent)
+    else:
+        total_digits = places = abs(exponent)
+        whole_digits = 0
+
+    if total_digits > max_digits:
+        raise ValueError(f'Ensure that there are no more than {max_digits} digits in total.')
+    if places > decimal_places:
+        raise ValueError(f'Ensure that there are no more than {decimal_places} decimal places.')
+    if whole_digits > max_digits - decimal_places:
+        raise ValueError(f'Ensure that there are no more than {max_digits - decimal_places} digits before the decimal point.')
+    return number
+
+def value_fields(model):
+    """ Concrete fields of a market data model other than the primary key and symbol. """
+    return [field for field in model._meta.concrete_fields if not field.primary_key and field.name != 'symbol']
+
+def _converter(field):
+    if isinstance(field, models.DecimalField):
+        return partial(_to_decimal, max_digits=field.max_digits, decimal_places=field.decimal_places)
+    return _to_int
+
+def validate_market_data(model, rows, start_index=1):
+    """
+    Validate a batch of BarData/QuoteData rows one column at a time.
+
+    Tickers are resolved with a single Symbol query. Returns (valid, errors) where valid is a
+    list of (index, values) tuples ordered as ['symbol_id', <value fields>] and errors matches
+    the {'index', 'errors'} shape returned by bulk_create.
+    """
+    errors = {}
+
+    def fail(position, field_name, message):
+        errors.setdefault(position, {}).setdefault(field_name, []).append(message)
+
+    records = []
+    for position, row in enumerate(rows):
+        if isinstance(row, dict):
+            records.append(row)
+        else:
+            records.append({})
+            fail(position, 'non_field_errors', f'Invalid data. Expected a dictionary, but got {type(row).__name__}.')
+
+    # Symbol column
+    tickers = [row.get('symbol') for row in records]
+    symbol_map = dict(Symbol.objects.filter(ticker__in={t for t in tickers if isinstance(t, str)}).values_list('ticker', 'id'))
+    symbol_ids = []
+    for position, ticker in enumerate(tickers):
+        if ticker is None:
+            if isinstance(rows[position], dict):
+                fail(position, 'symbol', 'This field is required.' if 'symbol' not in records[position] else 'This field may not be null.')
+            symbol_ids.append(None)
+        elif not isinstance(ticker, str):
+            fail(position, 'symbol', 'Invalid value.')
+            symbol_ids.append(None)
+        elif ticker not in symbol_map:
+            fail(position, 'symbol', f'Object with ticker={ticker} does not exist.')
+            symbol_ids.append(None)
+        else:
+            symbol_ids.append(symbol_map[ticker])
+    columns = [symbol_ids]
+
+    # Value columns
+    for field in value_fields(model):
+        convert = _converter(field)
+        column = []
+        for position, row in enumerate(records):
+            value = row.get(field.name)
+            if value is None:
+                if isinstance(rows[position], dict):
+                    fail(position, field.name, 'This field is required.' if field.name not in row else 'This field may not be null.')
+                column.append(None)
+                continue
+            try:
+                column.append(convert(value))
+            except ValueError as e:
+                fail(position, field.name, str(e))
+                column.append(None)
+        columns.append(column)
+
+    valid = [(position + start_index, values) for position, values in enumerate(zip(*columns)) if position not in errors]
+    error_list = [{'index': position + start_index, 'errors': field_errors} for position, field_errors in sorted(errors.items())]
+    return valid, error_list
+
+def _existing_keys(model, keys):
+    """ (symbol_id, timestamp) pairs in keys that are already stored, using one range query per symbol. """
+    bounds = {}
+    for symbol_id, timestamp in keys:
+        low, high = bounds.get(symbol_id, (timestamp, timestamp))
+        bounds[symbol_id] = (min(low, timestamp), max(high, timestamp))
+    if not bounds:
+        return set()
+
+    condition = Q()
+    for symbol_id, (low, high) in bounds.items():
+        condition |= Q(symbol_id=symbol_id, timestamp__range=(low, high))
+    stored = set(model.objects.filter(condition).values_list('symbol_id', 'timestamp'))
+    return stored & set(keys)
+
+def _insert_rows(model, rows, on_conflict=None):
+    """
+    Chunked multi-row INSERT of (symbol_id, <value fields>) tuples.
+
+    Plain inserts use COPY on PostgreSQL. With on_conflict ('ignore' or 'overwrite') the statement carries an
+    ON CONFLICT (symbol_id, timestamp) clause, which PostgreSQL and SQLite both accept.
+    """
+    fields = [model._meta.get_field('symbol')] + value_fields(model)
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    columns = ', '.join(quote(field.column) for field in fields)
+
+    if on_conflict is None and connection.vendor == 'postgresql':
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        buffer.seek(0)
+        with connection.cursor() as cursor:
+            cursor.copy_expert(f"COPY {table} ({columns}) FROM STDIN WITH (FORMAT csv)", buffer)
+        return
+
+    suffix = ''
+    if on_conflict is not None:
+        key = f"{quote(fields[0].column)}, {quote('timestamp')}"
+        if on_conflict == 'ignore':
+            suffix = f" ON CONFLICT ({key}) DO NOTHING"
+        else:
+            updates = ', '.join(f"{quote(field.column)} = excluded.{quote(field.column)}" for field in fields[2:])
+            suffix = f" ON CONFLICT ({key}) DO UPDATE SET {updates}"
+
+    placeholder = f"({', '.join(['%s'] * len(fields))})"
+    per_statement = max(connection.ops.bulk_batch_size(fields, rows), 1)
+    with connection.cursor() as cursor:
+        for offset in range(0, len(rows), per_statement):
+            chunk = rows[offset:offset + per_statement]
+            values = ', '.join([placeholder] * len(chunk))
+            params = [value for row in chunk for value in row]
+            cursor.execute(f"INSERT INTO {table} ({columns}) VALUES {values}{suffix}", params)
+
+def _validated_batches(model, rows, start_index, batch_size):
+    for offset in range(0, len(rows), batch_size):
+        yield validate_market_data(model, rows[offset:offset + batch_size], start_index + offset)
+
+def ingest_market_data(model, rows, start_index=1, batch_size=INGEST_BATCH_SIZE):
+    """
+    Set-based bulk insert for BarData/QuoteData.
+
+    Rows are validated column-wise and written in chunks of batch_size. Rows that fail validation or
+    collide with an existing (symbol, timestamp) are reported by index and skipped; the rest are inserted.
+    Returns {'created': <count>, 'errors': [...]}.
+    """
+    logger.info(f"Ingesting {len(rows)} {model.__name__} rows in batches of {batch_size}.")
+    result = {'created': 0, 'errors': []}
+    written = []
+
+    with transaction.atomic():
+        for valid, errors in _validated_batches(model, rows, start_index, batch_size):
+            result['errors'].extend(errors)
+
+            keys = [(values[0], values[1]) for _, values in valid]
+            existing = _existing_keys(model, keys)
+            seen = set()
+            inserts = []
+            for (index, values), key in zip(valid, keys):
+                if key in existing or key in seen:
+                    result['errors'].append({'index': index, 'errors': {'non_field_errors': [UNIQUE_ERROR]}})
+                    continue
+                seen.add(key)
+                inserts.append(values)
+
+            if inserts:
+                _insert_rows(model, inserts)
+                written.extend(seen)
+            result['created'] += len(inserts)
+        _refresh_rollups(model, written)
+
+    result['errors'].sort(key=lambda error: error['index'])
+    logger.info(f"Ingested {result['created']} {model.__name__} rows with {len(result['errors'])} errors.")
+    return result
+
+def upsert_market_data(model, rows, on_conflict='ignore', start_index=1, batch_size=INGEST_BATCH_SIZE):
+    """
+    Idempotent bulk write for BarData/QuoteData keyed on (symbol, timestamp).
+
+    on_conflict='ignore' keeps stored rows and the first occurrence of a key within the batch;
+    'overwrite' replaces stored rows and lets the last occurrence within the batch win.
+    Returns {'inserted', 'updated', 'skipped', 'errors'}.
+    """
+    if on_conflict not in ON_CONFLICT_POLICIES:
+        raise ValueError(f"on_conflict must be one of {', '.join(ON_CONFLICT_POLICIES)}.")
+
+    logger.info(f"Upserting {len(rows)} {model.__name__} rows with on_conflict={on_conflict}.")
+    result = {'inserted': 0, 'updated': 0, 'skipped': 0, 'errors': []}
+    written = []
+
+    with transaction.atomic():
+        for valid, errors in _validated_batches(model, rows, start_index, batch_size):
+            result['errors'].extend(errors)
+
+            latest = {}
+            for index, values in valid:
+                key = (values[0], values[1])
+                if key in latest:
+                    result['skipped'] += 1
+                    if on_conflict == 'ignore':
+                        continue
+                latest[key] = values
+
+            existing = _existing_keys(model, latest.keys())
+            if on_conflict == 'ignore':
+                writes = [values for key, values in latest.items() if key not in existing]
+                result['skipped'] += len(existing)
+            else:
+                writes = list(latest.values())
+                result['updated'] += len(existing)
+            result['inserted'] += len(latest) - len(existing)
+
+            if writes:
+                _insert_rows(model, writes, on_conflict)
+                written.extend((values[0], values[1]) for values in writes)
+        _refresh_rollups(model, written)
+
+    logger.info(f"Upserted {model.__name__}: {result['inserted']} inserted, {result['updated']} updated, "
+                f"{result['skipped']} skipped, {len(result['errors'])} errors.")
+    return result
+
+def _iter_chunks(stream, content_encoding=None):
+    """ Byte chunks of at most STREAM_CHUNK_SIZE from a stream, inflating gzip on the fly however much the input expands. """
+    decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16) if content_encoding == 'gzip' else None
+    while stream is not None:
+        chunk = stream.read(STREAM_CHUNK_SIZE)
+        if not chunk:
+            break
+        if decompressor is None:
+            yield chunk
+            continue
+        while chunk:
+            yield decompressor.decompress(chunk, STREAM_CHUNK_SIZE)
+            chunk = decompressor.unconsumed_tail
+    if decompressor is not None:
+        yield decompressor.flush()
+
+def _iter_lines(stream, content_encoding=None):
+    """ Yield decoded lines (newline kept) from a byte stream. Raises ValueError on a line longer than MAX_LINE_BYTES. """
+    pending = b''
+    for chunk in _iter_chunks(stream, content_encoding):
+        *lines, pending = (pending + chunk).split(b'\n')
+        if len(pending) > MAX_LINE_BYTES or any(len(line) > MAX_LINE_BYTES for line in lines):
+            raise ValueError(f"Lines are limited to {MAX_LINE_BYTES} bytes.")
+        for line in lines:
+            yield line.decode('utf-8') + '\n'
+    if pending:
+        yield pending.decode('utf-8')
+
+def iter_stream_records(stream, stream_format, content_encoding=None):
+    """ Incrementally parse an NDJSON or CSV request body into row dicts. """
+    lines = _iter_lines(stream, content_encoding)
+    if stream_format == 'csv':
+        yield from csv.DictReader(lines)
+        return
+
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            yield line.strip()  # reported as an invalid row by validate_market_data
+
+def stream_market_data(model, records, on_conflict=None, batch_size=INGEST_BATCH_SIZE):
+    """
+    Write an iterable of rows in fixed-size batches, each committed on its own.
+
+    Only one batch is held in memory at a time. With on_conflict=None batches go through
+    ingest_market_data, otherwise through upsert_market_data, so an interrupted upload can be
+    replayed safely with a conflict policy. Errors are reported up to MAX_REPORTED_ERRORS.
+    """
+    counts = {'created': 0} if on_conflict is None else {'inserted': 0, 'updated': 0, 'skipped': 0}
+    result = {'rows': 0, **counts, 'errors': [], 'error_count': 0}
+
+    def flush(batch, start_index):
+        if on_conflict is None:
+            written = ingest_market_data(model, batch, start_index=start_index, batch_size=batch_size)
+        else:
+            written = upsert_market_data(model, batch, on_conflict=on_conflict, start_index=start_index, batch_size=batch_size)
+        for key in counts:
+            result[key] += written[key]
+        result['error_count'] += len(written['errors'])
+        result['errors'].extend(written['errors'][:MAX_REPORTED_ERRORS - len(result['errors'])])
+
+    batch = []
+    for record in records:
+        batch.append(record)
+        result['rows'] += 1
+        if len(batch) == batch_size:
+            flush(batch, result['rows'] - len(batch) + 1)
+            batch = []
+    if batch:
+        flush(batch, result['rows'] - len(batch) + 1)
+
+    logger.info(f"Streamed {result['rows']} {model.__name__} rows with {result['error_count']} errors.")
+    return result
+
+def fast_values(queryset):
+    """
+    BarData/QuoteData rows as plain tuples: (id, ticker, <value fields>, symbol_id).
+
+    The ticker comes from a single join to symbols_symbol, and no model instances are built.
+    The rows are named, so keyset pagination can read timestamp/symbol_id from them.
+    """
+    names = [field.name for field in value_fields(queryset.model)]
+    return queryset.annotate(ticker=F('symbol__ticker')).values_list('id', 'ticker', *names, 'symbol_id', named=True)
+
+def iter_json_rows(model, rows):
+    """ Format fast_values() rows as JSON objects matching the serializer output (decimals as strings). """
+    fields = value_fields(model)
+    template = '{"id":%d,"symbol":%s,' + ','.join(
+        f'"{field.name}":"%s"' if isinstance(field, models.DecimalField) else f'"{field.name}":%d' for field in fields
+    ) + '}'
+    tickers = {}
+    for row in rows:
+        ticker = tickers.get(row[1])
+        if ticker is None:
+            ticker = tickers[row[1]] = json.dumps(row[1])
+        yield template % (row[0], ticker, *row[2:-1])
+
+def iter_json_array(model, rows, chunk_size=FAST_READ_CHUNK_SIZE):
+    """ Stream fast_values() rows as one JSON array, chunk_size rows per yielded string. """
+    yield '['
+    separator = ''
+    chunk = []
+    for item in iter_json_rows(model, rows):
+        chunk.append(item)
+        if len(chunk) == chunk_size:
+            yield separator + ','.join(chunk)
+            separator = ','
+            chunk = []
+    if chunk:
+        yield separator + ','.join(chunk)
+    yield ']'
+
+def parse_duration(value):
+    """
+    Nanoseconds in a duration such as '5m', '4h', '1w' or '9h30m'. A bare unit ('m') counts once and a
+    leading '-' negates the result. Raises ValueError for anything else.
+    """
+    text = str(value).strip().lower()
+    sign = -1 if text.startswith('-') else 1
+    text = text.lstrip('+-')
+    if not text or _DURATION.sub('', text):
+        raise ValueError(f"Invalid duration '{value}'.")
+    return sign * sum(int(count or 1) * INTERVAL_NANOSECONDS[unit] for count, unit in _DURATION.findall(text))
+
+def parse_interval(interval, anchor=None):
+    """
+    (bucket size, offset) in nanoseconds for an interval like '15m', '4h' or '1w' and an optional anchor.
+
+    Buckets start at epoch + offset + k * size. Weekly intervals start on Monday 00:00 UTC; the anchor
+    shifts every bucket, e.g. interval='1d', anchor='-2h' for sessions opening at 22:00 UTC.
+    """
+    try:
+        bucket_size = parse_duration(interval)
+        offset = parse_duration(anchor) if anchor else 0
+    except ValueError:
+        raise ValueError("Invalid interval. Use N followed by a unit (s, m, h, d, w), e.g. '5m', '4h', '1w'.")
+    if bucket_size <= 0:
+        raise ValueError("Invalid interval. Use N followed by a unit (s, m, h, d, w), e.g. '5m', '4h', '1w'.")
+    if bucket_size % INTERVAL_NANOSECONDS['w'] == 0:
+        offset += WEEK_ORIGIN
+    return bucket_size, offset % bucket_size
+
+def _ohlcv_query(source, bucket, cast=False):
+    """
+    One OHLCV row (symbol_id, bucket, open, high, low, close, volume) per symbol and bucket over source, a
+    table expression with symbol_id, timestamp and OHLCV columns. Open/close come from FIRST_VALUE/LAST_VALUE
+    over a single window, so the rows are read once. With cast=True prices are returned as DOUBLE PRECISION.
+    Placeholders: bucket, then those of source, then bucket again.
+    """
+    price = 'CAST({} AS DOUBLE PRECISION)' if cast else '{}'
+    return f"""
+    SELECT
+        symbol_id,
+        bucket,
+        {price.format('MIN(first_open)')} AS open,
+        {price.format('MAX(high)')} AS high,
+        {price.format('MIN(low)')} AS low,
+        {price.format('MIN(last_close)')} AS close,
+        CAST(SUM(volume) AS BIGINT) AS volume
+    FROM (
         SELECT
-            symbol_id,
-            ticker,
-            interval_time,
-            (SELECT open FROM InitialValues iv WHERE iv.symbol_id = InitialValues.symbol_id AND iv.interval_time = InitialValues.interval_time AND iv.row_num_open = 1) AS open,
-            MAX(high) AS high,
-            MIN(low) AS low,
-            (SELECT close FROM InitialValues iv WHERE iv.symbol_id = InitialValues.symbol_id AND iv.interval_time = InitialValues.interval_time AND iv.row_num_close = 1) AS close,
-            SUM(volume) AS volume
+            src.symbol_id,
+            {bucket} AS bucket,
+            src.high,
+            src.low,
+            src.volume,
+            FIRST_VALUE(src.open) OVER w AS first_open,
+            LAST_VALUE(src.close) OVER w AS last_close
         FROM
-            InitialValues
-        GROUP BY
-            symbol_id,
-            ticker,
-            interval_time
-    )
-    SELECT
+            {source} src
+        WINDOW w AS (
+            PARTITION BY src.symbol_id, {bucket}
+            ORDER BY src.timestamp
+            ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING
+        )
+    ) bars
+    GROUP BY
         symbol_id,
-        ticker,
-        interval_time,
-        open,
-        high,
-        low,
-        close,
-        volume
-    FROM
-        DailyData
-    ORDER BY
-        interval_time;
+        bucket
     """
 
-    params = tickers + [start_timestamp, end_timestamp]
+def _bars_source(symbol_count, resolution=None):
+    """ Subquery over BarData, or over BarRollup at resolution, for symbol_count symbols and a timestamp range. """
+    model = BarData if resolution is None else BarRollup
+    symbols_placeholder = ', '.join(['%s'] * symbol_count)
+    level = '' if resolution is None else ' AND resolution = %s'
+    return (
+        f"SELECT symbol_id, timestamp, open, high, low, close, volume FROM {connection.ops.quote_name(model._meta.db_table)}"
+        f" WHERE symbol_id IN ({symbols_placeholder}){level} AND timestamp BETWEEN %s AND %s"
+    )
+
+def _merge_ranges(ranges, resolution):
+    """ Widen (low, high) timestamp ranges to whole buckets of resolution and merge the ones that touch. """
+    merged = []
+    for low, high in sorted((low // resolution * resolution, high // resolution * resolution + resolution - 1) for low, high in ranges):
+        if merged and low <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], high))
+        else:
+            merged.append((low, high))
+    return merged
 
+def _refresh_rollup_ranges(ranges):
+    """
+    Recompute every rollup bucket overlapping the {symbol_id: [(low, high), ...]} BarData ranges, finest level
+    first. Buckets are deleted and rebuilt from the level below, so deleted bars drop out too.
+    """
+    table = connection.ops.quote_name(BarRollup._meta.db_table)
+    bucket = "(src.timestamp / %s) * %s"
     with connection.cursor() as cursor:
-        cursor.execute(query,  params)
-        results = cursor.fetchall()
-
-        # Convert results to list of dictionaries with correct types
-        columns = [col[0] for col in cursor.description]
-        results = [
-            {
-                'symbol_id': row[0],
-                'ticker': row[1],
-                'timestamp': int(datetime.strptime(row[2], '%Y-%m-%d %H:%M:%S').timestamp() * 1000000000) if interval != 'd' else int(datetime.strptime(row[2], '%Y-%m-%d').timestamp() * 1000000000),
-                'open': Decimal(row[3]),
-                'high': Decimal(row[4]),
-                'low': Decimal(row[5]),
-                'close': Decimal(row[6]),
-                'volume': int(row[7])
-            }
-            for row in results
-        ]
-
-        return results
-
-
-# ADD INTO BarDataViewSet
-@action(detail=False, methods=['get'], url_path='aggregate-bars')
-def aggregate_bars(self, request, *args, **kwargs):
-    tickers = request.query_params.get('tickers')
-    start_date = request.query_params.get('start_date')
-    end_date = request.query_params.get('end_date')
-    interval = request.query_params.get('interval', 'd').lower()
-
-    # Validate tickers
-    if not tickers:
-        raise ValidationError("Tickers parameter is required.")
-    ticker_list = tickers.split(',')
-
-    # Validate start_date and end_date
-    try:
-        start_date = int(start_date)
-        end_date = int(end_date)
-    except (TypeError, ValueError):
-        raise ValidationError("Start date and end date must be valid Unix timestamps.")
+        for symbol_id, symbol_ranges in ranges.items():
+            source_resolution = None
+            for resolution in ROLLUP_RESOLUTIONS:
+                symbol_ranges = _merge_ranges(symbol_ranges, resolution)
+                source = f"({_bars_source(1, source_resolution)})"
+                query = _ohlcv_query(source, bucket)
+                for low, high in symbol_ranges:
+                    cursor.execute(
+                        f"DELETE FROM {table} WHERE symbol_id = %s AND resolution = %s AND timestamp BETWEEN %s AND %s",
+                        [symbol_id, resolution, low, high],
+                    )
+                    source_params = [symbol_id] + ([] if source_resolution is None else [source_resolution]) + [low, high]
+                    cursor.execute(
+                        f"INSERT INTO {table} (symbol_id, timestamp, open, high, low, close, volume, resolution)"
+                        f" SELECT rolled.*, %s FROM ({query}) rolled",
+                        [resolution, resolution, resolution, *source_params, resolution, resolution],
+                    )
+                source_resolution = resolution
 
-    # Validate interval
-    if interval not in ['s', 'm', 'h', 'd']:
-        raise ValidationError("Interval must be one of 's', 'm', 'h', or 'd'.")
+def refresh_bar_rollups(keys):
+    """ Bring the rollups up to date after BarData rows with these (symbol_id, timestamp) keys were written or deleted. """
+    ranges = {}
+    for symbol_id, timestamp in keys:
+        ranges.setdefault(symbol_id, []).append((timestamp, timestamp))
+    if not ranges:
+        return
+    _refresh_rollup_ranges(ranges)
+    bounds = {symbol_id: (min(low for low, _ in symbol_ranges), max(high for _, high in symbol_ranges)) for symbol_id, symbol_ranges in ranges.items()}
+    transaction.on_commit(partial(mark_bars_written, bounds))
+    logger.info(f"Refreshed bar rollups for {len(ranges)} symbols.")
 
-    # Call the aggregate_bars function
-    try:
-        results = aggregate_bars(ticker_list, start_date, end_date, interval)
-    except Exception as e:
-        logger.error(f"Error in aggregate_bars: {e}")
-        raise ValidationError("An error occurred while aggregating bars.")
+def rebuild_bar_rollups(symbol_ids=None):
+    """ Drop and rebuild the rollups of the given symbols (all symbols with bars by default) from BarData. """
+    bars = BarData.objects.all()
+    rollups = BarRollup.objects.all()
+    if symbol_ids is not None:
+        bars = bars.filter(symbol_id__in=symbol_ids)
+        rollups = rollups.filter(symbol_id__in=symbol_ids)
+
+    with transaction.atomic():
+        rollups.delete()
+        bounds = bars.values('symbol_id').annotate(low=models.Min('timestamp'), high=models.Max('timestamp'))
+        ranges = {row['symbol_id']: [(row['low'], row['high'])] for row in bounds}
+        _refresh_rollup_ranges(ranges)
+        transaction.on_commit(partial(mark_bars_written, {symbol_id: bounds for symbol_id, [bounds] in ranges.items()}))
+    logger.info(f"Rebuilt bar rollups for {len(ranges)} symbols.")
+    return len(ranges)
+
+def _refresh_rollups(model, keys):
+    if model is BarData:
+        refresh_bar_rollups(keys)
+
+def rollup_resolution(bucket_size, offset):
+    """ The coarsest rollup level whose buckets tile the requested buckets exactly, or None. """
+    for resolution in reversed(ROLLUP_RESOLUTIONS):
+        if bucket_size % resolution == 0 and offset % resolution == 0:
+            return resolution
+    return None
+
+def aggregate_bars(tickers, start_timestamp, end_timestamp, interval, anchor=None):
+    """
+    OHLCV bars for tickers over [start_timestamp, end_timestamp] (nanoseconds), resampled to interval
+    (N + unit, see parse_interval) with buckets shifted by anchor.
+
+    Buckets are integer arithmetic on the nanosecond timestamp and the same SQL runs on PostgreSQL and SQLite.
+    When the buckets are whole multiples of a rollup level, the part of the range covered by complete rollup
+    buckets is read from BarRollup and only the partial edges from BarData. Prices are returned as floats and
+    the bucket start as an int timestamp.
+    """
+    bucket_size, offset = parse_interval(interval, anchor)
+    symbols = dict(Symbol.objects.filter(ticker__in=tickers).values_list('id', 'ticker'))
+    if not symbols:
+        return []
+    return _aggregate(symbols, start_timestamp, end_timestamp, bucket_size, offset)
+
+def _aggregate(symbols, start_timestamp, end_timestamp, bucket_size, offset):
+    symbol_ids = list(symbols)
+    source = _bars_source(len(symbol_ids))
+    source_params = [*symbol_ids, start_timestamp, end_timestamp]
+    resolution = rollup_resolution(bucket_size, offset)
+    if resolution is not None:
+        first = -(-start_timestamp // resolution) * resolution
+        last = (end_timestamp + 1) // resolution * resolution - resolution
+        if first <= last:
+            source = f"{source} UNION ALL {_bars_source(len(symbol_ids), resolution)} UNION ALL {source}"
+            source_params = [
+                *symbol_ids, start_timestamp, first - 1,
+                *symbol_ids, resolution, first, last,
+                *symbol_ids, last + resolution, end_timestamp,
+            ]
+
+    bucket = "((src.timestamp - %s) / %s) * %s + %s"
+    bucket_params = [offset, bucket_size, bucket_size, offset]
+    query = f"{_ohlcv_query(f'({source})', bucket, cast=True)} ORDER BY bucket, symbol_id"
+
+    with connection.cursor() as cursor:
+        cursor.execute(query, [*bucket_params, *source_params, *bucket_params])
+        rows = cursor.fetchall()
+
+    return [
+        {
+            'symbol_id': symbol_id,
+            'ticker': symbols[symbol_id],
+            'timestamp': timestamp,
+            'open': open_,
+            'high': high,
+            'low': low,
+            'close': close,
+            'volume': volume,
+        }
+        for symbol_id, timestamp, open_, high, low, close, volume in rows
+    ]
+
+def mark_bars_written(bounds):
+    """
+    Record a committed BarData write per symbol as (sequence number, (earliest, latest) timestamp touched).
+    Sequence keys are claimed with cache.add, so concurrent writers never share one.
+    """
+    for symbol_id, (low, high) in bounds.items():
+        counter = f'{BAR_WRITES_CACHE_PREFIX}:{symbol_id}'
+        cache.add(counter, time.time_ns(), timeout=None)
+        while True:
+            try:
+                sequence = cache.incr(counter)
+            except ValueError: # counter evicted; a fresh time-based start invalidates older cached entries
+                cache.add(counter, time.time_ns(), timeout=None)
+                continue
+            if cache.add(f'{counter}:{sequence}', (low, high), timeout=BAR_WRITE_MARK_TIMEOUT):
+                break
+
+def _write_sequences(symbol_ids):
+    counters = {symbol_id: f'{BAR_WRITES_CACHE_PREFIX}:{symbol_id}' for symbol_id in symbol_ids}
+    for counter in counters.values():
+        cache.add(counter, time.time_ns(), timeout=None)
+    stored = cache.get_many(counters.values())
+    return {symbol_id: stored.get(counter) for symbol_id, counter in counters.items()}
+
+def _unchanged_within(sequences, start, end):
+    """ True if no write since sequences touched a bar in [start, end] (unknown history counts as a change). """
+    current = _write_sequences(sequences)
+    for symbol_id, sequence in sequences.items():
+        latest = current[symbol_id]
+        if latest is None or sequence is None or not 0 <= latest - sequence <= MAX_TRACKED_BAR_WRITES:
+            return False
+        if latest == sequence:
+            continue
+        keys = [f'{BAR_WRITES_CACHE_PREFIX}:{symbol_id}:{n}' for n in range(sequence + 1, latest + 1)]
+        marks = cache.get_many(keys)
+        if len(marks) < len(keys) or any(low <= end and high >= start for low, high in marks.values()):
+            return False
+    return True
+
+def cached_aggregate_bars(tickers, start_timestamp, end_timestamp, interval, anchor=None, now=None):
+    """
+    aggregate_bars with the closed part of the range cached indefinitely.
+
+    Buckets before the one containing now are closed: they are cached under (symbols, range, interval, anchor)
+    and reused until a write touches a bar inside the cached range (see mark_bars_written).
+    The trailing open bucket is always recomputed.
+    """
+    bucket_size, offset = parse_interval(interval, anchor)
+    symbols = dict(Symbol.objects.filter(ticker__in=tickers).values_list('id', 'ticker'))
+    if not symbols:
+        return []
+
+    now = time.time_ns() if now is None else now
+    open_bucket = (now - offset) // bucket_size * bucket_size + offset
+    closed_end = min(end_timestamp, open_bucket - 1)
+
+    bars = []
+    if closed_end >= start_timestamp:
+        signature = json.dumps([sorted(symbols), start_timestamp, closed_end, bucket_size, offset])
+        key = f'{AGGREGATE_CACHE_PREFIX}:{hashlib.sha256(signature.encode()).hexdigest()}'
+        entry = cache.get(key)
+        if entry is not None and _unchanged_within(entry['sequences'], start_timestamp, closed_end):
+            logger.info(f"Aggregate cache hit for {len(symbols)} symbols up to {closed_end}.")
+            bars = entry['bars']
+        else:
+            sequences = _write_sequences(symbols)
+            bars = _aggregate(symbols, start_timestamp, closed_end, bucket_size, offset)
+            cache.set(key, {'sequences': sequences, 'bars': bars}, timeout=None)
+
+    if end_timestamp > closed_end:
+        bars = bars + _aggregate(symbols, max(start_timestamp, closed_end + 1), end_timestamp, bucket_size, offset)
+    return bars
+
+class PriceDataLRU:
+    """ Thread-safe in-process LRU of compressed price data entries, bounded by entry count and total bytes. """
+    def __init__(self, max_entries, max_bytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous['data'])
+            if len(entry['data']) > self.max_bytes:
+                return
+            self.entries[key] = entry
+            self.size += len(entry['data'])
+            while len(self.entries) > self.max_entries or self.size > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted['data'])
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+price_data_lru = PriceDataLRU(settings.PRICE_DATA_CACHE_ENTRIES, settings.PRICE_DATA_CACHE_BYTES)
+
+def _render_price_data(symbols, start_timestamp, end_timestamp, resolution):
+    if resolution is None:
+        queryset = BarData.objects.filter(symbol_id__in=symbols, timestamp__gte=start_timestamp, timestamp__lte=end_timestamp)
+        rows = fast_values(queryset.order_by('timestamp', 'symbol_id'))
+        body = '[' + ','.join(iter_json_rows(BarData, rows)) + ']'
+    else:
+        bucket_size, offset = parse_interval(resolution)
+        body = json.dumps(_aggregate(symbols, start_timestamp, end_timestamp, bucket_size, offset), default=str)
+    return zlib.compress(body.encode())
+
+def cached_price_data(tickers, start_timestamp, end_timestamp, resolution=None):
+    """
+    Bars of tickers over [start_timestamp, end_timestamp] as serializer-shaped dicts, raw (resolution None) or
+    resampled to an interval such as '1h'. Backtests and live sessions with the same universe and window share one entry.
+
+    Entries are zlib-compressed JSON keyed on (sorted tickers, start, end, resolution), kept in a bounded in-process LRU
+    and, with PRICE_DATA_SHARED_CACHE, in the cache shared by workers. An entry stays valid until a write marked by
+    mark_bars_written touches one of its symbols inside its range. Writes that bypass the market data services are not seen.
+    """
+    if not tickers or start_timestamp is None or end_timestamp is None:
+        return []
+    signature = json.dumps([sorted(tickers), start_timestamp, end_timestamp, resolution])
+    key = f'{PRICE_DATA_CACHE_PREFIX}:{hashlib.sha256(signature.encode()).hexdigest()}'
+
+    entry = price_data_lru.get(key)
+    if entry is None and settings.PRICE_DATA_SHARED_CACHE:
+        entry = cache.get(key)
+    if entry is not None and _unchanged_within(entry['sequences'], start_timestamp, end_timestamp):
+        logger.info(f"Price data cache hit for {len(tickers)} tickers over {start_timestamp}-{end_timestamp}.")
+        price_data_lru.set(key, entry)
+        return json.loads(zlib.decompress(entry['data']))
+
+    symbols = dict(Symbol.objects.filter(ticker__in=tickers).values_list('id', 'ticker'))
+    sequences = _write_sequences(symbols)
+    data = _render_price_data(symbols, start_timestamp, end_timestamp, resolution)
+    if len(symbols) == len(set(tickers)): # a ticker without a symbol yet would have no write marks to invalidate on
+        entry = {'sequences': sequences, 'data': data}
+        price_data_lru.set(key, entry)
+        if settings.PRICE_DATA_SHARED_CACHE:
+            cache.set(key, entry, timeout=None)
+    return json.loads(zlib.decompress(data))
 
-    return Response(results)
\ No newline at end of file
+def clear_price_data_cache():
+    """ Drop the in-process price data entries; shared entries are left to the write marks. """
+    price_data_lru.clear()
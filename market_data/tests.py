@@ -1,4 +1,9 @@
+import io
+import base64
 import json
+import gzip
+from unittest import mock
+from django.core.cache import cache
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.authtoken.models import Token
@@ -6,7 +11,10 @@ from rest_framework.test import APIClient, APITestCase
 from decimal import Decimal
 from account.models import CustomUser
 from symbols.models import Symbol, SecurityType
-from .models import BarData, QuoteData, Symbol
+from .models import BarData, BarRollup, QuoteData, Symbol
+from . import services
+from .renderers import read_columnar, COLUMNAR_MEDIA_TYPE
+from .services import MAX_LINE_BYTES, STREAM_CHUNK_SIZE, _iter_chunks, aggregate_bars, cached_aggregate_bars, parse_interval, refresh_bar_rollups, rebuild_bar_rollups, ingest_market_data, upsert_market_data
 
 # TODO: test options/cryptocurrency models
 
@@ -88,6 +96,104 @@ class BarDataViewSetTest(Base):
         self.assertEqual(response.data[0]['symbol'], self.ticker)
         self.assertEqual(response.data[1]['symbol'], self.ticker)
 
+    def test_keyset_pagination(self):
+        msft = Symbol.objects.create(ticker="MSFT", security_type=self.security_type)
+        for symbol in (self.symbol, msft):
+            for i in range(1, 4):
+                BarData.objects.create(symbol=symbol, timestamp=1707307740000000000 + i, open=1, high=1, low=1, close=1, volume=1)
+        url = f"{self.url}?tickers=AAPL,MSFT&page_size=3"
+
+        # test
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            pages.append(response.data['results'])
+            url = response.data['next']
+
+        # validate
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+        keys = [(row['timestamp'], row['symbol']) for page in pages for row in page]
+        self.assertEqual(len(set(keys)), 7)
+        self.assertEqual(keys, sorted(keys, key=lambda key: (key[0], key[1] == 'MSFT')))
+        self.assertIsNone(response.data['next_cursor'])
+
+    def test_invalid_cursor(self):
+        cursors = ["not-a-cursor"] + [
+            base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+            for position in ({"a": 1}, [1], [[1], 2], [{"a": 1}, 2], [True, 2], ["soon", 2], [1707307740000000000, "x"])
+        ]
+
+        # test
+        responses = [self.client.get(f"{self.url}?cursor={cursor}") for cursor in cursors]
+
+        # validate
+        for response in responses:
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_fast_read_matches_serializer(self):
+        msft = Symbol.objects.create(ticker="MSFT", security_type=self.security_type)
+        BarData.objects.create(symbol=msft, timestamp=1707307750000000000, open=1.5, high=2, low=1, close=1.25, volume=7)
+        url = f"{self.url}?tickers=AAPL,MSFT"
+
+        # test
+        expected = self.client.get(url)
+        response = self.client.get(f"{url}&fast=true")
+
+        # validate
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(json.loads(b''.join(response.streaming_content)), json.loads(expected.content))
+
+    def test_fast_read_paginated(self):
+        for i in range(1, 4):
+            BarData.objects.create(symbol=self.symbol, timestamp=1707307740000000000 + i, open=1, high=1, low=1, close=1, volume=1)
+        url = f"{self.url}?fast=1&page_size=3"
+
+        # test
+        first = json.loads(self.client.get(url).content)
+        second = json.loads(self.client.get(first['next']).content)
+
+        # validate
+        self.assertEqual(len(first['results']), 3)
+        self.assertEqual(len(second['results']), 1)
+        self.assertIsNone(second['next'])
+        self.assertEqual(second['results'][0]['timestamp'], 1707307740000000003)
+        self.assertEqual(second['results'][0]['open'], '1.0000')
+
+    def test_columnar_export(self):
+        BarData.objects.create(symbol=self.symbol, timestamp=1707307750000000000, open=1.5, high=2.25, low=1, close=1.75, volume=7)
+        url = f"{self.url}?tickers=AAPL"
+
+        # test
+        response = self.client.get(url, HTTP_ACCEPT=COLUMNAR_MEDIA_TYPE)
+        header, columns = read_columnar(b''.join(response.streaming_content))
+
+        # validate
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], COLUMNAR_MEDIA_TYPE)
+        self.assertEqual(header['symbols'], {str(self.symbol.id): self.ticker})
+        self.assertEqual(columns['timestamp'].dtype.str, '<i8')
+        self.assertEqual(columns['timestamp'].tolist(), [1707307740000000000, 1707307750000000000])
+        self.assertEqual(columns['open'].tolist(), [101.0, 1.5])
+        self.assertEqual(columns['high'].tolist(), [101.0, 2.25])
+        self.assertEqual(columns['volume'].tolist(), [100, 7])
+
+    def test_columnar_export_scaled_and_paginated(self):
+        BarData.objects.create(symbol=self.symbol, timestamp=1707307750000000000, open=1.5, high=2.25, low=1, close=1.7501, volume=7)
+        url = f"{self.url}?format=columnar&scaled=true&page_size=1"
+
+        # test
+        first = self.client.get(url)
+        first_header, first_columns = read_columnar(first.content)
+        second_header, second_columns = read_columnar(self.client.get(f"{url}&cursor={first_header['next_cursor']}").content)
+
+        # validate
+        self.assertEqual(first_columns['timestamp'].tolist(), [1707307740000000000])
+        self.assertEqual(second_columns['close'].tolist(), [17501])
+        self.assertEqual(second_header['columns'][3], {'name': 'close', 'dtype': '<i8', 'scale': 4})
+        self.assertIsNone(second_header['next_cursor'])
+
     def test_create_bar_data(self):
         ticker="F"
         symbol = Symbol.objects.create(ticker=ticker, security_type=self.security_type)
@@ -176,6 +282,206 @@ class BarDataViewSetTest(Base):
         self.assertEqual(len(response.data['errors']), 1)
         self.assertEqual(len(response.data['created']), 1)
 
+    def test_bulk_ingest_bar_data(self):
+        ticker="F"
+        symbol = Symbol.objects.create(ticker=ticker, security_type=self.security_type)
+
+        data= [{
+            "symbol":ticker,    
+            "timestamp":1707307750000000000,
+            "open":100.9999,
+            "high":100.9999,
+            "low":100.9999,
+            "close":100.9999,    
+            "volume":100,
+        },{
+            "symbol":ticker,    
+            "timestamp":1707307760000000000,
+            "open":"99.9999",
+            "high":"100.9999",
+            "low":"100.9999",
+            "close":"100.9999",    
+            "volume":"100"
+        }]
+
+        url=f"{self.url}bulk_ingest/"
+
+        # test
+        response = self.client.post(url, data, format='json')
+
+        # validate
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data, {'created': 2, 'errors': []})
+        self.assertEqual(BarData.objects.count(), 3)
+        self.assertEqual(BarData.objects.last().symbol.ticker, 'F')
+        self.assertEqual(BarData.objects.last().open, Decimal('99.9999'))
+
+    def test_bulk_ingest_reports_error_indices(self):
+        row = {
+            "symbol":self.ticker,    
+            "timestamp":1707307750000000000,
+            "open":99.9999,
+            "high":100.9999,
+            "low":100.9999,
+            "close":100.9999,    
+            "volume":100
+        }
+        data = [
+            dict(row, timestamp=1707307740000000000),       # already stored
+            row,
+            dict(row),                                      # duplicate within the batch
+            dict(row, symbol="UNKNOWN", timestamp=1),
+            dict(row, timestamp=2, open="1.123456"),
+            {k: v for k, v in row.items() if k != 'volume'},
+            dict(row, symbol=[self.ticker], timestamp=3),   # unhashable ticker
+        ]
+
+        url=f"{self.url}bulk_ingest/"
+
+        # test
+        response = self.client.post(url, data, format='json')
+
+        # validate
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual([error['index'] for error in response.data['errors']], [1, 3, 4, 5, 6, 7])
+        self.assertIn('non_field_errors', response.data['errors'][0]['errors'])
+        self.assertIn('symbol', response.data['errors'][2]['errors'])
+        self.assertIn('open', response.data['errors'][3]['errors'])
+        self.assertIn('volume', response.data['errors'][4]['errors'])
+        self.assertEqual(response.data['errors'][5]['errors']['symbol'], ['Invalid value.'])
+        self.assertEqual(BarData.objects.count(), 2)
+
+    def test_bulk_upsert_ignore_duplicates(self):
+        row = {
+            "symbol":self.ticker,    
+            "timestamp":1707307740000000000,
+            "open":99.9999,
+            "high":99.9999,
+            "low":99.9999,
+            "close":99.9999,    
+            "volume":99999,
+        }
+        data = [row, dict(row, timestamp=1707307750000000000), dict(row, timestamp=1707307750000000000, volume=1)]
+
+        url=f"{self.url}bulk_upsert/?on_conflict=ignore"
+
+        # test
+        response = self.client.post(url, data, format='json')
+
+        # validate
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'inserted': 1, 'updated': 0, 'skipped': 2, 'errors': []})
+        self.assertEqual(BarData.objects.count(), 2)
+        self.bar_data.refresh_from_db()
+        self.assertEqual(self.bar_data.open, Decimal('100.99999').quantize(Decimal('0.0001')))
+        self.assertEqual(BarData.objects.get(timestamp=1707307750000000000).volume, 99999)
+
+    def test_bulk_upsert_overwrite(self):
+        row = {
+            "symbol":self.ticker,    
+            "timestamp":1707307740000000000,
+            "open":99.9999,
+            "high":99.9999,
+            "low":99.9999,
+            "close":99.9999,    
+            "volume":99999,
+        }
+        data = [row, dict(row, timestamp=1707307750000000000), dict(row, timestamp=1707307750000000000, volume=1)]
+
+        url=f"{self.url}bulk_upsert/?on_conflict=overwrite"
+
+        # test
+        response = self.client.post(url, data, format='json')
+        replay = self.client.post(url, data, format='json')
+
+        # validate
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'inserted': 1, 'updated': 1, 'skipped': 1, 'errors': []})
+        self.assertEqual(replay.data, {'inserted': 0, 'updated': 2, 'skipped': 1, 'errors': []})
+        self.assertEqual(BarData.objects.count(), 2)
+        self.bar_data.refresh_from_db()
+        self.assertEqual(self.bar_data.open, Decimal('99.9999'))
+        self.assertEqual(BarData.objects.get(timestamp=1707307750000000000).volume, 1)
+
+    def test_bulk_upsert_invalid_policy(self):
+        url=f"{self.url}bulk_upsert/?on_conflict=merge"
+
+        # test
+        response = self.client.post(url, [], format='json')
+
+        # validate
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_stream_ingest_ndjson(self):
+        lines = [json.dumps({
+            "symbol":self.ticker,
+            "timestamp":1707307750000000000 + i,
+            "open":99.9999,
+            "high":100.9999,
+            "low":100.9999,
+            "close":100.9999,
+            "volume":100
+        }) for i in range(5)]
+        body = "\n".join(lines + ["not json"]) + "\n"
+
+        url=f"{self.url}stream_ingest/?batch_size=2"
+
+        # test
+        response = self.client.post(url, body, content_type='application/x-ndjson')
+
+        # validate
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual(response.data['rows'], 6)
+        self.assertEqual(response.data['created'], 5)
+        self.assertEqual(response.data['error_count'], 1)
+        self.assertEqual(response.data['errors'][0]['index'], 6)
+        self.assertEqual(BarData.objects.count(), 6)
+
+    def test_stream_ingest_gzip_csv_upsert(self):
+        body = (
+            "symbol,timestamp,open,high,low,close,volume\n"
+            f"{self.ticker},1707307740000000000,1.5,2.5,0.5,2.0,10\n"
+            f"{self.ticker},1707307750000000000,1.5,2.5,0.5,2.0,20\n"
+        )
+
+        url=f"{self.url}stream_ingest/?on_conflict=overwrite"
+
+        # test
+        response = self.client.post(url, gzip.compress(body.encode()), content_type='text/csv', HTTP_CONTENT_ENCODING='gzip')
+
+        # validate
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['inserted'], 1)
+        self.assertEqual(response.data['updated'], 1)
+        self.bar_data.refresh_from_db()
+        self.assertEqual(self.bar_data.volume, 10)
+        self.assertEqual(self.bar_data.close, Decimal('2.0'))
+
+    def test_stream_ingest_bounded_lines(self):
+        url=f"{self.url}stream_ingest/"
+        bomb = gzip.compress(b"x" * (4 * MAX_LINE_BYTES))
+
+        # test
+        response = self.client.post(url, bomb, content_type='application/x-ndjson', HTTP_CONTENT_ENCODING='gzip')
+        chunks = list(_iter_chunks(io.BytesIO(bomb), 'gzip'))
+
+        # validate
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("limited", response.data['error'])
+        self.assertEqual(sum(len(chunk) for chunk in chunks), 4 * MAX_LINE_BYTES)
+        self.assertLessEqual(max(len(chunk) for chunk in chunks), STREAM_CHUNK_SIZE)
+        self.assertEqual(BarData.objects.count(), 1)
+
+    def test_stream_ingest_unsupported_media_type(self):
+        url=f"{self.url}stream_ingest/"
+
+        # test
+        response = self.client.post(url, [], format='json')
+
+        # validate
+        self.assertEqual(response.status_code, status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+
     def test_update_bar_data(self):
 
         data= {
@@ -284,6 +590,16 @@ class QuoteDataViewSetTest(Base):
         self.assertEqual(response.data[0]['symbol'], self.ticker)
         self.assertEqual(response.data[1]['symbol'], self.ticker)
 
+    def test_columnar_export_quote_data(self):
+        # test
+        response = self.client.get(self.url, HTTP_ACCEPT=COLUMNAR_MEDIA_TYPE)
+        header, columns = read_columnar(b''.join(response.streaming_content))
+
+        # validate
+        self.assertEqual(header['model'], 'quotedata')
+        self.assertEqual(columns['ask'].tolist(), [90.999])
+        self.assertEqual(columns['bid_size'].tolist(), [9990.8778])
+
     def test_create_quote_data(self):
         ticker="F"
         symbol = Symbol.objects.create(ticker=ticker, security_type=self.security_type)
@@ -366,6 +682,82 @@ class QuoteDataViewSetTest(Base):
         self.assertEqual(len(response.data['errors']), 1)
         self.assertEqual(len(response.data['created']), 1)
 
+    def test_bulk_ingest_quote_data(self):
+        data= [{
+            "symbol":self.ticker,    
+            "timestamp":1704862800,
+            "ask":111.999,
+            "ask_size":111.999,
+            "bid":111.99,
+            "bid_size":1111.8778
+        },{
+            "symbol":self.ticker,    
+            "timestamp":1704862900,
+            "ask":90.999,
+            "ask_size":9849.999,
+            "bid":89.99,
+            "bid_size":9990.8778
+        }]
+
+        url=f"{self.url}bulk_ingest/"
+
+        # test
+        response = self.client.post(url, data, format='json')
+
+        # validate
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual(response.data['errors'][0]['index'], 1)
+        self.assertEqual(QuoteData.objects.count(), 2)
+        self.assertEqual(QuoteData.objects.last().bid_size, Decimal('9990.8778'))
+
+    def test_bulk_upsert_quote_data(self):
+        data= [{
+            "symbol":self.ticker,    
+            "timestamp":1704862800,
+            "ask":111.999,
+            "ask_size":111.999,
+            "bid":111.99,
+            "bid_size":1111.8778
+        },{
+            "symbol":"UNKNOWN",    
+            "timestamp":1704862900,
+            "ask":90.999,
+            "ask_size":9849.999,
+            "bid":89.99,
+            "bid_size":9990.8778
+        }]
+
+        url=f"{self.url}bulk_upsert/?on_conflict=overwrite"
+
+        # test
+        response = self.client.post(url, data, format='json')
+
+        # validate
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual(response.data['updated'], 1)
+        self.assertEqual(response.data['errors'][0]['index'], 2)
+        self.quote_data.refresh_from_db()
+        self.assertEqual(self.quote_data.ask, Decimal('111.999'))
+
+    def test_stream_ingest_quote_data(self):
+        body = (
+            "symbol,timestamp,ask,ask_size,bid,bid_size\n"
+            f"{self.ticker},1704862900,90.999,9849.999,89.99,9990.8778\n"
+            f"{self.ticker},1704863000,90.999,,89.99,9990.8778\n"
+        )
+
+        url=f"{self.url}stream_ingest/"
+
+        # test
+        response = self.client.post(url, body, content_type='text/csv; charset=utf-8')
+
+        # validate
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual(response.data['created'], 1)
+        self.assertIn('ask_size', response.data['errors'][0]['errors'])
+        self.assertEqual(QuoteData.objects.count(), 2)
+
     def test_update_quote_data(self):
         data= {
             "symbol":self.ticker,    
@@ -406,3 +798,232 @@ class QuoteDataViewSetTest(Base):
         # validate
         self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
         self.assertEqual(QuoteData.objects.count(), 0)
+
+class AggregateBarsTest(Base):
+    def setUp(self):
+        super().setUp()
+        self.security_type = SecurityType.objects.create(value="STOCK")
+        self.aapl = Symbol.objects.create(ticker="AAPL", security_type=self.security_type)
+        self.msft = Symbol.objects.create(ticker="MSFT", security_type=self.security_type)
+
+        self.day = 86400 * 1_000_000_000
+        self.hour = 3600 * 1_000_000_000
+        self.start = 1710806400000000000 # 2024-03-19 00:00:00
+        bars = [
+            # (symbol, offset, open, high, low, close, volume)
+            (self.aapl, 2 * self.hour, 105, 112, 104, 110, 1500),
+            (self.aapl, 0, 100, 106, 99, 105, 1000),
+            (self.aapl, 1 * self.hour, 110, 111, 98, 108, 1300),
+            (self.aapl, self.day, 108, 115, 107, 114, 2000),
+            (self.msft, 0, 400, 401, 399, 400.5, 10),
+        ]
+        BarData.objects.bulk_create([
+            BarData(symbol=symbol, timestamp=self.start + offset, open=o, high=h, low=l, close=c, volume=v)
+            for symbol, offset, o, h, l, c, v in bars
+        ])
+        refresh_bar_rollups(BarData.objects.values_list('symbol_id', 'timestamp'))
+
+    def test_daily_aggregation(self):
+        # test
+        result = aggregate_bars(["AAPL", "MSFT"], self.start, self.start + 2 * self.day, 'd')
+
+        # validate
+        self.assertEqual(result, [
+            {'symbol_id': self.aapl.id, 'ticker': 'AAPL', 'timestamp': self.start,
+             'open': 100.0, 'high': 112.0, 'low': 98.0, 'close': 110.0, 'volume': 3800},
+            {'symbol_id': self.msft.id, 'ticker': 'MSFT', 'timestamp': self.start,
+             'open': 400.0, 'high': 401.0, 'low': 399.0, 'close': 400.5, 'volume': 10},
+            {'symbol_id': self.aapl.id, 'ticker': 'AAPL', 'timestamp': self.start + self.day,
+             'open': 108.0, 'high': 115.0, 'low': 107.0, 'close': 114.0, 'volume': 2000},
+        ])
+
+    def test_hourly_aggregation_respects_range(self):
+        # test
+        result = aggregate_bars(["AAPL"], self.start + self.hour, self.start + 2 * self.hour, 'h')
+
+        # validate
+        self.assertEqual([bar['timestamp'] for bar in result], [self.start + self.hour, self.start + 2 * self.hour])
+        self.assertEqual(result[0]['open'], 110.0)
+        self.assertEqual(result[1]['close'], 110.0)
+
+    def test_multiple_unit_interval(self):
+        # test
+        result = aggregate_bars(["AAPL"], self.start, self.start + 2 * self.day, '2h')
+
+        # validate
+        self.assertEqual([bar['timestamp'] for bar in result], [self.start, self.start + 2 * self.hour, self.start + self.day])
+        self.assertEqual((result[0]['open'], result[0]['close'], result[0]['volume']), (100.0, 108.0, 2300))
+
+    def test_anchored_session_buckets(self):
+        # test
+        result = aggregate_bars(["AAPL"], self.start, self.start + 2 * self.day, '1d', anchor='2h')
+
+        # validate
+        self.assertEqual([bar['timestamp'] for bar in result], [self.start - 22 * self.hour, self.start + 2 * self.hour])
+        self.assertEqual((result[0]['open'], result[0]['close']), (100.0, 108.0))
+        self.assertEqual((result[1]['open'], result[1]['close']), (105.0, 114.0))
+
+    def test_weekly_buckets_start_monday(self):
+        # test
+        result = aggregate_bars(["AAPL"], self.start, self.start + 2 * self.day, '1w')
+
+        # validate
+        monday = self.start - self.day # 2024-03-18
+        self.assertEqual([bar['timestamp'] for bar in result], [monday])
+        self.assertEqual(result[0]['volume'], 5800)
+
+    def test_parse_interval(self):
+        self.assertEqual(parse_interval('m'), (60 * 1_000_000_000, 0))
+        self.assertEqual(parse_interval('15m'), (15 * 60 * 1_000_000_000, 0))
+        self.assertEqual(parse_interval('4h', anchor='-2h'), (4 * self.hour, 2 * self.hour))
+        self.assertEqual(parse_interval('1w'), (7 * self.day, 4 * self.day))
+        for interval in ('', '0m', '5', '5y', '-1h'):
+            with self.assertRaises(ValueError):
+                parse_interval(interval)
+
+    def test_unknown_ticker_and_invalid_interval(self):
+        # test
+        self.assertEqual(aggregate_bars(["TSLA"], self.start, self.start + self.day, 'd'), [])
+
+        # validate
+        with self.assertRaises(ValueError):
+            aggregate_bars(["AAPL"], self.start, self.start + self.day, 'y')
+
+class BarRollupTest(Base):
+    def setUp(self):
+        super().setUp()
+        self.security_type = SecurityType.objects.create(value="STOCK")
+        self.symbol = Symbol.objects.create(ticker="AAPL", security_type=self.security_type)
+        self.hour = 3600 * 1_000_000_000
+        self.day = 24 * self.hour
+        self.start = 1710806400000000000 # 2024-03-19 00:00:00
+        self.url = '/api/bardata/'
+
+    def bars(self, offsets, price=100):
+        return [{'symbol': "AAPL", 'timestamp': self.start + offset, 'open': price, 'high': price + 1,
+                 'low': price - 1, 'close': price, 'volume': 10} for offset in offsets]
+
+    def rollups(self, resolution):
+        return list(BarRollup.objects.filter(resolution=resolution).values_list('timestamp', 'volume', 'high'))
+
+    def test_ingest_maintains_rollups(self):
+        # test
+        ingest_market_data(BarData, self.bars([0, 30 * 60 * 10**9, self.hour, self.day + self.hour]))
+
+        # validate
+        self.assertEqual(self.rollups(self.hour), [
+            (self.start, 20, Decimal('101')), (self.start + self.hour, 10, Decimal('101')), (self.start + self.day + self.hour, 10, Decimal('101')),
+        ])
+        self.assertEqual(self.rollups(self.day), [(self.start, 30, Decimal('101')), (self.start + self.day, 10, Decimal('101'))])
+
+    def test_upsert_overwrite_updates_rollups(self):
+        ingest_market_data(BarData, self.bars([0, self.hour]))
+
+        # test
+        upsert_market_data(BarData, self.bars([self.hour], price=200), on_conflict='overwrite')
+
+        # validate
+        self.assertEqual(self.rollups(self.day), [(self.start, 20, Decimal('201'))])
+
+    def test_api_writes_maintain_rollups(self):
+        # test
+        response = self.client.post(f'{self.url}bulk_create/', self.bars([0, self.hour]), format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        bar = BarData.objects.get(timestamp=self.start + self.hour)
+        response = self.client.delete(f'{self.url}{bar.id}/')
+
+        # validate
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(self.rollups(self.hour), [(self.start, 10, Decimal('101'))])
+        self.assertEqual(self.rollups(self.day), [(self.start, 10, Decimal('101'))])
+
+    def test_aggregate_reads_rollups_for_interior(self):
+        ingest_market_data(BarData, self.bars([self.hour * i for i in range(72)]))
+        BarRollup.objects.filter(resolution=self.day, timestamp=self.start + self.day).update(high=500)
+
+        # test
+        result = aggregate_bars(["AAPL"], self.start + self.hour, self.start + 3 * self.day - 1, '1d')
+
+        # validate
+        self.assertEqual([bar['high'] for bar in result], [101.0, 500.0, 101.0])
+        self.assertEqual([bar['volume'] for bar in result], [230, 240, 240])
+
+    def test_rebuild_bar_rollups(self):
+        ingest_market_data(BarData, self.bars([0, self.day]))
+        BarRollup.objects.all().delete()
+
+        # test
+        rebuilt = rebuild_bar_rollups()
+
+        # validate
+        self.assertEqual(rebuilt, 1)
+        self.assertEqual(self.rollups(self.day), [(self.start, 10, Decimal('101')), (self.start + self.day, 10, Decimal('101'))])
+
+class AggregateBarsEndpointTest(Base):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.security_type = SecurityType.objects.create(value="STOCK")
+        self.symbol = Symbol.objects.create(ticker="AAPL", security_type=self.security_type)
+        self.hour = 3600 * 1_000_000_000
+        self.day = 24 * self.hour
+        self.start = 1710806400000000000 # 2024-03-19 00:00:00
+        self.end = self.start + 3 * self.day - 1
+        self.url = '/api/bardata/aggregate-bars/'
+        self.ingest([0, self.hour, self.day, 2 * self.day])
+
+    def ingest(self, offsets, price=100):
+        bars = [{'symbol': "AAPL", 'timestamp': self.start + offset, 'open': price, 'high': price + 1,
+                 'low': price - 1, 'close': price, 'volume': 10} for offset in offsets]
+        with self.captureOnCommitCallbacks(execute=True):
+            upsert_market_data(BarData, bars, on_conflict='overwrite')
+
+    def test_aggregate_bars_endpoint(self):
+        # test
+        response = self.client.get(self.url, {'tickers': 'AAPL', 'start_date': self.start, 'end_date': self.end, 'interval': '1d'})
+
+        # validate
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([bar['timestamp'] for bar in response.data], [self.start, self.start + self.day, self.start + 2 * self.day])
+        self.assertEqual([bar['volume'] for bar in response.data], [20, 10, 10])
+        self.assertEqual(response.data[0]['ticker'], "AAPL")
+
+    def test_aggregate_bars_endpoint_validation(self):
+        # test
+        missing = self.client.get(self.url, {'start_date': self.start, 'end_date': self.end})
+        dates = self.client.get(self.url, {'tickers': 'AAPL', 'start_date': 'yesterday', 'end_date': self.end})
+        interval = self.client.get(self.url, {'tickers': 'AAPL', 'start_date': self.start, 'end_date': self.end, 'interval': '5y'})
+
+        # validate
+        self.assertEqual(missing.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(dates.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(interval.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('error', interval.data)
+
+    def test_closed_buckets_served_from_cache(self):
+        now = self.start + 2 * self.day + self.hour
+        cached_aggregate_bars(["AAPL"], self.start, self.end, '1d', now=now)
+
+        # test
+        with mock.patch.object(services, '_aggregate', wraps=services._aggregate) as aggregate:
+            result = cached_aggregate_bars(["AAPL"], self.start, self.end, '1d', now=now)
+
+        # validate
+        self.assertEqual(aggregate.call_count, 1) # only the trailing open bucket
+        self.assertEqual(aggregate.call_args.args[1:3], (self.start + 2 * self.day, self.end))
+        self.assertEqual([bar['volume'] for bar in result], [20, 10, 10])
+
+    def test_live_edge_writes_keep_cache_and_backfills_invalidate(self):
+        now = self.start + 2 * self.day + 2 * self.hour
+        cached_aggregate_bars(["AAPL"], self.start, self.end, '1d', now=now)
+
+        # test
+        self.ingest([2 * self.day + self.hour])
+        live = cached_aggregate_bars(["AAPL"], self.start, self.end, '1d', now=now)
+        self.ingest([self.hour], price=200)
+        backfilled = cached_aggregate_bars(["AAPL"], self.start, self.end, '1d', now=now)
+
+        # validate
+        self.assertEqual([bar['volume'] for bar in live], [20, 10, 20])
+        self.assertEqual([bar['high'] for bar in live], [101.0, 101.0, 101.0])
+        self.assertEqual([bar['high'] for bar in backfilled], [201.0, 101.0, 101.0])
@@ -1,23 +1,87 @@
 import logging
 from datetime import datetime
+from django.http import HttpResponse, StreamingHttpResponse
 from django.db import IntegrityError
 from django.utils.dateparse import parse_datetime
 from rest_framework import viewsets, status
 from rest_framework.response import Response
 from rest_framework.decorators import action
 from rest_framework.exceptions import APIException
+from rest_framework.settings import api_settings
 from django.db import transaction
 
 from .models import BarData, QuoteData
 from symbols.models import Symbol
 from .serializers import BarDataSerializer, QuoteDataSerializer
+from .pagination import MarketDataPagination
+from .renderers import ColumnarRenderer, COLUMNAR_MEDIA_TYPE, columnar_columns, columnar_values, iter_columnar
+from .services import (ingest_market_data, upsert_market_data, stream_market_data, iter_stream_records,
+                       fast_values, iter_json_rows, iter_json_array, refresh_bar_rollups,
+                       parse_interval, cached_aggregate_bars,
+                       ON_CONFLICT_POLICIES, STREAM_FORMATS, INGEST_BATCH_SIZE, FAST_READ_CHUNK_SIZE)
 
 logger = logging.getLogger(__name__)
 
+def is_fast_read(request):
+    return request.query_params.get('fast', '').lower() in ('1', 'true', 'yes')
+
+def columnar_response(view, model):
+    """ Stream a list range in the packed columnar format, one record batch at a time. """
+    request = view.request
+    scaled = request.query_params.get('scaled', '').lower() in ('1', 'true', 'yes')
+    columns = columnar_columns(model, scaled=scaled)
+
+    tickers = request.query_params.get('tickers')
+    symbols = Symbol.objects.filter(ticker__in=tickers.split(',')) if tickers else Symbol.objects.all()
+    symbols = dict(symbols.values_list('id', 'ticker'))
+
+    rows = columnar_values(view.filter_queryset(view.get_queryset()), columns)
+    page = view.paginate_queryset(rows)
+    if page is not None:
+        body = b''.join(iter_columnar(model, page, columns, symbols, view.paginator.get_next_cursor()))
+        return HttpResponse(body, content_type=COLUMNAR_MEDIA_TYPE)
+    rows = rows.iterator(chunk_size=FAST_READ_CHUNK_SIZE)
+    return StreamingHttpResponse(iter_columnar(model, rows, columns, symbols), content_type=COLUMNAR_MEDIA_TYPE)
+
+def stream_ingest_response(request, model):
+    """ Write an NDJSON or CSV request body (optionally gzip-encoded) in batches as it is read. """
+    content_type = request.content_type.split(';')[0].strip().lower()
+    content_encoding = request.META.get('HTTP_CONTENT_ENCODING', '').lower() or None
+    on_conflict = request.query_params.get('on_conflict')
+    logger.info(f"Received streaming ingest of {model.__name__} ({content_type}, encoding={content_encoding}).")
+
+    if content_type not in STREAM_FORMATS:
+        return Response({'error': f"Content-Type must be one of {', '.join(STREAM_FORMATS)}"}, status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+    if content_encoding not in (None, 'identity', 'gzip'):
+        return Response({'error': 'Content-Encoding must be gzip or identity'}, status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+    if on_conflict is not None and on_conflict not in ON_CONFLICT_POLICIES:
+        return Response({'error': f"on_conflict must be one of {', '.join(ON_CONFLICT_POLICIES)}"}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        batch_size = int(request.query_params.get('batch_size', INGEST_BATCH_SIZE))
+    except ValueError:
+        return Response({'error': 'batch_size must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+    if not 1 <= batch_size <= 50000:
+        return Response({'error': 'batch_size must be between 1 and 50000'}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        records = iter_stream_records(request.stream, STREAM_FORMATS[content_type], content_encoding)
+        result = stream_market_data(model, records, on_conflict=on_conflict, batch_size=batch_size)
+    except Exception as e:
+        logger.error(f"Streaming ingest of {model.__name__} failed: {e}")
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    if result['error_count']:
+        response_status = status.HTTP_207_MULTI_STATUS
+    else:
+        response_status = status.HTTP_201_CREATED if on_conflict is None else status.HTTP_200_OK
+    return Response(result, status=response_status)
+
 
 class BarDataViewSet(viewsets.ModelViewSet):
     queryset = BarData.objects.all()
     serializer_class = BarDataSerializer
+    pagination_class = MarketDataPagination
+    renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES + [ColumnarRenderer]
 
     @action(methods=['post'], detail=False)
     def bulk_create(self, request, *args, **kwargs):
@@ -42,6 +106,7 @@ class BarDataViewSet(viewsets.ModelViewSet):
                 else:
                     logger.error(f"Validation failed for BarData at index {index}: {serializer.errors}")
                     errors.append({'index': index, 'errors': serializer.errors})
+            refresh_bar_rollups([(obj.symbol_id, obj.timestamp) for obj in created_objects])
                     
         response_status = status.HTTP_201_CREATED if not errors else status.HTTP_207_MULTI_STATUS
 
@@ -49,6 +114,75 @@ class BarDataViewSet(viewsets.ModelViewSet):
             'created': BarDataSerializer(created_objects, many=True).data,
             'errors': errors
         }, status=status.HTTP_201_CREATED)
+
+    @action(methods=['post'], detail=False)
+    def bulk_ingest(self, request, *args, **kwargs):
+        logger.info("Received request for bulk ingest of BarData.")
+        if not isinstance(request.data, list):
+            logger.error("Input data is not a list.")
+            return Response({'error': 'Input data should be a list'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            result = ingest_market_data(BarData, request.data)
+        except Exception as e:
+            logger.error(f"Bulk ingest of BarData failed: {e}")
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        response_status = status.HTTP_201_CREATED if not result['errors'] else status.HTTP_207_MULTI_STATUS
+        return Response(result, status=response_status)
+
+    @action(methods=['post'], detail=False)
+    def bulk_upsert(self, request, *args, **kwargs):
+        on_conflict = request.query_params.get('on_conflict', 'ignore').lower()
+        logger.info(f"Received request for bulk upsert of BarData with on_conflict={on_conflict}.")
+        if on_conflict not in ON_CONFLICT_POLICIES:
+            return Response({'error': f"on_conflict must be one of {', '.join(ON_CONFLICT_POLICIES)}"}, status=status.HTTP_400_BAD_REQUEST)
+        if not isinstance(request.data, list):
+            logger.error("Input data is not a list.")
+            return Response({'error': 'Input data should be a list'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            result = upsert_market_data(BarData, request.data, on_conflict=on_conflict)
+        except Exception as e:
+            logger.error(f"Bulk upsert of BarData failed: {e}")
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        response_status = status.HTTP_200_OK if not result['errors'] else status.HTTP_207_MULTI_STATUS
+        return Response(result, status=response_status)
+
+    @action(methods=['post'], detail=False)
+    def stream_ingest(self, request, *args, **kwargs):
+        return stream_ingest_response(request, BarData)
+
+    @action(detail=False, methods=['get'], url_path='aggregate-bars')
+    def aggregate_bars(self, request, *args, **kwargs):
+        tickers = request.query_params.get('tickers')
+        start_date = request.query_params.get('start_date')
+        end_date = request.query_params.get('end_date')
+        interval = request.query_params.get('interval', 'd').lower()
+        anchor = request.query_params.get('anchor')
+        logger.info(f"Received aggregate-bars request for {tickers} at interval {interval}.")
+
+        if not tickers:
+            return Response({'error': 'tickers parameter is required'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            start_date = int(start_date)
+            end_date = int(end_date)
+        except (TypeError, ValueError):
+            return Response({'error': 'start_date and end_date must be valid Unix timestamps in nanoseconds'}, status=status.HTTP_400_BAD_REQUEST)
+        if start_date > end_date:
+            return Response({'error': 'start_date must not be after end_date'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            parse_interval(interval, anchor)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            results = cached_aggregate_bars(tickers.split(','), start_date, end_date, interval, anchor)
+        except Exception as e:
+            logger.error(f"Error in aggregate_bars: {e}")
+            return Response({'error': 'An error occurred while aggregating bars'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        return Response(results)
     
     def get_queryset(self):
         queryset = super().get_queryset()
@@ -64,11 +198,46 @@ class BarDataViewSet(viewsets.ModelViewSet):
             queryset = queryset.filter(timestamp__range=[start_date, end_date])
 
         logger.info("Custom queryset for BarDataViewSet applied.")
-        return queryset
+        return queryset.select_related('symbol')
+
+    @transaction.atomic
+    def perform_create(self, serializer):
+        bar = serializer.save()
+        refresh_bar_rollups([(bar.symbol_id, bar.timestamp)])
+
+    @transaction.atomic
+    def perform_update(self, serializer):
+        previous = (serializer.instance.symbol_id, serializer.instance.timestamp)
+        bar = serializer.save()
+        refresh_bar_rollups([previous, (bar.symbol_id, bar.timestamp)])
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        key = (instance.symbol_id, instance.timestamp)
+        instance.delete()
+        refresh_bar_rollups([key])
+
+    def list(self, request, *args, **kwargs):
+        if request.accepted_renderer.format == ColumnarRenderer.format:
+            logger.info("Serving BarData list in the columnar format.")
+            return columnar_response(self, BarData)
+        if not is_fast_read(request):
+            return super().list(request, *args, **kwargs)
+
+        logger.info("Serving BarData list through the fast read path.")
+        queryset = fast_values(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            body = self.paginator.get_paginated_json(iter_json_rows(BarData, page))
+            return HttpResponse(body, content_type='application/json')
+        rows = queryset.iterator(chunk_size=FAST_READ_CHUNK_SIZE)
+        return StreamingHttpResponse(iter_json_array(BarData, rows), content_type='application/json')
     
 class QuoteDataViewSet(viewsets.ModelViewSet):
     queryset = QuoteData.objects.all()
     serializer_class = QuoteDataSerializer
+    pagination_class = MarketDataPagination
+    renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES + [ColumnarRenderer]
 
     @action(methods=['post'], detail=False)
     def bulk_create(self, request, *args, **kwargs):
@@ -100,6 +269,45 @@ class QuoteDataViewSet(viewsets.ModelViewSet):
             'created': QuoteDataSerializer(created_objects, many=True).data,
             'errors': errors
         }, status=status.HTTP_201_CREATED)
+
+    @action(methods=['post'], detail=False)
+    def bulk_ingest(self, request, *args, **kwargs):
+        logger.info("Received request for bulk ingest of QuoteData.")
+        if not isinstance(request.data, list):
+            logger.error("Input data is not a list.")
+            return Response({'error': 'Input data should be a list'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            result = ingest_market_data(QuoteData, request.data)
+        except Exception as e:
+            logger.error(f"Bulk ingest of QuoteData failed: {e}")
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        response_status = status.HTTP_201_CREATED if not result['errors'] else status.HTTP_207_MULTI_STATUS
+        return Response(result, status=response_status)
+
+    @action(methods=['post'], detail=False)
+    def bulk_upsert(self, request, *args, **kwargs):
+        on_conflict = request.query_params.get('on_conflict', 'ignore').lower()
+        logger.info(f"Received request for bulk upsert of QuoteData with on_conflict={on_conflict}.")
+        if on_conflict not in ON_CONFLICT_POLICIES:
+            return Response({'error': f"on_conflict must be one of {', '.join(ON_CONFLICT_POLICIES)}"}, status=status.HTTP_400_BAD_REQUEST)
+        if not isinstance(request.data, list):
+            logger.error("Input data is not a list.")
+            return Response({'error': 'Input data should be a list'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            result = upsert_market_data(QuoteData, request.data, on_conflict=on_conflict)
+        except Exception as e:
+            logger.error(f"Bulk upsert of QuoteData failed: {e}")
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        response_status = status.HTTP_200_OK if not result['errors'] else status.HTTP_207_MULTI_STATUS
+        return Response(result, status=response_status)
+
+    @action(methods=['post'], detail=False)
+    def stream_ingest(self, request, *args, **kwargs):
+        return stream_ingest_response(request, QuoteData)
     
     
     def get_queryset(self):
@@ -116,4 +324,20 @@ class QuoteDataViewSet(viewsets.ModelViewSet):
             queryset = queryset.filter(timestamp__range=[start_date, end_date])
 
         logger.info("Custom queryset for QuoteDataViewSet applied.")
-        return queryset
\ No newline at end of file
+        return queryset.select_related('symbol')
+
+    def list(self, request, *args, **kwargs):
+        if request.accepted_renderer.format == ColumnarRenderer.format:
+            logger.info("Serving QuoteData list in the columnar format.")
+            return columnar_response(self, QuoteData)
+        if not is_fast_read(request):
+            return super().list(request, *args, **kwargs)
+
+        logger.info("Serving QuoteData list through the fast read path.")
+        queryset = fast_values(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            body = self.paginator.get_paginated_json(iter_json_rows(QuoteData, page))
+            return HttpResponse(body, content_type='application/json')
+        rows = queryset.iterator(chunk_size=FAST_READ_CHUNK_SIZE)
+        return StreamingHttpResponse(iter_json_array(QuoteData, rows), content_type='application/json')
\ No newline at end of file
@@ -101,6 +101,34 @@ REST_FRAMEWORK = {
 
 AUTH_USER_MODEL = "account.CustomUser"  #Custom user
 
+# Asynchronous backtest uploads (backtest.jobs): seconds before a running job is taken to have lost its worker and
+# is claimed again, and how many claims a job gets
+BACKTEST_UPLOAD_JOB_TIMEOUT = 3600
+BACKTEST_UPLOAD_JOB_ATTEMPTS = 3
+
+# Price data shared by backtests and live sessions (market_data.services.cached_price_data): in-process LRU bounds,
+# and whether entries are also kept in the default cache for other workers
+PRICE_DATA_CACHE_ENTRIES = 256
+PRICE_DATA_CACHE_BYTES = 64 * 1024 * 1024
+PRICE_DATA_SHARED_CACHE = True
+
+# Versions of each live session document kept as snapshots (live_session.services)
+LIVE_SESSION_STATE_HISTORY = 100
+
+# Streaming of live session updates (live_session.events); set the broker to 'cache' when running several ASGI processes
+LIVE_SESSION_EVENT_BROKER = None
+LIVE_SESSION_EVENT_POLL = 0.25
+LIVE_SESSION_EVENT_TTL = 60
+LIVE_SESSION_STREAM_QUEUE = 256
+LIVE_SESSION_STREAM_KEEPALIVE = 15
+
+# Write-behind store for hot live session documents (live_session.store). Enabling it needs a Redis or Memcached
+# alias in CACHES named by LIVE_SESSION_STATE_CACHE, e.g. {'BACKEND': 'django.core.cache.backends.redis.RedisCache', ...};
+# startup fails on the database or local-memory caches.
+LIVE_SESSION_WRITE_BEHIND = False
+LIVE_SESSION_STATE_CACHE = 'live_session'
+LIVE_SESSION_FLUSH_INTERVAL = 5.0
+
 # Use HttpOnly flag on session and CSRF cookies
 SESSION_COOKIE_HTTPONLY = True
 CSRF_COOKIE_HTTPONLY = True
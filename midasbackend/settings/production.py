@@ -19,6 +19,14 @@ DATABASES = {
     'default': dj_database_url.config(default=config('DATABASE_URL'))
 }
 
+# Cache shared by all workers (aggregate bar cache and its write marks); created on release with createcachetable
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'midas_cache',
+    }
+}
+
 # Redirect all non-HTTPS requests to HTTPS (use in production)
 SECURE_SSL_REDIRECT = True
 